@@ -0,0 +1,236 @@
+"""
+Offline benchmarks of wb_corr, wb_topic_corrs, wb_corrs_search and wb_every.
+
+Every case runs in a fresh process against a local stub of the World Bank API (see stub.py) serving a synthetic or
+recorded corpus (see corpus.py), so that its peak RSS is its own. A case reports the wall time of the public function
+with an empty store, the per-stage timings collected by World_Bank_Correlations.instrument, its peak RSS and the
+traffic with the stub. The results are written as JSON, so that runs of different versions can be compared with the compare command.
+The importtime command measures the import of the package with python -X importtime and fails if it goes over IMPORT_BUDGET.
+With --low-memory, the cases read through a SQLite store on disk, wb_every scans with low_memory=True, and the run fails
+if the peak RSS of a case goes over MEMORY_CEILING_MB, which is the same at every scale.
+
+Usage:
+    python benchmarks/bench.py run [--scales small medium large] [--functions ...] [--change both] [--out results.json]
+    python benchmarks/bench.py run --low-memory [--ceiling 200]
+    python benchmarks/bench.py run --corpus path/to/recorded
+    python benchmarks/bench.py record path/to/recorded --indicators 1000
+    python benchmarks/bench.py compare old.json new.json
+    python benchmarks/bench.py importtime [--budget 0.1]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from corpus import SyntheticCorpus, RecordedCorpus, from_spec, record # noqa: E402
+
+# Number of indicators and of countries of each scale. Every scale has 50 years
+SCALES = {'small': (10, 50), 'medium': (1000, 150), 'large': (20000, 250)}
+FUNCTIONS = ['wb_corr', 'wb_topic_corrs', 'wb_corrs_search', 'wb_every']
+SEARCH = 'income' # Matches a tenth of the synthetic indicators
+TOPIC = 1
+MODULE = 'World_Bank_Correlations.World_Bank_Correlations'
+IMPORT_BUDGET = 0.1 # Seconds
+HEAVY = ['pandas', 'numpy', 'requests', 'world_bank_data', 'lxml'] # Only imported when they are first used
+MEMORY_CEILING_MB = 200 # The most a low-memory case may take, whatever the number of indicators
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != 'darwin' else peak / 1024 ** 2 # Kilobytes on Linux, bytes on macOS
+
+
+def run_case(spec):
+    """Runs one case in this process and returns its results"""
+    import world_bank_data as wb
+    from World_Bank_Correlations import World_Bank_Correlations as wbc
+    from World_Bank_Correlations import catalog as ct, store as st
+    from World_Bank_Correlations.fetch import Fetcher
+    corpus = from_spec(spec['corpus'])
+    data = corpus.user_data()
+    fetcher = Fetcher(spec['url'], rate=None)
+    wb.request.WORLD_BANK_URL = spec['url']
+    ct.set_catalog(ct.Catalog(os.path.join(tempfile.mkdtemp(prefix='wbc-bench-'), 'catalog.json'), fetcher=fetcher))
+    change, k, max_workers, low_memory = spec['change'], 5, spec.get('max_workers'), spec.get('low_memory', False)
+    t = time.perf_counter()
+    catalog = ct.get_catalog()
+    catalog.ids()
+    catalog_time = time.perf_counter() - t
+    function = spec['function']
+    if function == 'wb_corr':
+        ids = corpus.ids[:10]
+        call = lambda: wbc.wb_corr(data, 3, ids, change, stats=True)
+    elif function == 'wb_topic_corrs':
+        ids = [indicator for indicator, name in catalog.topic(TOPIC)]
+        call = lambda: wbc.wb_topic_corrs(data, 3, TOPIC, k=k, change=change, max_workers=max_workers, stats=True)
+    elif function == 'wb_corrs_search':
+        ids = [indicator for indicator, name in catalog.search(SEARCH)]
+        call = lambda: wbc.wb_corrs_search(data, 3, SEARCH, k=k, change=change, max_workers=max_workers, stats=True)
+    else:
+        ids = catalog.ids()
+        call = lambda: wbc.wb_every(data, 3, k=k, change=change, max_workers=max_workers, low_memory=low_memory, stats=True)
+    if low_memory: # On disk, as the default store, so that the indicators read are not held in memory
+        st.set_store(st.SQLiteSeriesStore(os.path.join(tempfile.mkdtemp(prefix='wbc-bench-'), 'series.sqlite'), fetch=fetcher))
+    else:
+        st.set_store(st.MemorySeriesStore(fetch=fetcher))
+    t = time.perf_counter()
+    stats = call().attrs['stats'].as_dict()
+    wall = time.perf_counter() - t
+    stages = {stage: times['seconds'] for stage, times in stats['stages'].items()}
+    stages['catalog'] = catalog_time
+    return {'function': function, 'change': change, 'low_memory': low_memory, 'indicators': len(ids), 'rows': len(data), 'wall': wall,
+            'stages': stages, 'latencies': stats['latencies'], 'peak_rss_mb': _peak_rss_mb()}
+
+
+def import_time(module=MODULE, repeat=5):
+    """
+    Returns the seconds taken to import module in a fresh interpreter, as reported by python -X importtime (the best of repeat runs),
+    and the modules of HEAVY that importing it loaded
+    """
+    code = 'import %s, sys; print(",".join(m for m in %r if m in sys.modules))' % (module, HEAVY)
+    best = None
+    for i in range(repeat):
+        done = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+        seconds = 0
+        for line in done.stderr.splitlines():
+            parts = line.split('|')
+            # The imports made by module are nested under it, so only the entries of the package at the top level are added up
+            if len(parts) == 3 and parts[2].startswith(' ' + module.split('.')[0]):
+                seconds += int(parts[1]) / 1e6
+        best = seconds if best is None else min(best, seconds)
+    heavy = [m for m in done.stdout.strip().split(',') if m]
+    return best, heavy
+
+
+def _meta():
+    meta = {'date': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+    try:
+        from importlib.metadata import version
+        meta['version'] = version('World_Bank_Correlations')
+    except Exception:
+        meta['version'] = None
+    try:
+        meta['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        meta['commit'] = None
+    import numpy, pandas
+    meta['numpy'], meta['pandas'] = numpy.__version__, pandas.__version__
+    return meta
+
+
+def run(scales, functions, changes, corpus_path=None, max_workers=None, out=None, quiet=False, low_memory=False):
+    """Runs every case in its own process and returns the results, writing them to out as JSON if it is given"""
+    from stub import Stub
+    if corpus_path is not None:
+        corpora = [('recorded', RecordedCorpus(corpus_path))]
+    else:
+        corpora = [(scale, SyntheticCorpus(*SCALES[scale])) for scale in scales]
+    cases = []
+    for scale, corpus in corpora:
+        stub = Stub(corpus)
+        try:
+            for function, change in itertools.product(functions, changes):
+                spec = {'corpus': corpus.spec, 'url': stub.url, 'function': function, 'change': change, 'max_workers': max_workers,
+                        'low_memory': low_memory}
+                stub.traffic()
+                done = subprocess.run([sys.executable, os.path.abspath(__file__), '_case', json.dumps(spec)], capture_output=True, text=True)
+                if done.returncode != 0:
+                    raise RuntimeError('The case ' + json.dumps(spec) + ' failed:\n' + done.stderr)
+                case = json.loads(done.stdout.strip().splitlines()[-1])
+                case.update({'scale': scale, 'countries': len(corpus.user_data()['Country'].unique()) if scale == 'recorded' else SCALES[scale][1]})
+                case.update(stub.traffic())
+                cases.append(case)
+                if not quiet:
+                    print('%-8s %-16s change=%-5s %6d indicators %9.2fs %8.1f MB' % (scale, function, change, case['indicators'], case['wall'], case['peak_rss_mb']))
+        finally:
+            stub.stop()
+    seconds, heavy = import_time()
+    results = {'meta': _meta(), 'import': {'seconds': seconds, 'heavy': heavy}, 'cases': cases}
+    if out is not None:
+        if os.path.dirname(out):
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=1)
+    return results
+
+
+def compare(old, new):
+    """Prints the ratio of the wall time and of the peak RSS of every case of new to the same case of old"""
+    with open(old) as f:
+        old = json.load(f)
+    with open(new) as f:
+        new = json.load(f)
+    if 'import' in old and 'import' in new:
+        print('import %.3fs -> %.3fs' % (old['import']['seconds'], new['import']['seconds']))
+    key = lambda case: (case['scale'], case['function'], case['change'], case.get('low_memory', False))
+    before = {key(case): case for case in old['cases']}
+    print('%-8s %-16s %-6s %10s %10s %7s %10s %10s %7s' % ('scale', 'function', 'change', 'old s', 'new s', 'ratio', 'old MB', 'new MB', 'ratio'))
+    for case in new['cases']:
+        if key(case) not in before:
+            continue
+        was = before[key(case)]
+        print('%-8s %-16s %-6s %10.2f %10.2f %7.2f %10.1f %10.1f %7.2f' % (case['scale'], case['function'], case['change'], was['wall'], case['wall'],
+              case['wall'] / was['wall'], was['peak_rss_mb'], case['peak_rss_mb'], case['peak_rss_mb'] / was['peak_rss_mb']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    runner = commands.add_parser('run', help='Run the benchmarks')
+    runner.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    runner.add_argument('--functions', nargs='+', choices=FUNCTIONS, default=FUNCTIONS)
+    runner.add_argument('--change', choices=['false', 'true', 'both'], default='both')
+    runner.add_argument('--corpus', help='A directory written by the record command, used instead of synthetic indicators')
+    runner.add_argument('--max-workers', type=int)
+    runner.add_argument('--low-memory', action='store_true', help='Read through a store on disk, scan with low_memory=True and fail above the ceiling')
+    runner.add_argument('--ceiling', type=float, default=MEMORY_CEILING_MB, help='The ceiling of the peak RSS of a case in MB, with --low-memory')
+    runner.add_argument('--out', default=os.path.join(HERE, 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'))
+    recorder = commands.add_parser('record', help='Download indicators from the World Bank API into a directory')
+    recorder.add_argument('path')
+    recorder.add_argument('--indicators', type=int, default=1000, help='The number of indicators, from the start of the API listing')
+    recorder.add_argument('--user', default='3.0.Gini', help='The indicator used as the variable of the user')
+    comparer = commands.add_parser('compare', help='Compare two results files')
+    comparer.add_argument('old')
+    comparer.add_argument('new')
+    importer = commands.add_parser('importtime', help='Measure the import of the package against a budget')
+    importer.add_argument('--budget', type=float, default=IMPORT_BUDGET, help='The budget in seconds')
+    case = commands.add_parser('_case')
+    case.add_argument('spec')
+    args = parser.parse_args(argv)
+    if args.command == '_case':
+        print(json.dumps(run_case(json.loads(args.spec))))
+    elif args.command == 'run':
+        changes = {'false': [False], 'true': [True], 'both': [False, True]}[args.change]
+        results = run(args.scales, args.functions, changes, args.corpus, args.max_workers, args.out, low_memory=args.low_memory)
+        print('Results written to', args.out)
+        over = [case for case in results['cases'] if case['peak_rss_mb'] > args.ceiling]
+        if args.low_memory and over:
+            for case in over:
+                print('over the ceiling of %.0f MB: %s %s change=%s %.1f MB' % (args.ceiling, case['scale'], case['function'], case['change'], case['peak_rss_mb']))
+            sys.exit(1)
+    elif args.command == 'importtime':
+        seconds, heavy = import_time()
+        print('import %s: %.3fs (budget %.3fs)' % (MODULE, seconds, args.budget))
+        if heavy:
+            print('imported eagerly:', ', '.join(heavy))
+        if seconds > args.budget or heavy:
+            sys.exit(1)
+    elif args.command == 'record':
+        record(args.path, args.indicators, args.user)
+    else:
+        compare(args.old, args.new)
+
+
+if __name__ == '__main__':
+    main()
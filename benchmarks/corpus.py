@@ -0,0 +1,166 @@
+"""
+Indicator corpora for the benchmarks.
+
+A corpus holds the indicator listing of the World Bank API and the data of every indicator, answered in the jsonstat
+format. SyntheticCorpus makes reproducible random indicators at any scale. RecordedCorpus reads indicators that were
+downloaded from the API once with record, so that benchmarks can be run offline on real data.
+"""
+import os
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+
+WORDS = ['income', 'population', 'energy', 'trade', 'health', 'education', 'debt', 'forest', 'water', 'labor']
+N_TOPICS = 21
+
+
+def jsonstat(countries, series_name, years, values):
+    """Encodes a Country x Year grid the way the API answers format=jsonstat"""
+    dimension = {'id': ['country', 'series', 'time']}
+    for dim, label, labels in [('country', 'Country', countries), ('series', 'Series', [series_name]), ('time', 'Year', years)]:
+        codes = [dim + str(i) for i in range(len(labels))]
+        dimension[dim] = {'label': label, 'category': {'index': {c: i for i, c in enumerate(codes)}, 'label': dict(zip(codes, labels))}}
+    flat = values.ravel()
+    return {'WDI': {'class': 'dataset', 'dimension': dimension, 'value': [None if np.isnan(v) else float(v) for v in flat]}}
+
+
+class SyntheticCorpus:
+    """
+    Reproducible random indicators
+
+    Parameters
+    ----------
+    indicators: The number of indicators
+    countries: The number of countries
+    years: The number of years, ending in 2023
+    seed: The seed of the random values
+    """
+
+    def __init__(self, indicators, countries, years=50, seed=0):
+        self.spec = {'kind': 'synthetic', 'indicators': indicators, 'countries': countries, 'years': years, 'seed': seed}
+        self.seed = seed
+        self.ids = ['SYN.%05d' % i for i in range(indicators)]
+        self.countries = ['Country %03d' % i for i in range(countries)]
+        self.years = [str(2023 - i) for i in range(years)] # The API lists the most recent year first
+        self._pos = {indicator: i for i, indicator in enumerate(self.ids)}
+        # Every indicator is a mix of a few shared factors, so that some pairs are strongly correlated
+        rng = np.random.default_rng(seed)
+        self._factors = rng.normal(size=(4, countries, years)).cumsum(axis=2)
+
+    def name(self, indicator):
+        i = self._pos[indicator]
+        return 'Synthetic %s indicator %d' % (WORDS[i % len(WORDS)], i)
+
+    def topics(self, indicator):
+        return [self._pos[indicator] % N_TOPICS + 1]
+
+    def records(self):
+        """Returns the indicator listing, as in the json format of http://api.worldbank.org/v2/indicator"""
+        return [{'id': i, 'name': self.name(i), 'unit': '', 'source': {'id': '2', 'value': 'World Development Indicators'},
+                 'sourceNote': 'Synthetic data for benchmarks', 'sourceOrganization': 'Benchmarks',
+                 'topics': [{'id': str(t), 'value': 'Topic %d' % t} for t in self.topics(i)]} for i in self.ids]
+
+    def grid(self, indicator):
+        """Returns the Country x Year values of an indicator"""
+        rng = np.random.default_rng([self.seed, self._pos.get(indicator, len(self.ids))])
+        weights = rng.normal(size=4)
+        values = np.tensordot(weights, self._factors, axes=1) * 10 + 100 + rng.normal(0, 5, size=self._factors.shape[1:])
+        values[rng.random(values.shape) < 0.15] = np.nan
+        return values
+
+    def payload(self, indicator, mrv=50):
+        """Returns the jsonstat answer of the API for an indicator, or None if it is not in the corpus"""
+        if indicator not in self._pos:
+            return None
+        return jsonstat(self.countries, self.name(indicator), self.years[:mrv], self.grid(indicator)[:, :mrv])
+
+    def user_data(self):
+        """Returns a variable of the user in the layout of wb.get_series(...).reset_index(), with its values in column 3"""
+        values = self.grid('USER.DATA')
+        index = pd.MultiIndex.from_product([self.countries, ['User variable'], self.years], names=['Country', 'Series', 'Year'])
+        return pd.Series(values.ravel(), index=index, name='USER.DATA').reset_index()
+
+
+class RecordedCorpus:
+    """
+    Indicators downloaded from the World Bank API with record
+
+    Parameters
+    ----------
+    path: The directory written by record
+    """
+
+    def __init__(self, path):
+        self.spec = {'kind': 'recorded', 'path': os.path.abspath(path)}
+        self.path = path
+        with open(os.path.join(path, 'indicators.json')) as f:
+            self._records = json.load(f)
+        self.ids = [r['id'] for r in self._records]
+        self._names = {r['id']: r['name'] for r in self._records}
+
+    def name(self, indicator):
+        return self._names[indicator]
+
+    def records(self):
+        return self._records
+
+    def _read(self, name):
+        with gzip.open(os.path.join(self.path, 'series', name.replace('/', '_') + '.json.gz'), 'rt') as f:
+            return json.load(f)
+
+    def payload(self, indicator, mrv=50):
+        """Returns the recorded answer of the API for an indicator, which holds 50 years whatever mrv is"""
+        if indicator not in self._names:
+            return None
+        return self._read(indicator)
+
+    def user_data(self):
+        from World_Bank_Correlations.fetch import series_from_jsonstat
+        return series_from_jsonstat(self._read('_user'), 'USER.DATA').reset_index()
+
+
+def record(path, indicators, user='3.0.Gini', fetcher=None):
+    """
+    Downloads indicators from the World Bank API into a directory that RecordedCorpus reads
+
+    Parameters
+    ----------
+    path: The directory to write
+    indicators: The indicator IDs to record, or an integer n to record the first n indicators of the API listing
+    user: The indicator recorded as the variable of the user
+    fetcher: The World_Bank_Correlations.fetch.Fetcher to download with
+    """
+    from World_Bank_Correlations.fetch import Fetcher
+    from World_Bank_Correlations.catalog import _listing
+    fetcher = fetcher or Fetcher()
+    listing = _listing(fetcher, 'indicator')
+    if type(indicators) == int:
+        indicators = [r['id'] for r in listing[:indicators]]
+    wanted = set(indicators)
+    os.makedirs(os.path.join(path, 'series'), exist_ok=True)
+    kept = []
+    for indicator in [user] + list(indicators):
+        try:
+            payload = fetcher.get_json('country/all/indicator/' + indicator, format='jsonstat', mrv=50)
+        except Exception as err:
+            print('skipped', indicator, err)
+            continue
+        if isinstance(payload, list): # An error message
+            continue
+        name = '_user' if indicator == user and indicator not in kept else indicator
+        with gzip.open(os.path.join(path, 'series', name.replace('/', '_') + '.json.gz'), 'wt') as f:
+            json.dump(payload, f)
+        kept.append(indicator)
+    records = [r for r in listing if r['id'] in wanted and r['id'] in kept]
+    with open(os.path.join(path, 'indicators.json'), 'w') as f:
+        json.dump(records, f)
+    return path
+
+
+def from_spec(spec):
+    """Returns the corpus described by the spec attribute of a corpus"""
+    if spec['kind'] == 'recorded':
+        return RecordedCorpus(spec['path'])
+    return SyntheticCorpus(spec['indicators'], spec['countries'], spec['years'], spec['seed'])
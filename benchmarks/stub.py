@@ -0,0 +1,87 @@
+"""
+A local server that answers like api.worldbank.org/v2 from a corpus, so that the benchmarks never touch the network.
+
+It serves the indicator listing (/indicator), the listing of each topic (/topic/N/indicator), the listing of sources
+(/sources) and the data of each indicator (/country/all/indicator/ID), which are the requests made by
+World_Bank_Correlations and world_bank_data.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+def _page(records, params):
+    per_page, page = int(params.get('per_page', 50)), int(params.get('page', 1))
+    meta = {'page': page, 'pages': max(1, -(-len(records) // per_page)), 'per_page': per_page, 'total': len(records)}
+    return [meta, records[(page - 1) * per_page:page * per_page]]
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        parts = url.path.strip('/').split('/')
+        server = self.server
+        if parts in (['v2', 'indicator'], ['v2', 'indicator', 'all']): # The second is requested by world_bank_data
+            return self.answer(200, _page(server.records, params))
+        if len(parts) == 4 and parts[:2] == ['v2', 'topic'] and parts[3] == 'indicator':
+            topic = parts[2]
+            return self.answer(200, _page([r for r in server.records if any(t.get('id') == topic for t in r.get('topics') or [])], params))
+        if parts == ['v2', 'sources']:
+            sources = {r['source']['id']: r['source']['value'] for r in server.records if r.get('source')}
+            return self.answer(200, _page([{'id': i, 'name': name, 'lastupdated': '2020-07-01'} for i, name in sources.items()], params))
+        if len(parts) == 5 and parts[:2] == ['v2', 'country'] and parts[3] == 'indicator':
+            payload = server.corpus.payload(parts[4], int(params.get('mrv', 50)))
+            if payload is None:
+                return self.answer(200, [{'message': [{'id': '120', 'key': 'Invalid value', 'value': 'The provided parameter value is not valid'}]}])
+            return self.answer(200, payload)
+        self.answer(404, {'message': 'Not found'})
+
+    def answer(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.count += 1
+            self.server.bytes_sent += len(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Stub:
+    """
+    Serves a corpus on a free local port until stop is called
+
+    Parameters
+    ----------
+    corpus: A corpus from benchmarks/corpus.py
+    """
+
+    def __init__(self, corpus):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.corpus = corpus
+        self.server.records = corpus.records()
+        self.server.lock = threading.Lock()
+        self.server.count = 0
+        self.server.bytes_sent = 0
+        self.url = 'http://127.0.0.1:%d/v2' % self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def traffic(self):
+        """Returns the number of requests answered and the number of bytes sent, and resets them"""
+        with self.server.lock:
+            traffic = {'requests': self.server.count, 'bytes': self.server.bytes_sent}
+            self.server.count = self.server.bytes_sent = 0
+        return traffic
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,11 +1,13 @@
-import requests
-import pandas as pd
-import world_bank_data as wb
-import lxml
+# pandas and the modules that compute with numpy are imported inside the functions that use them, so that importing
+# this module, checking indicators against the catalogue and reading stored series do not load them
+from .store import get_store
+from .catalog import TOPICS, get_catalog, topic_id
+from .fetch import iter_entries
+from .instrument import instrumented, timer
 
 
-def wb_corr(data, col, indicator, change=False):
-    pd.options.mode.chained_assignment = None # Change option within function to avoid warning of value being placed on a copy of a slice. 
+@instrumented
+def wb_corr(data, col, indicator, change=False, store=None, cols=None, countries=None, years=None, lags=None, method='pearson', stats=False):
     """
     Returns the relationship that an input variable has with a chosen variable or chosen variables from the World Bank data, sorted by the strength of relationship
     Relationship can be either the correlation between the input variable and the chosen indicator(s) or the correlation in the annual percent changes
@@ -18,6 +20,27 @@ def wb_corr(data, col, indicator, change=False):
         of character strings. Indicator IDs can be found through use of the World Bank APIs
     change: A Boolean value. When set to True, the correlation between the annual percent change of the input variable and the annual percent change of 
         chosen indicator(s) will be found and used to order the strength of relationships
+    store: The series store to read World Bank data through. Defaults to the store from World_Bank_Correlations.store.get_store(), which keeps
+        downloaded indicators on disk so that repeated calls do not download them again
+    cols: A list of the integer indices of several columns of data, each holding a variable, or 'numeric' for every numeric column other than Country and Year.
+        When given, col is ignored and every indicator is downloaded and aligned once and correlated with all of the variables together. The output then has
+        a MultiIndex of Variable (the column name) and Indicator, with the results of each variable following each other
+    countries: A list of the countries to download World Bank data for, or 'all'. Defaults to the countries in the Country column of data, so that
+        only they are requested from the World Bank API and read from the store
+    years: A list of the years to download World Bank data for, or 'all'. Defaults to the years in the Year column of data, so that only the years
+        from the one before the first (for its annual percent change) to the last are requested and read. Requests for the years beyond the 50
+        most recent go to the API once, and are stored apart from those of the most recent years
+    lags: An integer, or a list of integers. When given, the input variable in each year is also correlated with every indicator that many years earlier
+        (later, for negative lags), all of the lags of a chunk of indicators in one pass, and the lag with the largest absolute t score is reported in a
+        column Lag (and Lag_change) with its correlation and n. Only lags with more than two observations are candidates, unless none has that many.
+        An integer L stands for every lag from -L to L
+    method: 'pearson' (the default), 'spearman', 'kendall' or 'winsorized'. The correlation that is computed:
+        Pearson's, Spearman's rank correlation, Kendall's tau-b, or Pearson's once the values of each variable beyond its 5th and 95th percentiles are
+        clipped to them. The rank and winsorized correlations suit skewed series. Every method is computed for a chunk of indicators at once, and the t
+        score is r*sqrt((n-2)/(1-r^2)) whatever the method
+    stats: A Boolean value. When set to True, the time spent in each stage of the call, the requests made to the World Bank API, the bytes downloaded,
+        the hits and misses of the store and the latencies of the downloads are collected into a World_Bank_Correlations.instrument.Stats, which is
+        put in the attrs of the output as output.attrs['stats']
     
     Returns
     ----------
@@ -44,82 +67,109 @@ def wb_corr(data, col, indicator, change=False):
     
     """
     assert type(indicator)==str or type(indicator)==list, "indicator must be either a string or a list of strings"
-    assert type(col)==int, "col must be the integer index of the column containing data on the variable of interest"
+    assert type(col)==int or cols is not None, "col must be the integer index of the column containing data on the variable of interest"
     assert 'Country' in data.columns, "data must have a column containing countries called 'Country'"
     assert 'Year' in data.columns, "Data must have a column containing years called 'Year'"
-    assert col<data.shape[1], "col must be a column index belonging to data"
+    assert cols is not None or col<data.shape[1], "col must be a column index belonging to data"
     assert type(change)==bool, "change must be a Boolean value (True or False)"
-    cors=[]
-    indicators=[]
-    n=[]
+    from .kernel import METHODS, corr_table
+    assert method in METHODS, "method must be one of "+str(METHODS)
+    col=_columns(data,col,cols)
+    lags=_lags(lags)
+    store=get_store(store)
+    catalog=get_catalog() # Downloaded once and kept on disk, so checking an indicator is a dictionary lookup
+    scope=_scope(data,countries,years,lags)
     if type(indicator)==str:
-        assert indicator in list(pd.read_xml(requests.get('http://api.worldbank.org/v2/indicator?per_page=21000').content)['id']), "indicator must be the id of an indicator in the World Bank Data. Indicators can be found using the World Bank APIs. http://api.worldbank.org/v2/indicator?per_page=21000 to see all indicators or http://api.worldbank.org/v2/topic/_/indicator? to see indicators under a chosen topic (replace _ with integer 1-21)"
-        thing=pd.DataFrame(wb.get_series(indicator,mrv=50)) # Create a Pandas DataFrame with the data on the chosen indicator using the world_bank_data package
-        merged=pd.merge(data,thing,how='inner',on=['Country','Year'])
-        cors.append(merged.iloc[:,col].corr(merged.iloc[:,(merged.shape[1]-1)]))
-        indicators.append(pd.DataFrame(wb.get_series(indicator,mrv=1)).reset_index()['Series'][0])
-        n.append(len(merged[merged.iloc[:,col].notnull() & merged.iloc[:,(merged.shape[1]-1)].notnull()]))
-        if change==False:
-            return pd.DataFrame(list(zip(indicators,cors,n)),columns=['Indicator','Correlation','n']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
-        if change==True:
-            mumbo=pd.DataFrame() #Create an empty dataframe to include the annual percent change data for the input variable
-            cors_change=[]
-            n_change=[]
-            for country in data['Country'].unique():
-                s=data[data['Country']==country]
-                s.loc[:,'lag_dat']=s.iloc[:,col].shift(-1) # Generates warning message if option is not changed above
-                s.loc[:,'pct_chg_dat']=(((s.iloc[:,col]-s['lag_dat'])/s['lag_dat'])*100)
-                mumbo=pd.concat([mumbo,s]) 
-            t=thing.reset_index()
-            jumbo=pd.DataFrame() #Empty dataframe to contain the percent change data for World Bank data
-            for country in t['Country'].unique():
-                y=t[t['Country']==country]
-                y.loc[:,'lag_ind']=y.iloc[:,3].shift(-1) # Generates warning message if pandas option is not changed above
-                y.loc[:,'pct_chg_ind']=(((y.iloc[:,3]-y['lag_ind'])/y['lag_ind'])*100)
-                jumbo=pd.concat([jumbo,y]) 
-            merged_pct=pd.merge(mumbo,jumbo,how='left',on=['Country','Year']) #inner?
-            cors_change.append(merged_pct.loc[:,'pct_chg_dat'].corr(merged_pct.loc[:,'pct_chg_ind']))
-            n_change.append(len(merged_pct[merged_pct.loc[:,'pct_chg_dat'].notnull() & merged_pct.loc[:,'pct_chg_ind'].notnull()]))
-            return pd.DataFrame(list(zip(indicators,cors,n,cors_change,n_change)),columns=['Indicator','Correlation','n','Correlation_change','n_change']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
+        assert indicator in catalog, "indicator must be the id of an indicator in the World Bank Data. Indicators can be found using the World Bank APIs. http://api.worldbank.org/v2/indicator?per_page=21000 to see all indicators or http://api.worldbank.org/v2/topic/_/indicator? to see indicators under a chosen topic (replace _ with integer 1-21)"
+        with timer('fetch'):
+            entries=[store.entry(indicator,mrv=50,scope=scope)]
     if type(indicator)==list:
         for indic in indicator:
             assert type(indic)==str, "Elements of indicator must be strings"
-            assert indic in list(pd.read_xml(requests.get('http://api.worldbank.org/v2/indicator?per_page=21000').content)['id']), "indicator must be the id of an indicator in the World Bank Data. Indicators can be found using the World Bank APIs. http://api.worldbank.org/v2/indicator?per_page=21000 to see all indicators or http://api.worldbank.org/v2/topic/_/indicator? to see indicators under a chosen topic (replace _ with integer 1-21)"
-        for i in range(0,len(indicator)):
-            thing=pd.DataFrame(wb.get_series(indicator[i],mrv=50)).reset_index()  # Create a Pandas DataFrame with the data on the chosen indicator using the world_bank_data package
-            merged=pd.merge(data,thing,how='inner',on=['Country','Year'])
-            cors.append(merged.iloc[:,col].corr(merged.iloc[:,(merged.shape[1]-1)]))  
-            indicators.append(pd.DataFrame(wb.get_series(indicator[i],mrv=1)).reset_index()['Series'][0])
-            n.append(len(merged[merged.iloc[:,col].notnull() & merged.iloc[:,(merged.shape[1]-1)].notnull()]))
-        if change==False:
-            return pd.DataFrame(list(zip(indicators,cors,n)),columns=['Indicator','Correlation','n']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
-        if change==True:
-            cors_change=[]
-            n_change=[]
-            for i in range(0,len(indicator)):
-                mumbo=pd.DataFrame() # Create an empty dataframe to include the annual percent change data for the input variable
-                jumbo=pd.DataFrame() # Empty dataframe to contain the percent change data for World Bank data
-                thing=pd.DataFrame(wb.get_series(indicator[i],mrv=50)).reset_index()
-                for country in data['Country'].unique():
-                    s=data[data['Country']==country]
-                    s.loc[:,'lag_dat']=s.iloc[:,col].shift(-1) # Generates warning message if pandas option is not changed above
-                    s.loc[:,'pct_chg_dat']=(((s.iloc[:,col]-s['lag_dat'])/s['lag_dat'])*100)
-                    mumbo=pd.concat([mumbo,s])
-                for country in thing['Country'].unique():
-                    y=thing[thing['Country']==country]
-                    y.loc[:,'lag_ind']=y.iloc[:,3].shift(-1) # Generates warning message if pandas option is not changed above
-                    y.loc[:,'pct_chg_ind']=(((y.iloc[:,3]-y['lag_ind'])/y['lag_ind'])*100)
-                    jumbo=pd.concat([jumbo,y])
-                merged_pct=pd.merge(mumbo,jumbo,how='left',on=['Country','Year'])
-                cors_change.append(merged_pct.loc[:,'pct_chg_dat'].corr(merged_pct.loc[:,'pct_chg_ind']))
-                n_change.append(len(merged_pct[merged_pct.loc[:,'pct_chg_dat'].notnull() & merged_pct.loc[:,'pct_chg_ind'].notnull()]))
-        return pd.DataFrame(list(zip(indicators,cors,n,cors_change,n_change)),columns=['Indicator','Correlation','n','Correlation_change','n_change']).sort_values(by='Correlation_change',key=abs,ascending=False).set_index('Indicator')
-    pd.options.mode.chained_assignment = orig_value
-
-
-def wb_topic_corrs(data,col,topic,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
-    from math import sqrt
-    pd.options.mode.chained_assignment = None # Change option within function to avoid warning of value being placed on a copy of a slice. 
+            assert indic in catalog, "indicator must be the id of an indicator in the World Bank Data. Indicators can be found using the World Bank APIs. http://api.worldbank.org/v2/indicator?per_page=21000 to see all indicators or http://api.worldbank.org/v2/topic/_/indicator? to see indicators under a chosen topic (replace _ with integer 1-21)"
+        with timer('fetch'):
+            entries=[store.entry(indic,mrv=50,scope=scope) for indic in indicator]
+    table=corr_table(data,col,entries,change,lags=lags,method=method)
+    with timer('sort'):
+        return _sorted(table,change,sort_by='Correlation' if type(indicator)==str else 'Correlation_change')
+
+
+@instrumented
+def wb_rolling_corrs(data,col,indicator,window=10,change=False,store=None,max_workers=None,countries=None,years=None,stats=False):
+    """
+    Returns the correlation that an input variable has with a chosen variable or chosen variables from the World Bank data over every window of consecutive years,
+    to see how the relationship changes over time. The windows of every indicator are computed together, from sums by year of the aligned data
+
+    Parameters
+    ----------
+    data: A pandas dataframe that contains a column of countries called "Country," a column of years called "Year," and a column of data for a variable
+    col: The integer index of the column in which the data of your variable exists in your dataframe
+    indicator: The indicator or list of indicators to check the relationship with the input variable. Can be a character string of the indicator ID or a list
+        of character strings, such as the IDs of a topic from World_Bank_Correlations.catalog.get_catalog().topic
+    window: An integer indicating the number of years in a window. The windows run from the first year of data to the last, one year at a time
+    change: A Boolean value. When set to True, the correlation between the annual percent changes of the variables over every window is found as well
+    store: The series store to read World Bank data through. Defaults to the store from World_Bank_Correlations.store.get_store(), which keeps
+        downloaded indicators on disk so that repeated calls do not download them again
+    max_workers: The number of indicators to download at the same time. Defaults to World_Bank_Correlations.fetch.MAX_WORKERS
+    countries: A list of the countries to download World Bank data for, or 'all'. Defaults to the countries in the Country column of data, so that
+        only they are requested from the World Bank API and read from the store
+    years: A list of the years to download World Bank data for, or 'all'. Defaults to the years in the Year column of data, so that only the years
+        from the one before the first (for its annual percent change) to the last are requested and read
+    stats: A Boolean value. When set to True, the time spent in each stage of the call, the requests made to the World Bank API, the bytes downloaded,
+        the hits and misses of the store and the latencies of the downloads are collected into a World_Bank_Correlations.instrument.Stats, which is
+        put in the attrs of the output as output.attrs['stats']
+
+    Returns
+    ----------
+    Pandas DataFrame
+        A Pandas DataFrame with a MultiIndex of the indicator names and the last year of every window, in the order of indicator, and the columns Correlation
+            and n, followed by Correlation_change and n_change if change is set to True. Indicators that can no longer be downloaded are left out
+
+    Examples
+    ----------
+    >>> wb_rolling_corrs(my_df, 2, '3.0.Gini', window=10) #where my_df has columns Country, Year, Data
+        |Indicator       | Year | Correlation  | n
+        ---------------------------------------------
+        |Gini Coefficient| 2000 | -0.912034    | 41
+        |Gini Coefficient| 2001 | -0.920176    | 43
+    """
+    assert type(indicator)==str or type(indicator)==list, "indicator must be either a string or a list of strings"
+    assert type(col)==int and col<data.shape[1], "col must be the integer index of the column containing data on the variable of interest"
+    assert 'Country' in data.columns, "data must have a column containing countries called 'Country'"
+    assert 'Year' in data.columns, "data must have a column containing years called 'Year'"
+    assert data['Year'].astype(str).str.isdigit().any(), "the Year column of data must hold years"
+    assert type(change)==bool, "change must be a Boolean value (True or False)"
+    assert type(window)==int and window>=2, "window must be an integer of at least 2"
+    import pandas as pd
+    from .kernel import Prepared
+    indicators=[indicator] if type(indicator)==str else indicator
+    catalog=get_catalog()
+    for indic in indicators:
+        assert type(indic)==str and indic in catalog, "indicator must be the id of an indicator in the World Bank Data. Indicators can be found using the World Bank APIs. http://api.worldbank.org/v2/indicator?per_page=21000 to see all indicators"
+    store=get_store(store)
+    entries=list(iter_entries(store,indicators,mrv=50,max_workers=max_workers,scope=_scope(data,countries,years)))
+    rolling=Prepared(data,col,change).rolling(entries,window)
+    columns=['Correlation','n']+(['Correlation_change','n_change'] if change else [])
+    with timer('sort'):
+        ends=pd.Index(rolling['Year'].astype(str),name='Year')
+        tables={entry.name:pd.DataFrame({column:rolling[column][:,j] for column in columns},index=ends) for j,entry in enumerate(entries)}
+        if not tables:
+            empty=pd.DataFrame({column:pd.Series(dtype='int64' if column.startswith('n') else 'float64') for column in columns})
+            empty.index=pd.MultiIndex.from_arrays([[],[]],names=['Indicator','Year'])
+            return empty
+        return pd.concat(tables,names=['Indicator'])
+
+
+def _sorted(table,change,sort_by):
+    """Orders a table of statistics from World_Bank_Correlations.kernel.corr_table by the strength of relationship, as wb_corr returns it"""
+    lag=['Lag'] if 'Lag' in table.columns else []
+    if change==False:
+        return _per_variable(table,lambda table: table[['Indicator','Correlation','n']+lag].sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator'))
+    return _per_variable(table,lambda table: table[['Indicator','Correlation','n']+lag+['Correlation_change','n_change']+[c+'_change' for c in lag]].sort_values(by=sort_by,key=abs,ascending=False).set_index('Indicator'))
+
+
+@instrumented
+def wb_topic_corrs(data,col,topic,k=5,change=False,nlim=1,cor_lim=0,t_lim=0,store=None,max_workers=None,resume=None,cols=None,countries=None,years=None,lags=None,method='pearson',stats=False):
     """
     Returns the relationship that an input variable has with the indicators in a chosen topic from the World Bank data, sorted by the strength of relationship.
     Relationship can be either the correlation between the input variable and the chosen indicator(s) or the correlation in the annual percent changes
@@ -128,13 +178,41 @@ def wb_topic_corrs(data,col,topic,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
     ----------
     data: A pandas dataframe that contains a column of countries called "Country," a column of years called "Year," and a column of data for a variable
     col: The integer index of the column in which the data of your variable exists in your dataframe
-    topic: A character string of the topic name or the integer corresponding to the topic. Topics can be found through the World Bank APIs
+    topic: A character string of the topic name or the integer corresponding to the topic. Topics can be found through the World Bank APIs.
+        Can also be a list of topics, or 'all' for the 21 topics. Every indicator that belongs to several of them is then downloaded and correlated
+        once, and the output has a MultiIndex of Topic and Indicator: the k strongest relationships among all of the topics under 'All topics',
+        followed by the k strongest of each topic under its name
     k: An integer indicating the number of variables to return. The k variables with the strongest relationships to the input variable will be returned.
     change: A Boolean value. When set to True, the correlation between the annual percent change of the input variable and the annual percent change of 
         chosen indicator(s) will be found and used to order the strength of relationships
     nlim: An integer indicating the minimum n of indicators to be reported.
     cor_lim: A real number indicating the minimum absolute value of the correlation between the input variable and World Bank indicators to be reported
     t_lim: A real number indicating the minimum t score of the correlation between the input variable and World Bank indicators to be reported.
+    store: The series store to read World Bank data through. Defaults to the store from World_Bank_Correlations.store.get_store(), which keeps
+        downloaded indicators on disk so that repeated calls do not download them again
+    max_workers: The number of indicators to download at the same time. Defaults to World_Bank_Correlations.fetch.MAX_WORKERS
+    resume: The path of a checkpoint file. The statistics of every finished indicator are written to it every 30 seconds, and when the scan ends or fails.
+        If the file exists, the indicators recorded in it are not scanned again, so an interrupted scan can be resumed by calling again with the same path.
+        The file must come from a scan with the same data, topic and setting of change
+    cols: A list of the integer indices of several columns of data, each holding a variable, or 'numeric' for every numeric column other than Country and Year.
+        When given, col is ignored and every indicator is downloaded and aligned once and correlated with all of the variables together. The output then has
+        a MultiIndex of Variable (the column name) and Indicator, with the results of each variable following each other
+    countries: A list of the countries to download World Bank data for, or 'all'. Defaults to the countries in the Country column of data, so that
+        only they are requested from the World Bank API and read from the store
+    years: A list of the years to download World Bank data for, or 'all'. Defaults to the years in the Year column of data, so that only the years
+        from the one before the first (for its annual percent change) to the last are requested and read. Requests for the years beyond the 50
+        most recent go to the API once, and are stored apart from those of the most recent years
+    lags: An integer, or a list of integers. When given, the input variable in each year is also correlated with every indicator that many years earlier
+        (later, for negative lags), all of the lags of a chunk of indicators in one pass, and the lag with the largest absolute t score is reported in a
+        column Lag (and Lag_change) with its correlation and n. Only lags with more than nlim (and two) observations are candidates, unless none has
+        that many. An integer L stands for every lag from -L to L
+    method: 'pearson' (the default), 'spearman', 'kendall' or 'winsorized'. The correlation that is computed, ordered on and filtered with cor_lim and t_lim:
+        Pearson's, Spearman's rank correlation, Kendall's tau-b, or Pearson's once the values of each variable beyond its 5th and 95th percentiles are
+        clipped to them. The rank and winsorized correlations suit skewed series. Every method is computed for a chunk of indicators at once, and the t
+        score is r*sqrt((n-2)/(1-r^2)) whatever the method
+    stats: A Boolean value. When set to True, the time spent in each stage of the call, the requests made to the World Bank API, the bytes downloaded,
+        the hits and misses of the store and the latencies of the downloads are collected into a World_Bank_Correlations.instrument.Stats, which is
+        put in the attrs of the output as output.attrs['stats']
     
     Returns
     ----------
@@ -164,137 +242,51 @@ def wb_topic_corrs(data,col,topic,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
         |Electricity production from coal sources (% of total)   |0.066986       |172    | 0.200032           | 62
 
     """
-    assert type(topic)==int or type(topic)==str, "indicator must be either a string or an integer corresponding to the topic. A list of topics can be found through the World Bank API: http://api.worldbank.org/v2/topic?"
-    assert type(col)==int, "col must be the integer index of the column containing data on the variable of interest"
+    assert type(topic)==int or type(topic)==str or type(topic)==list, "indicator must be either a string or an integer corresponding to the topic, a list of those or 'all'. A list of topics can be found through the World Bank API: http://api.worldbank.org/v2/topic?"
+    assert type(col)==int or cols is not None, "col must be the integer index of the column containing data on the variable of interest"
     assert 'Country' in data.columns, "data must have a column containing countries called 'Country'"
     assert 'Year' in data.columns, "data must have a column containing years called 'Year'"
-    assert col<data.shape[1], "col must be a column index belonging to data"
+    assert cols is not None or col<data.shape[1], "col must be a column index belonging to data"
     assert type(change)==bool, "change must be a Boolean value (True or False)"
     assert type(k)==int, "k must be an integer"
     assert type(nlim)==int, "n must be an integer"
     assert (type(cor_lim)==float or type(cor_lim)==int), "cor_lim must be a real number"
     assert (type(t_lim)==float or type(t_lim)==int), "n_lim must be a real number"
-    
-    if topic=='Agriculture & Rural Development' or topic==1:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/1/indicator?per_page=50').content)
-    if topic=='Aid Effectiveness'or topic==2:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/2/indicator?per_page=80').content)
-    if topic=='Economy & Growth'or topic==3:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/3/indicator?per_page=310').content)
-    if topic=='Education'or topic==4:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/4/indicator?per_page=1015').content)
-    if topic=='Energy & Mining'or topic==5:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/5/indicator?per_page=55').content)
-    if topic=='Environment'or topic==6:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/6/indicator?per_page=145').content)
-    if topic=='Financial Sector'or topic==7:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/7/indicator?per_page=210').content)
-    if topic=='Health'or topic==8:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/8/indicator?per_page=651').content)
-    if topic=='Infrastructure'or topic==9:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/9/indicator?per_page=80').content)
-    if topic=='Social Protection & Labor'or topic==10:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/10/indicator?per_page=2150').content)
-    if topic=='Poverty'or topic==11:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/11/indicator?per_page=150').content)
-    if topic=='Private Sector'or topic==12:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/12/indicator?per_page=200').content)
-    if topic=='Public Sector'or topic==13:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/13/indicator?per_page=120').content)
-    if topic=='Science & Technology'or topic==14:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/14/indicator?per_page=15').content)
-    if topic=='Social Development'or topic==15:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/15/indicator?per_page=35').content)
-    if topic=='Urban Development'or topic==16:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/16/indicator?per_page=35').content)
-    if topic=='Gender'or topic==17:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/17/indicator?per_page=315').content)
-    if topic=='Millenium Development Goals'or topic==18:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/18/indicator?per_page=30').content)
-    if topic=='Climate Change'or topic==19:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/19/indicator?per_page=85').content)
-    if topic=='External Debt'or topic==20:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/20/indicator?per_page=520').content)
-    if topic=='Trade'or topic==21:
-        top_df=pd.read_xml(requests.get('http://api.worldbank.org/v2/topic/21/indicator?per_page=160').content)
-    cors=[]
-    indicators=[]
-    n=[]
-    t=[]
-    if change==False:
-        for i in range(0,(len(top_df['id']))):
-            try:
-                indicator=top_df.loc[i,'id']
-                thing=pd.DataFrame(wb.get_series(indicator,mrv=50))
-            except:
-                pass
-            merged=pd.merge(data,thing,how='inner',on=['Country','Year'])
-            cor_i=(merged.iloc[:,col].corr(merged.iloc[:,(merged.shape[1]-1)]))
-            cors.append(cor_i)
-            indicators.append(top_df['{http://www.worldbank.org}name'][i])
-            n_i=(len(merged[merged.iloc[:,col].notnull() & merged.iloc[:,(merged.shape[1]-1)].notnull()]))
-            n.append(n_i)
-            if cor_i==1 or cor_i==-1: # Avoid division by 0
-                t.append(None)
-            else:
-                t.append((cor_i*(sqrt((n_i-2)/(1-(cor_i*cor_i))))))
-        if t_lim==0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n)),columns=['Indicator','Correlation','n']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n>nlim) & ((almost_there.Correlation>cor_lim) | (almost_there.Correlation<-cor_lim))].head(k)
-        if t_lim != 0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n,t)),columns=['Indicator','Correlation','n','t']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n>nlim) & ((almost_there.Correlation>cor_lim) | (almost_there.Correlation<-cor_lim)) & ((almost_there.t>t_lim) | (almost_there.t<-t_lim))].head(k)
-    if change==True:
-        cors_change=[]
-        n_change=[]
-        t_change=[]
-        mumbo=pd.DataFrame() # Create a Pandas DataFrame with the data on the chosen indicator using the world_bank_data package
-        for country in data['Country'].unique():
-            s=data[data['Country']==country]
-            s.loc[:,'lag_dat']=s.iloc[:,col].shift(-1) # Generates warning message if pandas option is not changed above
-            s.loc[:,'pct_chg_dat']=(((s.iloc[:,col]-s['lag_dat'])/s['lag_dat'])*100)
-            mumbo=pd.concat([mumbo,s])
-        for i in range(0,(len(top_df['id']))):
-            try:
-                indicator=top_df.loc[i,'id']
-                thing=pd.DataFrame(wb.get_series(indicator,mrv=50))
-            except:
-                pass # Some variables listed in the World Bank API have since been removed and will therefore be skipped
-            merged=pd.merge(data,thing,how='inner',on=['Country','Year'])
-            cor_i=(merged.iloc[:,col].corr(merged.iloc[:,(merged.shape[1]-1)]))
-            cors.append(cor_i)
-            n_i=len(merged[merged.iloc[:,col].notnull() & merged.iloc[:,(merged.shape[1]-1)].notnull()])
-            n.append(n_i)
-            t.append((cor_i*(sqrt((n_i-2)/(1-(cor_i*cor_i))))))
-            indicators.append(top_df.loc[i,'{http://www.worldbank.org}name'])
-            jumbo=pd.DataFrame() #Empty dataframe to contain the percent change data for World Bank data
-            thing_df=thing.reset_index()
-            for country in thing_df['Country'].unique():
-                y=thing_df[thing_df['Country']==country]
-                y.loc[:,'lag_ind']=y.iloc[:,3].shift(-1) # Generates warning message if pandas option is not changed above
-                y.loc[:,'pct_chg_ind']=(((y.iloc[:,3]-y['lag_ind'])/y['lag_ind'])*100)
-                jumbo=pd.concat([jumbo,y])
-            merged_pct=pd.merge(mumbo,jumbo,how='left',on=['Country','Year'])
-            cor_chg_i=merged_pct.loc[:,'pct_chg_dat'].corr(merged_pct.loc[:,'pct_chg_ind'])
-            cors_change.append(cor_chg_i)
-            n_chg_i=len(merged_pct[merged_pct.loc[:,'pct_chg_dat'].notnull() & merged_pct.loc[:,'pct_chg_ind'].notnull()])
-            n_change.append(n_chg_i)
-            if (cor_chg_i==1 or cor_chg_i==-1):
-                t_change.append(None)
-            else:
-                t_change.append(cor_chg_i*sqrt(((n_chg_i-2)/(1-(cor_chg_i*cor_chg_i)))))
-        if t_lim==0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n,cors_change,n_change)),columns=['Indicator','Correlation','n','Correlation_change','n_change']).sort_values(by='Correlation_change',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n_change>nlim) & ((almost_there.Correlation_change>cor_lim) | (almost_there.Correlation_change<-cor_lim))].head(k)
-        if t_lim!=0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n,t,cors_change,n_change,t_change)),columns=['Indicator','Correlation','n','t','Correlation_change','n_change','t_change']).sort_values(by='Correlation_change',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n_change>nlim) & ((almost_there.Correlation_change>cor_lim) | (almost_there.Correlation_change<-cor_lim)) & ((almost_there.t_change>t_lim) | (almost_there.t_change<(-t_lim)))].head(k)
-    pd.options.mode.chained_assignment = orig_value
-
-
-def wb_corrs_search(data,col,search,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
-    from math import sqrt
-    pd.options.mode.chained_assignment = None # Change option within function to avoid warning of value being placed on a copy of a slice. 
+    import pandas as pd
+    from .kernel import METHODS, corr_table
+    from .checkpoint import Checkpoint, fingerprint
+    assert method in METHODS, "method must be one of "+str(METHODS)
+    col=_columns(data,col,cols)
+    lags=_lags(lags)
+    store=get_store(store)
+    several=type(topic)==list or topic=='all'
+    topics=list(TOPICS) if topic=='all' else topic if several else [topic]
+    for t in topics:
+        assert topic_id(t) is not None, "topic must be the name or the integer of one of the 21 topics listed by the World Bank API: http://api.worldbank.org/v2/topic?"
+    listings=get_catalog().topics(topics,max_workers)
+    top_df=pd.DataFrame([pair for listing in listings.values() for pair in listing],columns=['id','name']).drop_duplicates('id') # Indicators in several topics are scanned once
+    names=dict(zip(top_df['id'],top_df['name']))
+    scope=_scope(data,countries,years,lags)
+    if resume is None: # Some variables listed in the World Bank API have since been removed and will therefore be skipped
+        table=_cached_table('wb_topic_corrs',data,col,change,scope,store,list(top_df['id']),
+                            lambda: corr_table(data,col,iter_entries(store,top_df['id'],mrv=50,max_workers=max_workers,scope=scope),change,lags=lags,method=method,nlim=nlim),lags,method,nlim)
+    else:
+        checkpoint=Checkpoint(resume,_scope_key({'function':'wb_topic_corrs','topic':sorted(listings) if several else topic_id(topic),'change':change,'data':fingerprint(data,col)},countries,years,lags,method,nlim),
+                              variables=len(col) if type(col)==list else 1)
+        table=_resumed_table(data,col,store,list(top_df['id']),change,max_workers,checkpoint,scope,lags,method,nlim)
+    table['Indicator']=table['id'].map(names)
+    if not several:
+        return _top(table,k,change,nlim,cor_lim,t_lim)
+    tops={'All topics':_top(table,k,change,nlim,cor_lim,t_lim)}
+    for number,listing in listings.items():
+        order={indicator:i for i,(indicator,name) in enumerate(listing)}
+        topic_table=table[table['id'].isin(order)].sort_values('id',key=lambda ids: ids.map(order),kind='stable') # Ties keep the order of the listing of the topic
+        tops[TOPICS[number]]=_top(topic_table,k,change,nlim,cor_lim,t_lim)
+    return pd.concat(tops,names=['Topic'])
+
+
+@instrumented
+def wb_corrs_search(data,col,search,k=5,change=False,nlim=1,cor_lim=0,t_lim=0,store=None,max_workers=None,cols=None,countries=None,years=None,lags=None,method='pearson',stats=False):
     """
     Returns the relationship that an input variable has with the variables from the World Bank data that match a search, sorted by the strength of relationship
     Relationship can be either the correlation between the input variable and the chosen indicator(s) or the correlation in the annual percent changes
@@ -304,12 +296,38 @@ def wb_corrs_search(data,col,search,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
     data: A pandas dataframe that contains a column of countries called "Country," a column of years called "Year," and a column of data for a variable
     col: The integer index of the column in which the data of your variable exists in your dataframe
     search: The search to conduct. Variables that match the given search will be identified and their relationships with the input variable found.
+        As with wb.search_indicators, the search is a regular expression, or a phrase, matched ignoring case against the names, units, sources,
+        source notes, source organizations and topics of the indicators of the catalogue, which are kept locally with an index of their words. A
+        search starting with + is a list of words that must all appear, with * at the end of a word for any word starting with it and double quotes
+        around words that must appear together: +poverty "headcount ratio" nation*
     k: An integer indicating the number of variables to return. The k variables with the strongest relationship with the input variable will be returned.
     change: A Boolean value. When set to True, the correlation between the annual percent change of the input variable and the annual percent change of 
         chosen indicator(s) will be found and used to order the strength of relationships
     nlim: An integer indicating the minimum n of indicators to be reported.
     cor_lim: A real number indicating the minimum absolute value of the correlation between the input variable and World Bank indicators to be reported
     t_lim: A real number indicating the minimum t score of the correlation between the input variable and World Bank indicators to be reported.
+    store: The series store to read World Bank data through. Defaults to the store from World_Bank_Correlations.store.get_store(), which keeps
+        downloaded indicators on disk so that repeated calls do not download them again
+    max_workers: The number of indicators to download at the same time. Defaults to World_Bank_Correlations.fetch.MAX_WORKERS
+    cols: A list of the integer indices of several columns of data, each holding a variable, or 'numeric' for every numeric column other than Country and Year.
+        When given, col is ignored and every indicator is downloaded and aligned once and correlated with all of the variables together. The output then has
+        a MultiIndex of Variable (the column name) and Indicator, with the results of each variable following each other
+    countries: A list of the countries to download World Bank data for, or 'all'. Defaults to the countries in the Country column of data, so that
+        only they are requested from the World Bank API and read from the store
+    years: A list of the years to download World Bank data for, or 'all'. Defaults to the years in the Year column of data, so that only the years
+        from the one before the first (for its annual percent change) to the last are requested and read. Requests for the years beyond the 50
+        most recent go to the API once, and are stored apart from those of the most recent years
+    lags: An integer, or a list of integers. When given, the input variable in each year is also correlated with every indicator that many years earlier
+        (later, for negative lags), all of the lags of a chunk of indicators in one pass, and the lag with the largest absolute t score is reported in a
+        column Lag (and Lag_change) with its correlation and n. Only lags with more than nlim (and two) observations are candidates, unless none has
+        that many. An integer L stands for every lag from -L to L
+    method: 'pearson' (the default), 'spearman', 'kendall' or 'winsorized'. The correlation that is computed, ordered on and filtered with cor_lim and t_lim:
+        Pearson's, Spearman's rank correlation, Kendall's tau-b, or Pearson's once the values of each variable beyond its 5th and 95th percentiles are
+        clipped to them. The rank and winsorized correlations suit skewed series. Every method is computed for a chunk of indicators at once, and the t
+        score is r*sqrt((n-2)/(1-r^2)) whatever the method
+    stats: A Boolean value. When set to True, the time spent in each stage of the call, the requests made to the World Bank API, the bytes downloaded,
+        the hits and misses of the store and the latencies of the downloads are collected into a World_Bank_Correlations.instrument.Stats, which is
+        put in the attrs of the output as output.attrs['stats']
     
     Returns
     ----------
@@ -344,78 +362,27 @@ def wb_corrs_search(data,col,search,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
     assert type(search)==str, "search must be a character string."
     assert 'Country' in data.columns, "data must have a column containing countries called 'Country'"
     assert 'Year' in data.columns, "data must have a column containing years called 'Year'"
-    assert type(col)==int, "col must be an integer of a column index that exists in data"
-    assert col<data.shape[1], "col must be a column index belonging to data"
+    assert type(col)==int or cols is not None, "col must be an integer of a column index that exists in data"
+    assert cols is not None or col<data.shape[1], "col must be a column index belonging to data"
     assert type(change)==bool, "change must be a Boolean value (True or False)"
     assert type(k)==int, "k must be an integer"
     assert type(nlim)==int, "n must be an integer"
     assert (type(cor_lim)==float or type(cor_lim)==int), "cor_lim must be a real number"
     assert (type(t_lim)==float or type(t_lim)==int), "n_lim must be a real number"
-    inds=wb.search_indicators(search).reset_index()
-    cors=[]
-    indicators=[]
-    n=[]
-    t=[]
-    for indic in inds['id']:
-        try:
-            thing=pd.DataFrame(wb.get_series(indic,mrv=50))
-        except:
-            pass
-        merged=pd.merge(data,thing,how='left',on=['Country','Year'])
-        cor_i=merged.iloc[:,col].corr(merged.iloc[:,(merged.shape[1]-1)])
-        cors.append(cor_i)
-        indicators.append(pd.DataFrame(wb.get_series(indic,mrv=1)).reset_index()['Series'][0])
-        n_i=len(merged[merged.iloc[:,col].notnull() & merged.iloc[:,(merged.shape[1]-1)].notnull()])
-        n.append(n_i)
-        if cor_i==-1 or cor_i==1: # Avoid division by 0. 
-            t.append(None)
-        else:
-            t.append((cor_i*(sqrt((n_i-2)/(1-(cor_i*cor_i))))))
-    if change==False:
-        if t_lim==0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n)),columns=['Indicator','Correlation','n']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n>nlim) & ((almost_there.Correlation>cor_lim) | (almost_there.Correlation<-cor_lim))].head(k)
-        if t_lim!=0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n,t)),columns=['Indicator','Correlation','n','t']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n>nlim) & ((almost_there.Correlation>cor_lim) | (almost_there.Correlation<-cor_lim)) & ((almost_there.t>t_lim) | (almost_there.t<-t_lim))].head(k)
-    if change==True:
-        cors_chg=[]
-        n_change=[]
-        t_change=[]
-        mumbo=pd.DataFrame() # Create a Pandas DataFrame with the data on the chosen indicator using the world_bank_data package
-        for country in data['Country'].unique():
-            m=data[data['Country']==country]
-            m.loc[:,'lag_dat']=m.iloc[:,col].shift(-1) # Generates warning message if pandas option is not changed above
-            m.loc[:,'pct_chg_dat']=(((m.iloc[:,col]-m['lag_dat'])/m['lag_dat'])*100)
-            mumbo=pd.concat([mumbo,m])
-        for indic in inds['id']:
-            jumbo=pd.DataFrame()
-            thing2=pd.DataFrame(wb.get_series(indic,mrv=50)).reset_index()
-            for country in thing2['Country'].unique():
-                j=thing2[thing2['Country']==country]
-                j.loc[:,'lag_ind']=j.iloc[:,3].shift(-1) # Generates warning message if pandas option is not changed above
-                j.loc[:,'pct_chg_ind']=(((j.iloc[:,3]-j['lag_ind'])/j['lag_ind'])*100)
-                jumbo=pd.concat([jumbo,j]) #Empty dataframe to contain the percent change data for World Bank data
-            merged_pct=pd.merge(mumbo,jumbo,how='inner',on=['Country','Year'])
-            cor_chg_i=merged_pct.loc[:,'pct_chg_dat'].corr(merged_pct.loc[:,'pct_chg_ind'])
-            cors_chg.append(cor_chg_i)
-            n_chg_i=len(merged_pct[merged_pct.loc[:,'pct_chg_dat'].notnull() & merged_pct.loc[:,'pct_chg_ind'].notnull()])
-            n_change.append(n_chg_i)
-            if (cor_chg_i==1 or cor_chg_i==-1):
-                t_change.append(None)
-            else:
-                t_change.append(cor_chg_i*sqrt(((n_chg_i-2)/(1-(cor_chg_i*cor_chg_i)))))
-        if t_lim==0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n,cors_chg,n_change)),columns=['Indicator','Correlation','n','Correlation_change','n_change']).sort_values(by='Correlation_change',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n_change>nlim) & ((almost_there.Correlation_change>cor_lim) | (almost_there.Correlation_change<-cor_lim))].head(k)
-        if t_lim!=0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n,t,cors_chg,n_change,t_change)),columns=['Indicator','Correlation','n','t','Correlation_change','n_change','t_change']).sort_values(by='Correlation_change',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n_change>nlim) & ((almost_there.Correlation_change>cor_lim) | (almost_there.Correlation_change<-cor_lim)) & ((almost_there.t_change>t_lim) | (almost_there.t_change<-t_lim))].head(k)
-    pd.options.mode.chained_assignment = orig_value
-
-def wb_every(data,col,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
-    pd.options.mode.chained_assignment = None # Change option within function to avoid warning of value being placed on a copy of a slice. 
+    from .kernel import METHODS, corr_table
+    assert method in METHODS, "method must be one of "+str(METHODS)
+    col=_columns(data,col,cols)
+    lags=_lags(lags)
+    store=get_store(store)
+    ids=[indicator for indicator, name in get_catalog().search(search)] # Searched locally, in the catalogue kept on disk
+    scope=_scope(data,countries,years,lags)
+    table=_cached_table('wb_corrs_search',data,col,change,scope,store,ids,
+                        lambda: corr_table(data,col,iter_entries(store,ids,mrv=50,max_workers=max_workers,scope=scope),change,lags=lags,method=method,nlim=nlim),lags,method,nlim) # Indicators that can no longer be downloaded are skipped
+    return _top(table,k,change,nlim,cor_lim,t_lim)
 
+
+@instrumented
+def wb_every(data,col,k=5,change=False,nlim=1,cor_lim=0,t_lim=0,store=None,max_workers=None,bulk=None,resume=None,cols=None,executor=None,countries=None,years=None,low_memory=False,prescreen=None,lags=None,method='pearson',stats=False):
     """
     Returns the k variables from the World Bank Dataset with the strongest relationship with an input variable, sorted by the strength of the relationship.
     Relationship can be either the correlation that the input variable has with the variables from the World Bank Data or the correlation in the annual percent change of the variables.
@@ -431,6 +398,49 @@ def wb_every(data,col,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
     nlim: An integer indicating the minimum n of indicators to be reported.
     cor_lim: A real number indicating the minimum absolute value of the correlation between the input variable and World Bank indicators to be reported
     t_lim: A real number indicating the minimum t score of the correlation between the input variable and World Bank indicators to be reported.
+    store: The series store to read World Bank data through. Defaults to the store from World_Bank_Correlations.store.get_store(), which keeps
+        downloaded indicators on disk so that repeated calls do not download them again
+    max_workers: The number of indicators to download at the same time. Defaults to World_Bank_Correlations.fetch.MAX_WORKERS
+    bulk: The path of a World Bank bulk download (the WDI CSV file or its ZIP), or of a panel made from one with
+        World_Bank_Correlations.bulk.build_panel. When given, every indicator in the file is scanned offline instead of downloading
+        each indicator from the API. A CSV or ZIP file is converted into a panel the first time it is used
+    resume: The path of a checkpoint file. The statistics of every finished indicator are written to it every 30 seconds, and when the scan ends or fails.
+        If the file exists, the indicators recorded in it are not scanned again, so an interrupted scan can be resumed by calling again with the same path.
+        The file must come from a scan with the same data, setting of change and bulk panel, as built from the same download
+    cols: A list of the integer indices of several columns of data, each holding a variable, or 'numeric' for every numeric column other than Country and Year.
+        When given, col is ignored and every indicator is downloaded and aligned once and correlated with all of the variables together. The output then has
+        a MultiIndex of Variable (the column name) and Indicator, with the results of each variable following each other
+    executor: 'thread' (the default) or 'process'. With 'process', the indicators are split into shards that are scanned by one process per CPU,
+        which helps when the data is local (with bulk, or once the indicators are stored) and the scan is limited by computation rather than
+        the network. The input data is shared with the processes through a memory-mapped file, and the store must be picklable (every store of
+        World_Bank_Correlations is)
+    low_memory: A Boolean value. When set to True, the scan keeps its memory flat however many indicators it scans: the input is coded with
+        categorical countries, int16 years and float32 values, every chunk of indicators is gathered into the same preallocated matrix, and chunks
+        are smaller. Correlations are then computed in float32, and differ from the default ones in about the sixth significant digit. Use it
+        with a store on disk (the default store is), since a World_Bank_Correlations.store.MemorySeriesStore keeps every indicator in memory
+    countries: A list of the countries to download World Bank data for, or 'all'. Defaults to the countries in the Country column of data, so that
+        only they are requested from the World Bank API and read from the store
+    years: A list of the years to download World Bank data for, or 'all'. Defaults to the years in the Year column of data, so that only the years
+        from the one before the first (for its annual percent change) to the last are requested and read. Requests for the years beyond the 50
+        most recent go to the API once, and are stored apart from those of the most recent years
+    prescreen: None (the default), 'coverage' or 'sample'. With 'coverage', the indicators that are already stored and cannot pass nlim are dropped
+        before their values are read, going by the bitmaps of where each indicator has data that the stores keep (see
+        World_Bank_Correlations.store.SeriesStore.coverage), so the output is the same with fewer indicators read. With 'sample', the remaining
+        indicators are then correlated over one year of the input data in three, and only those among the 20*k strongest so far are correlated
+        exactly and have their percent changes aligned (see World_Bank_Correlations.kernel.Sampler). This is an approximation: an indicator that
+        is weak on those years but strong on all of them can be missed, as can, with change=True, one whose changes are strongly correlated
+        but not its values
+    lags: An integer, or a list of integers. When given, the input variable in each year is also correlated with every indicator that many years earlier
+        (later, for negative lags), all of the lags of a chunk of indicators in one pass, and the lag with the largest absolute t score is reported in a
+        column Lag (and Lag_change) with its correlation and n. Only lags with more than nlim (and two) observations are candidates, unless none has
+        that many. An integer L stands for every lag from -L to L
+    method: 'pearson' (the default), 'spearman', 'kendall' or 'winsorized'. The correlation that is computed, ordered on and filtered with cor_lim and t_lim:
+        Pearson's, Spearman's rank correlation, Kendall's tau-b, or Pearson's once the values of each variable beyond its 5th and 95th percentiles are
+        clipped to them. The rank and winsorized correlations suit skewed series. Every method is computed for a chunk of indicators at once, and the t
+        score is r*sqrt((n-2)/(1-r^2)) whatever the method
+    stats: A Boolean value. When set to True, the time spent in each stage of the call, the requests made to the World Bank API, the bytes downloaded,
+        the hits and misses of the store and the latencies of the downloads are collected into a World_Bank_Correlations.instrument.Stats, which is
+        put in the attrs of the output as output.attrs['stats']
 
     Returns
     ----------
@@ -440,78 +450,279 @@ def wb_every(data,col,k=5,change=False,nlim=1,cor_lim=0,t_lim=0):
             will be included. The DataFrame is ordered on the correlation if change is set to False and on the correlation of percent changes if change is set to True.
             The number of rows in the dataframe will be, at most, k. The number of columns will depend on the settings of change, nlim, and t_lim.
     """
-    from math import sqrt
+    assert executor in (None,'thread','process'), "executor must be 'thread' or 'process'"
+    assert executor!='process' or prescreen!='sample', "prescreen='sample' needs executor='thread'"
+    scan=_every_scan(data,col,k,change,nlim,cor_lim,t_lim,store,max_workers,bulk,resume,cols,countries,years,low_memory,prescreen,lags,method)
+    data,col,store,ids,max_workers,top,chunk,checkpoint,scope,low_memory,prescreen,method=scan
+    if executor=='process':
+        from .kernel import Prepared
+        from .parallel import scan_processes
+        if prescreen is not None:
+            ids=list(_screened(Prepared(data,col,change,lags=top.lags),store,ids,nlim,scope))
+        return scan_processes(data,col,store,ids,top,max_workers,checkpoint=checkpoint,scope=scope,low_memory=low_memory,method=method).table()
+    from .results import get_cache
+    cached=bulk is None and checkpoint is None and not low_memory and prescreen is None
+    key=_result_key('wb_every',data,col,change,scope,ids,top.lags,method,nlim)+(k,nlim,cor_lim,t_lim) if cached else None # Only the table is kept, so the scan holds k rows
+    table=get_cache().get(key,store,ids) if cached else None
+    if table is not None:
+        return table.copy()
+    for row, top in _iter_every(*scan):
+        pass
+    table=top.table()
+    if cached:
+        get_cache().put(key,store,ids,table.copy())
+    return table
+
+
+def iter_wb_every(data,col,k=5,change=False,nlim=1,cor_lim=0,t_lim=0,store=None,max_workers=None,bulk=None,resume=None,cols=None,countries=None,years=None,low_memory=False,prescreen=None,lags=None,method='pearson'):
+    """
+    Scans every variable from the World Bank Dataset like wb_every, yielding the relationship with each variable as soon as it is found.
+    Only the k strongest relationships that pass nlim, cor_lim and t_lim are kept while scanning, so the strongest relationships found so far
+    can be read at any point of the scan, and a scan that is stopped early still has its partial answer.
+
+    Parameters
+    ----------
+    The same as wb_every
+
+    Returns
+    ----------
+    Generator of tuples
+        (row, top) for every indicator, in the order of the World Bank listing, after those recorded in resume, or only for those that pass prescreen. row is a dict with the keys id, Indicator, Correlation, n and t,
+            and Correlation_change, n_change and t_change if change is True. top is a World_Bank_Correlations.kernel.TopK whose table() method
+            returns the k strongest relationships found so far, in the same form as the output of wb_every
+
+    Examples
+    ----------
+    >>> for row, top in iter_wb_every(wb.get_series('3.0.Gini',mrv=50).reset_index(),3,nlim=50):
+    ...     print(row['id'], row['Correlation'])
+    ...     if top.seen % 1000 == 0:
+    ...         print(top.table())
+    """
+    return _iter_every(*_every_scan(data,col,k,change,nlim,cor_lim,t_lim,store,max_workers,bulk,resume,cols,countries,years,low_memory,prescreen,lags,method))
+
+
+def _every_scan(data,col,k,change,nlim,cor_lim,t_lim,store,max_workers,bulk,resume,cols,countries,years,low_memory,prescreen,lags,method):
+    """Checks the arguments of wb_every and returns what a scan of every indicator needs: data, col, store, ids, max_workers, top, chunk, checkpoint, scope, low_memory, prescreen and method"""
     assert 'Country' in data.columns, "data must have a column containing countries called 'Country'"
     assert 'Year' in data.columns, "data must have a column containing years called 'Year'"
-    assert type(col)==int, "col must be an integer of a column index that exists in data"
-    assert col<data.shape[1], "col must be a column index belonging to data"
+    assert type(col)==int or cols is not None, "col must be an integer of a column index that exists in data"
+    assert cols is not None or col<data.shape[1], "col must be a column index belonging to data"
     assert type(change)==bool, "change must be a Boolean value (True or False)"
     assert type(k)==int, "k must be an integer"
     assert type(nlim)==int, "n must be an integer"
     assert (type(cor_lim)==float or type(cor_lim)==int), "cor_lim must be a real number"
     assert (type(t_lim)==float or type(t_lim)==int), "n_lim must be a real number"
-    pd.options.mode.chained_assignment = None
-    here_we_go=pd.read_xml(requests.get('http://api.worldbank.org/v2/indicator?per_page=20100').content)
-    cors=[]
-    indicators=[]
-    n=[]
-    t=[]
-    for indic in here_we_go['id']:
-        try:
-            thing=pd.DataFrame(wb.get_series(indic,mrv=50)).reset_index()
-        except:
-            pass
-        merged=pd.merge(data,thing,how='left',on=['Country','Year'])
-        n_i=(len(merged[merged.iloc[:,col].notnull() & merged.iloc[:,(merged.shape[1]-1)].notnull()]))
-        n.append(n_i)
-        cor_i=merged.iloc[:,col].corr(merged.iloc[:,(merged.shape[1]-1)])
-        cors.append(cor_i)
-        if cor_i==1 or cor_i==-1: # Avoid division by 0
-            t.append(None)
-        else:
-            t.append((cor_i*(sqrt((n_i-2)/(1-(cor_i*cor_i))))))
-        indicators.append(thing.loc[0,'Series'])
-    if change==False:
-        if t_lim==0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n)),columns=['Indicator','Correlation','n']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n>nlim) & ((almost_there.Correlation>cor_lim) | (almost_there.Correlation<-cor_lim))].head(k)
-        if t_lim != 0:
-            almost_there = pd.DataFrame(list(zip(indicators,cors,n,t)),columns=['Indicator','Correlation','n','t']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator')
-            return almost_there.loc[(almost_there.n>nlim) & ((almost_there.Correlation>cor_lim) | (almost_there.Correlation<-cor_lim)) & ((almost_there.t>t_lim) | (almost_there.t<-t_lim))].head(k)
+    assert type(low_memory)==bool, "low_memory must be a Boolean value (True or False)"
+    assert prescreen in (None,'coverage','sample'), "prescreen must be None, 'coverage' or 'sample'"
+    from .bulk import PanelStore
+    from .kernel import CHUNK, METHODS, STREAM_CHUNK, TopK
+    from .checkpoint import Checkpoint, fingerprint
+    assert method in METHODS, "method must be one of "+str(METHODS)
+    col=_columns(data,col,cols)
+    lags=_lags(lags)
+    if bulk is not None:
+        store=bulk if isinstance(bulk,PanelStore) else PanelStore(bulk)
+        ids=store.indicators
+        max_workers=1 # Reading from the memory-mapped panel does not wait on the network
+        chunk=CHUNK
+    else:
+        store=get_store(store)
+        ids=get_catalog().ids()
+        chunk=STREAM_CHUNK
+    if low_memory:
+        chunk=STREAM_CHUNK # Smaller matrices, however the indicators are read
+    checkpoint=None
+    if resume is not None:
+        checkpoint=Checkpoint(resume,_scope_key({'function':'wb_every','bulk':store.identity() if bulk is not None else False,'change':change,'data':fingerprint(data,col)},countries,years,lags,method,nlim),
+                              variables=len(col) if type(col)==list else 1) # An indicator is finished once it has a row for each column
+    variables=[data.columns[c] for c in col] if type(col)==list else None
+    return data,col,store,ids,max_workers,TopK(k,change,nlim,cor_lim,t_lim,variables,lags),chunk,checkpoint,_scope(data,countries,years,lags,not isinstance(store,PanelStore)),low_memory,prescreen,method
+
+
+def _iter_every(data,col,store,ids,max_workers,top,chunk,checkpoint,scope,low_memory,prescreen,method):
+    """Generator behind iter_wb_every, so that the arguments of iter_wb_every are checked when it is called rather than when it is first iterated"""
+    from .kernel import SAMPLE_KEEP, Prepared, Sampler, iter_rows
+    if checkpoint is not None:
+        for row in checkpoint.rows:
+            top.push(row)
+            yield row, top
+        ids=[indicator for indicator in ids if indicator not in checkpoint]
+    prepared=Prepared(data,col,top.change,low_memory,top.lags,method,top.nlim)
+    if prescreen is not None:
+        ids=_screened(prepared,store,ids,top.nlim,scope)
+    entries=iter_entries(store,ids,mrv=50,max_workers=max_workers,scope=scope) # Indicators that can no longer be downloaded are skipped
+    if prescreen=='sample':
+        entries=Sampler(data,col,SAMPLE_KEEP*max(top.k,1),lags=top.lags,method=method).filter(entries,chunk)
+    try:
+        for row in iter_rows(prepared,entries,chunk):
+            if checkpoint is not None:
+                checkpoint.add(row)
+            top.push(row)
+            yield row, top
+    finally:
+        if checkpoint is not None:
+            checkpoint.write()
+
+
+def _screened(prepared,store,ids,nlim,scope):
+    """Yields the indicators of ids that can pass nlim, going by the coverage of the stored ones (see World_Bank_Correlations.kernel.screen), a chunk at a time"""
+    from .kernel import CHUNK, screen
+    ids=list(ids)
+    for i in range(0,len(ids),CHUNK):
+        batch=ids[i:i+CHUNK]
+        with timer('prescreen'):
+            coverages=[store.coverage(indicator,mrv=50,scope=scope) for indicator in batch]
+            passing=screen(prepared,coverages,nlim)
+        for indicator,passing in zip(batch,passing):
+            if passing:
+                yield indicator
+
+
+def _resumed_table(data,col,store,ids,change,max_workers,checkpoint,scope,lags=None,method='pearson',nlim=1):
+    """
+    Returns the table of World_Bank_Correlations.kernel.corr_table for the indicators ids, taking the statistics of the indicators recorded in
+    checkpoint from it and recording the statistics of the others
+    """
+    import pandas as pd
+    from .kernel import STREAM_CHUNK, corr_table, iter_stats
+    try:
+        rest=[indicator for indicator in ids if indicator not in checkpoint]
+        for row in iter_stats(data,col,iter_entries(store,rest,mrv=50,max_workers=max_workers,scope=scope),change,STREAM_CHUNK,lags=lags,method=method,nlim=nlim):
+            checkpoint.add(row)
+    finally:
+        checkpoint.write()
+    if not checkpoint.rows:
+        return corr_table(data,col,[],change,lags=lags,method=method)
+    order={indicator:i for i,indicator in enumerate(ids)}
+    return pd.DataFrame(sorted(checkpoint.rows,key=lambda row: order.get(row['id'],len(order)))) # In the order of the listing, as corr_table
+
+
+def _scope(data,countries,years,lags=None,online=True):
+    """
+    Returns the World_Bank_Correlations.store.Scope of a scan: the countries and years given, or else those of data. 'all' does not restrict them.
+    With lags, the years are widened to those the lags read. When online is False, as for a scan of a bulk panel, the codes of the countries are not
+    looked up in the listing of the API, which is only needed to request them
+    """
+    from .store import Scope
+    assert countries is None or countries=='all' or type(countries)==list, "countries must be a list of country names or 'all'"
+    assert years is None or years=='all' or type(years)==list, "years must be a list of years or 'all'"
+    if countries is None:
+        countries=list(data['Country'].dropna().unique())
+    if years is None:
+        years=list(data['Year'].dropna().unique())
+    countries=None if countries=='all' else countries
+    years=None if years=='all' else years
+    if years is not None and lags is not None and all(str(y).isdigit() for y in years):
+        years=sorted({int(y)-lag for y in years for lag in lags})
+    codes=None
+    if countries is not None and online:
+        known=get_catalog().countries()
+        codes=[known.get(str(c)) for c in countries]
+        codes=None if None in codes else codes # A country the API does not list by that name is only found by requesting every country
+    return Scope(countries,years,codes)
+
+
+def _scope_key(key,countries,years,lags=None,method='pearson',nlim=1):
+    """
+    Adds the countries and years given to a scan, its lags and its method, to the key of its checkpoint, with nlim if there are lags, as it decides the lag
+    of each row. The countries and years inferred from data are part of its fingerprint
+    """
+    if countries is not None:
+        key['countries']=countries if countries=='all' else sorted(str(c) for c in countries)
+    if years is not None:
+        key['years']=years if years=='all' else sorted(str(y) for y in years)
+    if lags is not None:
+        key['lags']=lags
+        key['nlim']=nlim
+    if method!='pearson': # Checkpoints of Pearson scans keep the keys they had before there were methods
+        key['method']=method
+    return key
+
+
+def _result_key(name,data,col,change,scope,ids,lags=None,method='pearson',nlim=1):
+    """
+    Returns the key of a scan in World_Bank_Correlations.results: the function, its indicators, the fingerprint and names of the columns of data, change,
+    scope, lags and method, with nlim if there are lags, as it decides the lag of each row
+    """
+    from .checkpoint import fingerprint
+    names=tuple(data.columns[c] for c in col) if type(col)==list else data.columns[col]
+    return (name,tuple(ids),fingerprint(data,col),names,change,scope.countries,scope.start,scope.end,(tuple(lags),nlim) if lags is not None else None,method)
+
+
+def _cached_table(name,data,col,change,scope,store,ids,compute,lags=None,method='pearson',nlim=1):
+    """Returns a copy of the table of statistics kept in World_Bank_Correlations.results for a scan, or else of the table made by compute, which is kept"""
+    from .results import get_cache
+    cache=get_cache()
+    key=_result_key(name,data,col,change,scope,ids,lags,method,nlim)
+    table=cache.get(key,store,ids)
+    if table is None:
+        table=compute()
+        cache.put(key,store,ids,table)
+    return table.copy()
+
+
+def _lags(lags):
+    """Returns the sorted list of the lags given as an integer L (every lag from -L to L) or a list of integers, or None, checking them"""
+    if lags is None:
+        return None
+    if type(lags)==int:
+        assert lags>=0, "lags must be a non-negative integer or a list of integers"
+        return list(range(-lags,lags+1))
+    assert type(lags)==list and len(lags)>0 and all(type(lag)==int for lag in lags), "lags must be a non-negative integer or a non-empty list of integers"
+    return sorted(set(lags))
+
+
+def _columns(data,col,cols):
+    """Returns col, or the list of column indices given by cols when it is set, checking them"""
+    if cols is None:
+        return col
+    if cols=='numeric':
+        import pandas as pd
+        cols=[i for i,name in enumerate(data.columns) if name not in ('Country','Year') and pd.api.types.is_numeric_dtype(data[name])]
+    assert type(cols)==list and len(cols)>0, "cols must be a non-empty list of the integer indices of the columns containing data on the variables of interest, or 'numeric' for every numeric column"
+    for c in cols:
+        assert type(c)==int and c<data.shape[1], "Elements of cols must be column indices belonging to data"
+    return cols
+
+
+def _per_variable(table,func):
+    """
+    Applies func, which turns a table of statistics into an output table indexed by Indicator, to the rows of each variable of a table from
+    World_Bank_Correlations.kernel.corr_table made with several columns, and stacks the results under a MultiIndex of Variable and Indicator
+    """
+    import pandas as pd
+    if 'Variable' not in table.columns:
+        return func(table)
+    if len(table)==0:
+        empty=func(table.drop(columns='Variable'))
+        empty.index=pd.MultiIndex.from_arrays([[],[]],names=['Variable','Indicator'])
+        return empty
+    return pd.concat({variable:func(rows.drop(columns='Variable')) for variable,rows in table.groupby('Variable',sort=False)},names=['Variable','Indicator'])
+
+
+def _top(table,k,change,nlim,cor_lim,t_lim):
+    """
+    Orders a table of statistics from World_Bank_Correlations.kernel.corr_table by the strength of relationship and keeps the k strongest
+    relationships that pass nlim, cor_lim and t_lim. The limits and the ordering apply to the correlation of the annual percent changes if change
+    is True. The t scores are only reported if t_lim is set. With several variables, this is done for each variable.
+    """
+    if 'Variable' in table.columns:
+        return _per_variable(table,lambda table: _top(table,k,change,nlim,cor_lim,t_lim))
+    with timer('sort'):
+        return _top_rows(table,k,change,nlim,cor_lim,t_lim)
+
+
+def _top_rows(table,k,change,nlim,cor_lim,t_lim):
+    """_top for the table of a single variable"""
+    suffix='_change' if change==True else ''
+    lag=['Lag'] if 'Lag' in table.columns else []
+    columns=['Indicator','Correlation','n']+(['t'] if t_lim!=0 else [])+lag
     if change==True:
-        cors_change=[]
-        n_change=[]
-        t_change=[]
-        mumbo=pd.DataFrame() # Create a Pandas DataFrame with the data on the chosen indicator using the world_bank_data package
-        for country in data['Country'].unique():
-            s=data[data['Country']==country]
-            s.loc[:,'lag_dat']=s.iloc[:,col].shift(-1) # Generates warning message if pandas option is not changed above
-            s.loc[:,'pct_chg_dat']=(((s.iloc[:,col]-s['lag_dat'])/s['lag_dat'])*100)
-            mumbo=pd.concat([mumbo,s])
-        for indic in here_we_go['id']:
-            jumbo=pd.DataFrame() #Empty dataframe to contain the percent change data for World Bank data
-            try:
-                thing=pd.DataFrame(wb.get_series(indic,mrv=50)).reset_index()
-            except:
-                pass
-            for country in thing['Country'].unique():
-                t=thing[thing['Country']==country]
-                t.loc[:,'lag_ind']=t.iloc[:,3].shift(-1) # Generates warning message if pandas option is not changed above
-                t.loc[:,'pct_chg_ind']=(((t.iloc[:,3]-t['lag_ind'])/t['lag_ind'])*100)
-                jumbo=pd.concat([jumbo,t])
-            merged_pct=pd.merge(mumbo,jumbo,how='left',on=['Country','Year'])
-            cor_chg_i=merged_pct.loc[:,'pct_chg_dat'].corr(merged_pct.loc[:,'pct_chg_ind'])
-            cors_change.append(cor_chg_i)
-            n_chg_i=len(merged_pct[merged_pct.loc[:,'pct_chg_dat'].notnull() & merged_pct.loc[:,'pct_chg_ind'].notnull()])
-            n_change.append(n_chg_i)
-            if (cor_chg_i==1 or cor_chg_i==-1):
-                t_change.append(None)
-            else:
-                t_change.append(cor_chg_i*sqrt(((n_chg_i-2)/(1-(cor_chg_i*cor_chg_i)))))
-    if t_lim==0:
-        almost_there = pd.DataFrame(list(zip(indicators,cors,n,cors_change,n_change)),columns=['Indicator','Correlation','n','Correlation_change','n_change']).sort_values(by='Correlation_change',key=abs,ascending=False).set_index('Indicator')
-        return almost_there.loc[(almost_there.n_change>nlim) & ((almost_there.Correlation_change>cor_lim) | (almost_there.Correlation_change<-cor_lim))].head(k)
+        columns+=['Correlation_change','n_change']+(['t_change'] if t_lim!=0 else [])+[c+'_change' for c in lag]
+    almost_there=table[columns].sort_values(by='Correlation'+suffix,key=abs,ascending=False,kind='stable').set_index('Indicator') # Ties keep the order of the listing
+    cor=almost_there['Correlation'+suffix]
+    keep=(almost_there['n'+suffix]>nlim) & ((cor>cor_lim) | (cor<-cor_lim))
     if t_lim!=0:
-        almost_there = pd.DataFrame(list(zip(indicators,cors,n,t,cors_change,n_change,t_change)),columns=['Indicator','Correlation','n','t','Correlation_change','n_change','t_change']).sort_values(by='Correlation_change',key=abs,ascending=False).set_index('Indicator')
-        return almost_there.loc[(almost_there.n_change>nlim) & ((almost_there.Correlation_change>cor_lim) | (almost_there.Correlation_change<-cor_lim)) & ((almost_there.t_change>t_lim) | (almost_there.t_change<(-t_lim)))].head(k)
-    pd.options.mode.chained_assignment = orig_value
+        t=almost_there['t'+suffix]
+        keep=keep & ((t>t_lim) | (t<-t_lim))
+    return almost_there.loc[keep].head(k)
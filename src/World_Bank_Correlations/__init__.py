@@ -1,3 +1,8 @@
-# read version from installed package
-from importlib.metadata import version
-__version__ = version("World_Bank_Correlations")
\ No newline at end of file
+# read version from installed package, when it is first asked for, since importlib.metadata is slow to import
+
+
+def __getattr__(name):
+    if name == '__version__':
+        from importlib.metadata import version
+        return version("World_Bank_Correlations")
+    raise AttributeError("module 'World_Bank_Correlations' has no attribute " + repr(name))
@@ -0,0 +1,91 @@
+"""
+Asyncio counterparts of the functions of World_Bank_Correlations.World_Bank_Correlations.
+
+Each coroutine runs its function in a thread of a small pool of its own, so awaiting it never blocks the event loop,
+and returns the same DataFrame as the function. The downloads of a scan go through the same Fetcher as the synchronous
+functions, with its pooled HTTP session, rate limit and retries, and at most max_workers of them at a time, so the
+concurrency is bounded twice: MAX_SCANS scans at a time, and max_workers downloads in each. aiter_wb_every yields the
+rows of iter_wb_every as they are found, and stops the scan when it is closed or its task is cancelled.
+
+The threads run in a copy of the context of the coroutine, as asyncio.to_thread does, so scans awaited at the same time
+with stats=True, or in different tasks collecting Stats, each record only their own (see World_Bank_Correlations.instrument).
+
+Example, in a coroutine:
+    from World_Bank_Correlations import aio
+    top = await aio.wb_topic_corrs(my_df, 2, 'Health', k=5)
+    async for row, top in aio.aiter_wb_every(my_df, 2, nlim=50):
+        ...
+"""
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from . import World_Bank_Correlations as wbc
+
+MAX_SCANS = 4 # The number of scans run at the same time. Others wait for a thread of the pool
+
+_pool = None
+_pool_lock = threading.Lock()
+_done = object()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=MAX_SCANS, thread_name_prefix='wbc-aio')
+        return _pool
+
+
+async def _run(func, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor(), lambda: context.run(func, *args, **kwargs))
+
+
+async def wb_corr(*args, **kwargs):
+    """Awaitable wb_corr, with the same arguments and output (see World_Bank_Correlations.World_Bank_Correlations.wb_corr)"""
+    return await _run(wbc.wb_corr, *args, **kwargs)
+
+
+async def wb_rolling_corrs(*args, **kwargs):
+    """Awaitable wb_rolling_corrs, with the same arguments and output (see World_Bank_Correlations.World_Bank_Correlations.wb_rolling_corrs)"""
+    return await _run(wbc.wb_rolling_corrs, *args, **kwargs)
+
+
+async def wb_topic_corrs(*args, **kwargs):
+    """Awaitable wb_topic_corrs, with the same arguments and output (see World_Bank_Correlations.World_Bank_Correlations.wb_topic_corrs)"""
+    return await _run(wbc.wb_topic_corrs, *args, **kwargs)
+
+
+async def wb_corrs_search(*args, **kwargs):
+    """Awaitable wb_corrs_search, with the same arguments and output (see World_Bank_Correlations.World_Bank_Correlations.wb_corrs_search)"""
+    return await _run(wbc.wb_corrs_search, *args, **kwargs)
+
+
+async def wb_every(*args, **kwargs):
+    """Awaitable wb_every, with the same arguments and output (see World_Bank_Correlations.World_Bank_Correlations.wb_every)"""
+    return await _run(wbc.wb_every, *args, **kwargs)
+
+
+async def aiter_wb_every(*args, **kwargs):
+    """
+    Asynchronous generator of the (row, top) of iter_wb_every, with the same arguments (see
+    World_Bank_Correlations.World_Bank_Correlations.iter_wb_every). Closing it stops the scan and writes its checkpoint if it
+    has one. Wrap it in contextlib.aclosing for that to happen as soon as a loop over it is left, rather than when it is collected
+    """
+    scan = await _run(wbc.iter_wb_every, *args, **kwargs)
+    context = contextvars.copy_context() # Every step of the scan runs in it, one at a time
+    step = None
+    try:
+        while True:
+            step = _executor().submit(context.run, next, scan, _done)
+            item = await asyncio.wrap_future(step)
+            if item is _done:
+                return
+            yield item
+    finally:
+        if step is not None and not step.done(): # Cancelled while a step runs in its thread, which closes the scan once it is done
+            step.add_done_callback(lambda step: scan.close())
+        else:
+            scan.close()
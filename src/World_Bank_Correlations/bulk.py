@@ -0,0 +1,153 @@
+"""
+Offline scanning from the World Bank bulk download.
+
+The World Development Indicators can be downloaded as a single CSV file (or a ZIP holding it) with one row per country
+and indicator and one column per year. build_panel converts that file once into a panel directory holding a
+memory-mapped Indicator x Country x Year array of values and another of their annual percent changes, and PanelStore
+serves the panel as a read-only series store, so that wb_every can scan every indicator without a single API call.
+"""
+import os
+import json
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from .store import Entry, Scope, SeriesStore, layout
+from .changes import pct_grid
+
+KEYS = ['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code']
+
+
+def _open_source(source):
+    """Returns a file object for the data table of a bulk CSV or ZIP file"""
+    if zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        names = [name for name in archive.namelist() if name.endswith('CSV.csv') or name.endswith('Data.csv')]
+        assert names, "source must be a World Bank bulk download containing a data file such as WDICSV.csv"
+        return archive.open(names[0])
+    return open(source, 'rb')
+
+
+def build_panel(source, path=None, chunksize=50000):
+    """
+    Converts a World Bank bulk download into a panel directory
+
+    Parameters
+    ----------
+    source: The path of the bulk CSV file (e.g. WDICSV.csv) or of the ZIP file it comes in
+    path: The directory to write the panel to. Defaults to source with ".panel" appended
+    chunksize: The number of CSV rows to read at a time, which bounds the memory used
+
+    Returns
+    ----------
+    String
+        The path of the panel directory
+    """
+    path = path if path is not None else str(source) + '.panel'
+    os.makedirs(path, exist_ok=True)
+    with _open_source(source) as f:
+        keys = pd.read_csv(f, usecols=KEYS, dtype=str, keep_default_na=False)
+    with _open_source(source) as f:
+        header = pd.read_csv(f, nrows=0).columns
+    years = sorted([c for c in header if c.strip().isdigit()], reverse=True) # Most recent year first, as in the API
+    countries = keys.drop_duplicates('Country Name')
+    indicators = keys.drop_duplicates('Indicator Code')
+    country_pos = pd.Series(np.arange(len(countries)), index=countries['Country Name'])
+    indicator_pos = pd.Series(np.arange(len(indicators)), index=indicators['Indicator Code'])
+    values = np.lib.format.open_memmap(os.path.join(path, 'values.npy'), mode='w+', dtype='float64',
+                                       shape=(len(indicators), len(countries), len(years)))
+    values[:] = np.nan
+    with _open_source(source) as f:
+        for chunk in pd.read_csv(f, usecols=['Country Name', 'Indicator Code'] + years, chunksize=chunksize,
+                                 dtype={'Country Name': str, 'Indicator Code': str}, keep_default_na=False, na_values=['']):
+            rows = indicator_pos[chunk['Indicator Code']].to_numpy()
+            cols = country_pos[chunk['Country Name']].to_numpy()
+            values[rows, cols, :] = chunk[years].to_numpy(dtype='float64')
+    values.flush()
+    changes = np.lib.format.open_memmap(os.path.join(path, 'changes.npy'), mode='w+', dtype='float64', shape=values.shape)
+    for i in range(0, len(indicators), 256): # A block of indicators at a time, which bounds the memory used
+        changes[i:i + 256] = pct_grid(values[i:i + 256])
+    changes.flush()
+    del values, changes
+    meta = {'source': os.path.basename(str(source)), 'indicators': list(indicators['Indicator Code']),
+            'names': list(indicators['Indicator Name']), 'countries': list(countries['Country Name']), 'years': years}
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return path
+
+
+class PanelStore(SeriesStore):
+    """
+    Read-only series store backed by a panel directory made by build_panel. Values are memory-mapped, so only the
+    indicators that are read are loaded from disk.
+
+    Parameters
+    ----------
+    path: The panel directory, or a bulk CSV or ZIP file. A file is converted with build_panel the first time it is
+        used, and the panel next to it is reused afterwards
+    """
+
+    def __init__(self, path):
+        SeriesStore.__init__(self, fetch=self._missing)
+        if not os.path.isdir(path):
+            panel = str(path) + '.panel'
+            built = all(os.path.exists(os.path.join(panel, name)) for name in ('meta.json', 'changes.npy'))
+            if not built or os.path.getmtime(panel) < os.path.getmtime(path):
+                build_panel(path, panel)
+            path = panel
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.indicators = meta['indicators']
+        self.names = dict(zip(meta['indicators'], meta['names']))
+        self.countries = layout(meta['countries'])
+        self.years = meta['years']
+        self._pos = {indicator: i for i, indicator in enumerate(self.indicators)}
+        self.values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        changes = os.path.join(path, 'changes.npy')
+        self.changes = np.load(changes, mmap_mode='r') if os.path.exists(changes) else None # None for a panel made by an earlier version
+
+    def __reduce__(self): # A copy sent to another process maps the same panel
+        return (PanelStore, (self.path,))
+
+    def identity(self):
+        """
+        Returns the absolute path of the panel with the size and modification time of its files, which tell it apart from
+        another panel and from the same one built again from a newer bulk download
+        """
+        files = [os.path.join(self.path, name) for name in ('meta.json', 'values.npy')]
+        return [os.path.abspath(self.path)] + [[os.path.getsize(f), os.path.getmtime(f)] for f in files]
+
+    def _missing(self, indicator, mrv=50):
+        raise KeyError(indicator + " is not in the bulk download at " + self.path)
+
+    def load(self, indicator, mrv):
+        if indicator not in self._pos:
+            return None
+        pos = self._pos[indicator]
+        if type(mrv) == str: # The key of a Scope: its years, from the whole panel
+            scope = Scope.from_key(mrv)
+            cols = [j for j, y in enumerate(self.years) if scope.start is None or scope.start <= int(y) <= scope.end]
+            cut = slice(cols[0], cols[-1] + 1) if cols else slice(0, 0)
+            return Entry(indicator, self.names[indicator], self.countries, layout(self.years[cut]), self.values[pos, :, cut],
+                         self.changes[pos, :, cut] if self.changes is not None else None)
+        changes = None
+        if self.changes is not None:
+            changes = self.changes[pos, :, :mrv]
+            if mrv < len(self.years): # The change of the earliest year kept is NaN, as if the indicator were downloaded with mrv
+                changes = changes.copy()
+                changes[:, -1] = np.nan
+        return Entry(indicator, self.names[indicator], self.countries, layout(self.years[:mrv]), self.values[pos, :, :mrv], changes)
+
+    def save(self, entry, mrv):
+        pass
+
+    def evict(self):
+        pass
+
+    def clear(self):
+        pass
+
+    def stored(self): # The panel is refreshed by building it from a newer bulk download
+        return {}
@@ -0,0 +1,277 @@
+"""
+The catalogue of World Bank indicators and topics.
+
+The indicator listing (about 21,000 indicators) and the listing of each topic are downloaded once, indexed by ID and
+kept in a JSON file, so validating an indicator or listing a topic is a dictionary lookup. The file is refreshed when
+it is older than max_age. If a refresh fails, the older copy is used. The listing of sources, with the date the World
+Bank last updated each one, tells which stored indicators are out of date (see World_Bank_Correlations.store.SeriesStore.refresh).
+The catalogue is searched locally through an inverted index of the words of the indicators (see
+World_Bank_Correlations.search), kept in a second JSON file. The listing of countries gives the codes that requests restricted to some countries are made with (see
+World_Bank_Correlations.store.Scope).
+"""
+import os
+import json
+import time
+import calendar
+
+from .store import CACHE_DIR
+from . import instrument
+from .fetch import get_fetcher
+
+# Topic IDs of the World Bank API and their names, as listed at http://api.worldbank.org/v2/topic
+TOPICS = {1: 'Agriculture & Rural Development', 2: 'Aid Effectiveness', 3: 'Economy & Growth', 4: 'Education',
+          5: 'Energy & Mining', 6: 'Environment', 7: 'Financial Sector', 8: 'Health', 9: 'Infrastructure',
+          10: 'Social Protection & Labor', 11: 'Poverty', 12: 'Private Sector', 13: 'Public Sector',
+          14: 'Science & Technology', 15: 'Social Development', 16: 'Urban Development', 17: 'Gender',
+          18: 'Millenium Development Goals', 19: 'Climate Change', 20: 'External Debt', 21: 'Trade'}
+TOPIC_IDS = {name: number for number, name in TOPICS.items()}
+PER_PAGE = 20000 # Indicators per page of a listing, so the whole catalogue comes in one or two requests
+FORMAT = 2 # Of the records of the indicators. A file in another format is downloaded again
+
+
+def topic_id(topic):
+    """Returns the integer ID of a topic given as its ID or its name, or None if there is no such topic"""
+    if type(topic) == int:
+        return topic if topic in TOPICS else None
+    return TOPIC_IDS.get(topic)
+
+
+def _listing(fetcher, path):
+    """Downloads every page of a listing of indicators, sources or countries and returns the records"""
+    records, page, pages = [], 1, 1
+    with instrument.timer('catalog'):
+        while page <= pages:
+            meta, rows = fetcher.get_json(path, per_page=PER_PAGE, page=page)
+            records += rows or []
+            pages = int(meta['pages'])
+            page += 1
+    return records
+
+
+class Catalog:
+    """
+    Index of the World Bank indicators and topics, persisted to a JSON file
+
+    Parameters
+    ----------
+    path: Path of the JSON file. Defaults to catalog.json in World_Bank_Correlations.store.CACHE_DIR
+    max_age: Number of seconds before the catalogue is downloaded again. None never refreshes it
+    fetcher: The World_Bank_Correlations.fetch.Fetcher to download with. Defaults to the shared one
+    """
+
+    def __init__(self, path=None, max_age=7 * 24 * 3600, fetcher=None):
+        self.path = path if path is not None else os.path.join(CACHE_DIR, 'catalog.json')
+        self.max_age = max_age
+        self.fetcher = fetcher
+        self._data = None
+        self._countries_failed = False
+        self._index = None
+
+    def _load(self):
+        if self._data is None:
+            self._data = {'indicators': {}, 'fetched': None, 'topics': {}}
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    self._data = json.load(f)
+        return self._data
+
+    def _stale(self, fetched):
+        return fetched is None or (self.max_age is not None and time.time() - fetched > self.max_age)
+
+    def _save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self._data, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def refresh(self):
+        """Downloads the indicator listing again and forgets the topic and source listings"""
+        records = _listing(self.fetcher or get_fetcher(), 'indicator')
+        data = self._load()
+        data['indicators'] = {r['id']: {'name': r['name'], 'unit': r.get('unit') or '', 'source': (r.get('source') or {}).get('id'),
+                                        'sourceName': (r.get('source') or {}).get('value') or '',
+                                        'sourceNote': r.get('sourceNote') or '', 'sourceOrganization': r.get('sourceOrganization') or '',
+                                        'topics': [int(t['id']) for t in r.get('topics') or [] if t.get('id')]}
+                              for r in records}
+        data['fetched'] = time.time()
+        data['format'] = FORMAT
+        data['topics'] = {}
+        data['sources'] = None
+        self._save()
+
+    @property
+    def indicators(self):
+        """Dict of every indicator ID to its name, unit, source ID, sourceName, sourceNote, sourceOrganization and topic IDs"""
+        data = self._load()
+        if self._stale(data['fetched']) or data.get('format') != FORMAT:
+            try:
+                self.refresh()
+            except Exception:
+                if not data['indicators']:
+                    raise
+        return self._data['indicators']
+
+    def __contains__(self, indicator):
+        return indicator in self.indicators
+
+    def ids(self):
+        """Returns the IDs of every indicator, in the order of the API listing"""
+        return list(self.indicators)
+
+    def name(self, indicator):
+        """Returns the name of an indicator"""
+        return self.indicators[indicator]['name']
+
+    def search(self, query):
+        """
+        Returns the indicators that match a search, in the order of the API listing, as wb.search_indicators finds them. The
+        index of their words is built when the catalogue is downloaded and kept next to it
+
+        Parameters
+        ----------
+        query: A regular expression or a phrase matched against the names, units, sources, source notes, source organizations
+            and topics of the indicators, or, starting with +, words that must all appear (see World_Bank_Correlations.search)
+
+        Returns
+        ----------
+        List of tuples
+            (indicator ID, indicator name)
+        """
+        from .search import SearchIndex
+        indicators = self.indicators
+        with instrument.timer('search'):
+            if self._index is None:
+                self._index = SearchIndex(os.path.splitext(self.path)[0] + '-search.json')
+            found = self._index.search(query, indicators, self._data['fetched'])
+        return [(indicator, indicators[indicator]['name']) for indicator in found]
+
+    def topic(self, topic):
+        """
+        Returns the indicators of a topic, in the order of the API listing of the topic
+
+        Parameters
+        ----------
+        topic: The integer ID or the name of the topic
+
+        Returns
+        ----------
+        List of tuples
+            (indicator ID, indicator name)
+        """
+        number = topic_id(topic)
+        assert number is not None, "topic must be one of the topics of the World Bank API, given as its name or its integer ID: " + str(TOPICS)
+        self.indicators # Refreshes the catalogue, and with it the topics, when it is out of date
+        data = self._load()
+        if str(number) not in data['topics']:
+            records = _listing(self.fetcher or get_fetcher(), 'topic/' + str(number) + '/indicator')
+            data['topics'][str(number)] = [[r['id'], r['name']] for r in records]
+            self._save()
+        return [tuple(pair) for pair in data['topics'][str(number)]]
+
+    def topics(self, topics, max_workers=None):
+        """
+        Returns the indicators of several topics, downloading the listings that are not kept yet at the same time
+
+        Parameters
+        ----------
+        topics: A list of the integer IDs or names of the topics
+        max_workers: The number of listings to download at the same time. Defaults to World_Bank_Correlations.fetch.MAX_WORKERS
+
+        Returns
+        ----------
+        Dict
+            The integer ID of every topic to the list of its (indicator ID, indicator name), as topic returns it
+        """
+        from .fetch import iter_fetched
+        numbers = [topic_id(topic) for topic in topics]
+        assert None not in numbers, "topics must be the names or the integer IDs of topics of the World Bank API: " + str(TOPICS)
+        self.indicators # Refreshes the catalogue, and with it the topics, when it is out of date
+        data = self._load()
+        missing = [number for number in dict.fromkeys(numbers) if str(number) not in data['topics']]
+        fetcher = self.fetcher or get_fetcher()
+        for number, records, error in iter_fetched(lambda number: _listing(fetcher, 'topic/' + str(number) + '/indicator'), missing, max_workers):
+            if error is not None:
+                raise error
+            data['topics'][str(number)] = [[r['id'], r['name']] for r in records]
+        if missing:
+            self._save()
+        return {number: [tuple(pair) for pair in data['topics'][str(number)]] for number in numbers}
+
+    def sources(self, refresh=False):
+        """
+        Returns the sources of the indicators, downloading their listing the first time
+
+        Parameters
+        ----------
+        refresh: When True, the listing is downloaded again, to find out about recent updates
+
+        Returns
+        ----------
+        Dict
+            Every source ID to its name and the date its data was last updated by the World Bank, as YYYY-MM-DD
+        """
+        self.indicators # Refreshes the catalogue, and with it the sources, when it is out of date
+        data = self._load()
+        if refresh or not data.get('sources'):
+            records = _listing(self.fetcher or get_fetcher(), 'sources')
+            data['sources'] = {str(r['id']): {'name': r.get('name'), 'lastupdated': r.get('lastupdated')} for r in records}
+            self._save()
+        return data['sources']
+
+    def countries(self):
+        """
+        Returns the countries and aggregates of the World Bank API, downloading their listing the first time. If it cannot
+        be downloaded, it is empty for the rest of the session, and requests are not restricted to countries
+
+        Returns
+        ----------
+        Dict
+            Every country name, as in the Country column of wb.get_series, to its code
+        """
+        data = self._load()
+        if data.get('countries') is None:
+            if self._countries_failed:
+                return {}
+            try:
+                records = _listing(self.fetcher or get_fetcher(), 'country')
+            except Exception:
+                self._countries_failed = True
+                return {}
+            data['countries'] = {r['name']: r['id'] for r in records if r.get('name') and r.get('id')}
+            self._save()
+        return data['countries']
+
+    def updated(self, indicator, refresh=False):
+        """
+        Returns the time the World Bank last updated the source of an indicator, in seconds since the epoch, or None if it
+        is not known. The API only gives the day, so this is the start of that day (UTC)
+
+        Parameters
+        ----------
+        indicator: The indicator ID
+        refresh: When True, the listing of sources is downloaded again
+        """
+        source = (self.sources(refresh).get(self.indicators.get(indicator, {}).get('source')) or {})
+        if not source.get('lastupdated'):
+            return None
+        return calendar.timegm(time.strptime(source['lastupdated'][:10], '%Y-%m-%d'))
+
+
+_default_catalog = None
+
+
+def get_catalog(catalog=None):
+    """Returns catalog if it is given, otherwise the default Catalog, which is created on first use"""
+    global _default_catalog
+    if catalog is not None:
+        return catalog
+    if _default_catalog is None:
+        _default_catalog = Catalog()
+    return _default_catalog
+
+
+def set_catalog(catalog):
+    """Sets the Catalog used by the functions in World_Bank_Correlations. None goes back to the default one"""
+    global _default_catalog
+    _default_catalog = catalog
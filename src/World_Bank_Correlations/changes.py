@@ -0,0 +1,81 @@
+"""
+Annual percent changes of the input variable and of World Bank indicators.
+
+Both functions compute the change within each country in one vectorized pass: the rows are stably sorted so that
+each country's rows are together (countries in order of first appearance, rows of a country in their original order),
+and the previous year's value is found with groupby('Country').shift. The result has the same rows, in the same
+order, as building the frame one country at a time. pct_grid computes the same changes for an indicator held as a
+Country x Year grid, as the series stores hold them.
+"""
+import numpy as np
+import pandas as pd
+
+
+def pct_change(frame, col, lag_name, pct_name):
+    """
+    Returns a copy of frame grouped by country, with the lagged value and the annual percent change of one column added
+
+    Parameters
+    ----------
+    frame: A pandas dataframe with a column of countries called "Country," with the rows of each country ordered from the most recent year
+    col: The integer index of the column to compute the percent change of
+    lag_name: The name of the column to hold the value of the following row of the same country (the previous year)
+    pct_name: The name of the column to hold the percent change from the previous year
+
+    Returns
+    ----------
+    Pandas DataFrame
+    """
+    codes, _ = pd.factorize(frame['Country'])
+    order = codes.argsort(kind='stable')
+    out = frame.iloc[order[codes[order] >= 0]].copy() # Rows without a country are dropped
+    values = out.iloc[:, col]
+    out[lag_name] = values.groupby(out['Country'], sort=False).shift(-1)
+    out[pct_name] = ((values - out[lag_name]) / out[lag_name]) * 100
+    return out
+
+
+def pct_chg_dat(data, col):
+    """
+    Returns data with the columns lag_dat and pct_chg_dat holding the annual percent change of the input variable
+
+    Parameters
+    ----------
+    data: A pandas dataframe that contains a column of countries called "Country," a column of years called "Year," and a column of data for a variable
+    col: The integer index of the column in which the data of your variable exists in your dataframe
+
+    Returns
+    ----------
+    Pandas DataFrame
+    """
+    return pct_change(data, col, 'lag_dat', 'pct_chg_dat')
+
+
+def pct_chg_ind(thing):
+    """
+    Returns the data of a World Bank indicator with the columns lag_ind and pct_chg_ind holding its annual percent change
+
+    Parameters
+    ----------
+    thing: The output of wb.get_series (or of a series store) for an indicator, either as a Series or as a dataframe with or without its index reset
+
+    Returns
+    ----------
+    Pandas DataFrame
+    """
+    if 'Country' not in getattr(thing, 'columns', []):
+        thing = pd.DataFrame(thing).reset_index()
+    return pct_change(thing, 3, 'lag_ind', 'pct_chg_ind')
+
+
+def pct_grid(values):
+    """
+    Returns the annual percent changes of a Country x Year grid whose years are ordered from the most recent,
+    computed as pct_chg_ind does: the change from the following column, NaN in the last column. values may have
+    leading axes, such as the indicators of a panel, and the changes are taken along its last axis
+    """
+    out = np.full(values.shape, np.nan)
+    lag = values[..., 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[..., :-1] = ((values[..., :-1] - lag) / lag) * 100
+    return out
@@ -0,0 +1,115 @@
+"""
+Checkpoints of long indicator scans.
+
+A Checkpoint records the statistics of every indicator a scan has finished in a JSON file. The file is rewritten every
+few seconds through a temporary file and os.replace, so it always holds a complete checkpoint even if the scan is killed
+while writing. Scanning again with the same file skips the indicators already in it, so after the series store has
+downloaded some indicators again (see World_Bank_Correlations.store.SeriesStore.refresh), removing them from the file
+with invalidate brings the results of the scan up to date by recomputing only them.
+"""
+import os
+import json
+import time
+import hashlib
+
+import pandas as pd
+
+
+def fingerprint(data, col):
+    """Returns a hash of the Country and Year columns of data and of the column col (or list of columns), which identifies the input of a scan"""
+    frame = pd.concat([data['Country'].astype(str), data['Year'].astype(str),
+                       data.iloc[:, col if type(col) == list else [col]].astype('float64')], axis=1)
+    return hashlib.sha1(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes()).hexdigest()
+
+
+class Checkpoint:
+    """
+    The statistics of the indicators that a scan has finished, kept in a JSON file
+
+    Parameters
+    ----------
+    path: The path of the checkpoint file. It is created if it does not exist
+    key: A dict describing the scan, such as the function, the topic, change and the fingerprint of the data. A file
+        written by a scan with a different key is refused, since its statistics do not answer this one
+    every: The number of seconds between writes of the file
+    variables: The number of rows of every indicator, one for each input variable of the scan. An indicator is finished
+        once all of its rows are recorded
+    """
+
+    def __init__(self, path, key, every=30, variables=1):
+        self.path = path
+        self.key = key
+        self.every = every
+        self.variables = variables
+        self.rows = []
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            assert saved['key'] == key, "resume must be a checkpoint of the same scan (the same function, topic, change setting and data), but " + path + " was written by " + str(saved['key'])
+            self.rows = saved['rows']
+        counts = {}
+        for row in self.rows:
+            counts[row['id']] = counts.get(row['id'], 0) + 1
+        self.done = set(indicator for indicator, n in counts.items() if n >= variables)
+        self.rows = [row for row in self.rows if row['id'] in self.done] # Files of earlier versions can hold some of the rows of an indicator
+        self._counts = {} # The number of rows recorded of the indicators that are not finished
+        self._written = time.monotonic()
+
+    def __contains__(self, indicator):
+        return indicator in self.done
+
+    def add(self, row):
+        """
+        Records a row of the statistics of an indicator, which is finished once it has a row for every variable, writing the file
+        if it was last written every seconds ago
+        """
+        self.rows.append(row)
+        n = self._counts.get(row['id'], 0) + 1
+        if n < self.variables:
+            self._counts[row['id']] = n
+        else:
+            self._counts.pop(row['id'], None)
+            self.done.add(row['id'])
+        if time.monotonic() - self._written >= self.every:
+            self.write()
+
+    def discard(self, indicators):
+        """Forgets the statistics of indicators, so that a scan resumed from this checkpoint computes them again"""
+        indicators = set(indicators)
+        self.rows = [row for row in self.rows if row['id'] not in indicators]
+        self.done -= indicators
+        for indicator in indicators:
+            self._counts.pop(indicator, None)
+
+    def write(self):
+        """Writes the file atomically, with the rows of the finished indicators only"""
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        rows = [row for row in self.rows if row['id'] not in self._counts] if self._counts else self.rows
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'key': self.key, 'rows': rows}, f)
+        os.replace(self.path + '.tmp', self.path)
+        self._written = time.monotonic()
+
+
+def invalidate(path, indicators):
+    """
+    Removes the statistics of indicators from the checkpoint file path, whatever scan wrote it
+
+    Parameters
+    ----------
+    path: The path of a checkpoint file, as given to resume=
+    indicators: The indicator IDs, such as those returned by World_Bank_Correlations.store.SeriesStore.refresh
+
+    Returns
+    ----------
+    Integer
+        The number of indicators removed
+    """
+    with open(path) as f:
+        key = json.load(f)['key']
+    checkpoint = Checkpoint(path, key)
+    before = len(checkpoint.done)
+    checkpoint.discard(indicators)
+    checkpoint.write()
+    return before - len(checkpoint.done)
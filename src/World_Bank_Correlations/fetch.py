@@ -0,0 +1,279 @@
+"""
+Downloading from the World Bank API.
+
+A Fetcher requests indicator data from the API with a pooled HTTP session, spaces its requests to each host according
+to a rate limit and retries with exponential backoff when the API answers 429 or 5xx. iter_entries reads many indicators
+through a series store with a bounded pool of threads, so that the network waits of different indicators overlap.
+
+requests, numpy and pandas are imported when they are first needed, so that importing this module is cheap.
+"""
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from . import instrument
+
+WB_API = 'https://api.worldbank.org/v2'
+RETRY_STATUS = (429, 500, 502, 503, 504)
+MAX_WORKERS = 8 # Default number of indicators downloaded at the same time
+
+
+class RateLimiter:
+    """
+    Spaces calls to wait so that they happen at most rate times per second
+
+    Parameters
+    ----------
+    rate: The maximum number of requests per second. None means no limit
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the next request is allowed"""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def host_limiter(url, rate):
+    """Returns the RateLimiter shared by every Fetcher that requests the host of url, setting its rate"""
+    host = urlsplit(url).netloc
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = RateLimiter()
+        _limiters[host].rate = rate
+        return _limiters[host]
+
+
+def series_from_jsonstat(payload, indicator):
+    """
+    Converts a response of the API in the jsonstat format into a Series shaped like the output of wb.get_series
+
+    Parameters
+    ----------
+    payload: The decoded jsonstat response
+    indicator: The indicator ID, used as the name of the Series
+
+    Returns
+    ----------
+    Pandas Series
+        Indexed by Country, Series and Year, with labels rather than codes
+    """
+    import numpy as np
+    import pandas as pd
+    dataset = list(payload.values())[-1]
+    dimension = dataset['dimension']
+    index = []
+    for dim in dimension['id']:
+        category = dimension[dim]['category']
+        codes = sorted(category['index'], key=category['index'].get)
+        index.append(pd.Index([category['label'][code] for code in codes], name=dimension[dim]['label']))
+    index = pd.MultiIndex.from_product(index, names=[level.name for level in index])
+    return pd.Series(np.array(dataset['value'], dtype='float64'), index=index, name=indicator)
+
+
+class Fetcher:
+    """
+    Downloads from the World Bank API. Calling a Fetcher downloads an indicator like wb.get_series, so a Fetcher can be
+    used as the fetch function of a series store.
+
+    Parameters
+    ----------
+    base_url: The root of the API. Defaults to WB_API
+    rate: The maximum number of requests per second to the host of base_url, shared by every Fetcher of that host
+    retries: The number of times a request is retried after a 429 or 5xx answer or a connection error
+    backoff: The wait in seconds before the first retry. It doubles with every retry, unless the API sends Retry-After
+    timeout: The number of seconds to wait for an answer
+    """
+
+    def __init__(self, base_url=None, rate=10, retries=5, backoff=0.5, timeout=60):
+        self.base_url = (base_url or WB_API).rstrip('/')
+        self.limiter = host_limiter(self.base_url, rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __reduce__(self): # A copy sent to another process has its own sessions and rate limit
+        return (Fetcher, (self.base_url, self.limiter.rate, self.retries, self.backoff, self.timeout))
+
+    @property
+    def session(self):
+        """The HTTP session of the current thread, which keeps connections to the API open between requests"""
+        if not hasattr(self._local, 'session'):
+            import requests
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def get(self, path, **params):
+        """
+        Requests base_url/path with the query parameters params and returns the response
+
+        Raises requests.HTTPError once the retries are used up, or straight away for answers that are not worth retrying
+        """
+        import requests
+        url = self.base_url + '/' + path.lstrip('/')
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            stats = instrument.current()
+            if stats is not None and attempt > 0:
+                stats.count('retries')
+            try:
+                with instrument.timer('http'):
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if stats is not None:
+                    stats.count('requests')
+                    stats.count('bytes', len(response.content))
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    response.raise_for_status()
+                    return response
+                wait = response.headers.get('Retry-After')
+                if wait is not None and wait.isdigit():
+                    time.sleep(int(wait))
+                    continue
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def get_json(self, path, **params):
+        """Requests base_url/path in the json format and returns the decoded response"""
+        params.setdefault('format', 'json')
+        response = self.get(path, **params)
+        try:
+            return response.json()
+        except ValueError:
+            raise ValueError('The World Bank API did not return JSON for ' + response.url + ': ' + response.text[:200])
+
+    def get_series(self, indicator, mrv=50, country='all', **params):
+        """
+        Downloads the data of an indicator
+
+        Parameters
+        ----------
+        indicator: The indicator ID
+        mrv: The number of most recent years to download
+        country: The country code, or a list of codes, to download. Defaults to all countries and aggregates
+        params: Other query parameters of the API, such as date
+
+        Returns
+        ----------
+        Pandas Series
+            The same Series that wb.get_series(indicator, mrv=mrv) returns
+        """
+        if isinstance(country, list):
+            country = ';'.join(country)
+        payload = self.get_json('country/' + country + '/indicator/' + indicator, format='jsonstat', mrv=mrv, **params)
+        if isinstance(payload, list): # Errors come back as a message in a list
+            raise ValueError('The World Bank API returned an error for ' + indicator + ': ' + str(payload[0].get('message', payload[0])))
+        return series_from_jsonstat(payload, indicator)
+
+    __call__ = get_series
+
+
+_default_fetcher = None
+
+
+def get_fetcher():
+    """Returns the Fetcher used by the series stores when they are not given a fetch function"""
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = Fetcher()
+    return _default_fetcher
+
+
+def iter_fetched(func, items, max_workers=None):
+    """
+    Calls func on every item with up to max_workers threads, yielding (item, result, error) in the order of items. Each call runs in
+    a copy of the context of the caller, so it records into the Stats the caller collects (see World_Bank_Correlations.instrument)
+
+    Parameters
+    ----------
+    func: The function to call on each item
+    items: An iterable of items
+    max_workers: The number of threads. Defaults to MAX_WORKERS. With 1, items are processed one at a time without threads
+
+    Returns
+    ----------
+    Generator of tuples
+        error is None when func succeeded and result is None when it raised
+    """
+    max_workers = max_workers or MAX_WORKERS
+    if max_workers == 1:
+        for item in items:
+            try:
+                with instrument.timer('fetch'):
+                    result = func(item)
+            except Exception as err:
+                yield item, None, err
+            else:
+                yield item, result, None
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        items = iter(items)
+        for item in items: # Keep a bounded number of calls ahead of the consumer
+            pending.append((item, pool.submit(contextvars.copy_context().run, func, item)))
+            if len(pending) >= 4 * max_workers:
+                break
+        while pending:
+            item, future = pending.popleft()
+            for extra in items:
+                pending.append((extra, pool.submit(contextvars.copy_context().run, func, extra)))
+                break
+            try:
+                with instrument.timer('fetch'):
+                    result = future.result()
+            except Exception as err:
+                yield item, None, err
+            else:
+                yield item, result, None
+
+
+def iter_entries(store, indicators, mrv=50, max_workers=None, scope=None):
+    """
+    Reads indicators through a series store, downloading the missing ones concurrently
+
+    Parameters
+    ----------
+    store: The series store
+    indicators: An iterable of indicator IDs
+    mrv: The number of most recent years to read
+    max_workers: The number of indicators to download at the same time. Defaults to MAX_WORKERS
+    scope: A World_Bank_Correlations.store.Scope to cut the entries down to, and to restrict the downloads to
+
+    Returns
+    ----------
+    Generator of World_Bank_Correlations.store.Entry
+        In the order of indicators. Indicators that could not be read (some listed in the API have since been removed)
+        are skipped
+    """
+    for indicator, entry, error in iter_fetched(lambda x: store.entry(x, mrv=mrv, scope=scope), indicators, max_workers):
+        if error is None:
+            yield entry
+
+
+def iter_series(store, indicators, mrv=50, max_workers=None):
+    """
+    Like iter_entries, but yields (indicator, Series) with each Series shaped like the output of wb.get_series
+    """
+    for indicator, series, error in iter_fetched(lambda x: store.get_series(x, mrv=mrv), indicators, max_workers):
+        if error is None:
+            yield indicator, series
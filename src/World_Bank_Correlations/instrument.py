@@ -0,0 +1,188 @@
+"""
+Instrumentation of the scanning functions.
+
+While a Stats object is being collected (see collect, or stats=True on the functions of World_Bank_Correlations), the
+package records the time spent in each stage of a scan, the requests made to the World Bank API and the bytes they
+returned, the hits and misses of the series store and the latency of every indicator download. When nothing is being
+collected, each instrumented point costs a single lookup of a context variable.
+
+The Stats being collected belong to a context (see contextvars), so calls collected at the same time in different threads
+or tasks each record only their own measurements. The download threads of a scan run in a copy of the context of the
+scan (see World_Bank_Correlations.fetch.iter_fetched), and so record into its Stats.
+"""
+import time
+import logging
+import threading
+import functools
+import contextvars
+from bisect import bisect_left
+
+logger = logging.getLogger('World_Bank_Correlations')
+
+# Upper bounds in seconds of the bins of the latency histograms
+LATENCY_BINS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 60, float('inf'))
+
+_current = contextvars.ContextVar('World_Bank_Correlations.stats', default=None)
+
+
+class Stats:
+    """
+    Measurements of a scan
+
+    Parameters
+    ----------
+    callback: A function called as callback(name, value) for every measurement: the name of a stage and its seconds, the
+        name of a counter and its increment, or 'latency' and the seconds of an indicator download
+
+    Attributes
+    ----------
+    stages: Dict of the name of every stage to its total seconds and the number of times it ran. The stages are catalog (indicator
+        and topic listings), search, fetch (waiting for indicators to be read or downloaded), http (the requests themselves, summed over
+        threads), prepare (the input data), prescreen, merge (aligning indicators to the input), change (percent changes), correlation and sort
+    counters: Dict of requests, bytes, retries, cache_hits and cache_misses, and of the indicators a prescreen drops, screened_out
+        and sampled_out (see World_Bank_Correlations.kernel.Sampler), when there is one
+    latencies: Dict of the upper bound in seconds of every bin of LATENCY_BINS to the number of indicator downloads in it
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = {}
+        self.counters = {'requests': 0, 'bytes': 0, 'retries': 0, 'cache_hits': 0, 'cache_misses': 0}
+        self.latencies = dict.fromkeys(LATENCY_BINS, 0)
+        self._lock = threading.Lock()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            total = self.stages.setdefault(stage, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+        if self.callback is not None:
+            self.callback(stage, seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        if self.callback is not None:
+            self.callback(name, n)
+
+    def latency(self, seconds):
+        with self._lock:
+            self.latencies[LATENCY_BINS[bisect_left(LATENCY_BINS, seconds)]] += 1
+        if self.callback is not None:
+            self.callback('latency', seconds)
+
+    def merge(self, other):
+        """Adds the measurements of other, such as the Stats of a worker process, to these"""
+        with self._lock:
+            for stage, (seconds, calls) in other.stages.items():
+                total = self.stages.setdefault(stage, [0.0, 0])
+                total[0] += seconds
+                total[1] += calls
+            for name, n in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for bound, n in other.latencies.items():
+                self.latencies[bound] += n
+
+    def __getstate__(self):
+        return {'stages': self.stages, 'counters': self.counters, 'latencies': self.latencies, 'callback': None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        """The share of the indicators read from the series store without downloading them, or None if none were read"""
+        reads = self.counters['cache_hits'] + self.counters['cache_misses']
+        return self.counters['cache_hits'] / reads if reads else None
+
+    def as_dict(self):
+        """Returns the measurements as a dict that can be written as JSON"""
+        return {'stages': {stage: {'seconds': s, 'calls': n} for stage, (s, n) in self.stages.items()},
+                'counters': dict(self.counters), 'hit_rate': self.hit_rate,
+                'latencies': {str(bound): n for bound, n in self.latencies.items() if n}}
+
+    def __repr__(self):
+        lines = ['%-12s %10.3fs %8d' % (stage, s, n) for stage, (s, n) in sorted(self.stages.items(), key=lambda item: -item[1][0])]
+        lines += ['%-12s %10d' % (name, n) for name, n in self.counters.items()]
+        if self.hit_rate is not None:
+            lines.append('%-12s %10.1f%%' % ('hit_rate', 100 * self.hit_rate))
+        return 'Stats\n' + '\n'.join(lines)
+
+
+def current():
+    """Returns the Stats being collected in this context, or None"""
+    return _current.get()
+
+
+class timer:
+    """Context manager adding the time of its block to a stage of the Stats being collected, if any"""
+
+    __slots__ = ('stage', 'start', 'stats')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.stats = _current.get()
+        self.start = time.perf_counter() if self.stats is not None else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.stats is not None:
+            self.stats.add_time(self.stage, time.perf_counter() - self.start)
+
+
+class collect:
+    """
+    Context manager that collects Stats of everything the package does inside it
+
+    Parameters
+    ----------
+    callback: A function called as callback(name, value) for every measurement (see Stats)
+    log: When True, every measurement is logged at the DEBUG level and the summary at the INFO level on the logger
+        World_Bank_Correlations
+
+    Examples
+    ----------
+    >>> with collect() as stats:
+    ...     wb_topic_corrs(my_df, 2, 'Health')
+    >>> stats.stages['fetch']
+    """
+
+    def __init__(self, callback=None, log=False):
+        if log:
+            user_callback = callback
+            def callback(name, value):
+                logger.debug('%s %s', name, value)
+                if user_callback is not None:
+                    user_callback(name, value)
+        self.log = log
+        self.stats = Stats(callback)
+
+    def __enter__(self):
+        self._token = _current.set(self.stats)
+        self._start = time.perf_counter()
+        return self.stats
+
+    def __exit__(self, *exc):
+        self.stats.add_time('total', time.perf_counter() - self._start)
+        _current.reset(self._token)
+        if self.log:
+            logger.info('%r', self.stats)
+
+
+def instrumented(func):
+    """
+    Decorator for the functions of World_Bank_Correlations that take stats=. When stats is True, the call is collected and its Stats are
+    put in the attrs of the DataFrame returned, as result.attrs['stats']
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not kwargs.get('stats'):
+            return func(*args, **kwargs)
+        with collect() as stats:
+            result = func(*args, **kwargs)
+        result.attrs['stats'] = stats
+        return result
+    return wrapper
@@ -0,0 +1,711 @@
+"""
+Correlation kernel shared by the functions in World_Bank_Correlations.
+
+The input variable is prepared once: its (Country, Year) keys and values, and the keys and values of its annual percent
+changes. Indicators are then handled a chunk at a time. Each chunk is gathered into a matrix with one column per
+indicator, aligned to the rows of the input data, and the pairwise-complete Pearson correlation, the number of
+observations and the t score of every column are computed together with NaN-aware array sums.
+
+In low-memory mode the keys are coded with the smallest integer types, the values are float32 and each chunk is gathered
+into the same preallocated matrix, so the memory taken by a scan does not depend on the number of indicators.
+
+A scan can screen indicators before computing their statistics. The presence bitmaps kept by the stores (see
+World_Bank_Correlations.store.Coverage) give the n of an indicator without its values, which rejects those that cannot
+pass nlim, and a Sampler correlates the indicators over a coarser grid of years to drop those far from the strongest.
+
+With lags, every indicator is also read some years before or after the year of each row, by looking the rows up in its
+grid at shifted years, and all of the lags of a chunk of indicators are gathered into one matrix and correlated
+together. Rolling correlations over windows of consecutive years come from sums of the aligned matrix by year.
+
+Besides Pearson, the correlation can be Spearman's, Kendall's tau-b or a winsorized Pearson (see correlate). They are
+computed on the same aligned matrix: every column is masked to the rows it shares with the input, and the masked
+matrices are ranked, counted or clipped column by column in a few array operations.
+"""
+import heapq
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from .changes import pct_chg_dat, pct_grid
+
+CHUNK = 256 # Number of indicators gathered into one matrix
+STREAM_CHUNK = 32 # The same while downloading, so that results come out as the indicators arrive
+SAMPLE_STEP = 3 # A Sampler keeps one year of the input data in SAMPLE_STEP
+SAMPLE_KEEP = 20 # and lets through the indicators among the SAMPLE_KEEP * k strongest on those years so far
+METHODS = ('pearson', 'spearman', 'kendall', 'winsorized') # The correlations of correlate
+WINSOR = 0.05 # The share of the values at each end that a winsorized correlation clips to the quantile
+
+
+def pearson(x, Y):
+    """
+    Returns the Pearson correlation of x with every column of Y, using the rows where both are present
+
+    Parameters
+    ----------
+    x: A 1-D array of floats with one value per row
+    Y: A 2-D array of floats with one column per indicator and one row per value of x
+
+    Returns
+    ----------
+    Tuple of arrays
+        The correlations and the number of rows used for each column. Columns with fewer than two rows, or without
+        variation, have a correlation of NaN, as with pandas.Series.corr
+    """
+    valid = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+    n = valid.sum(axis=0)
+    X = np.where(valid, x[:, None], 0.0)
+    Y = np.where(valid, Y, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dx = np.where(valid, X - (X.sum(axis=0) / n).astype(X.dtype, copy=False), 0.0) # Float32 stays float32
+        dy = np.where(valid, Y - (Y.sum(axis=0) / n).astype(Y.dtype, copy=False), 0.0)
+        r = (dx * dy).sum(axis=0) / np.sqrt((dx * dx).sum(axis=0) * (dy * dy).sum(axis=0))
+    return np.clip(r, -1, 1), n
+
+
+def pearson_matrix(X, Y):
+    """
+    Returns the Pearson correlation of every column of X with every column of Y, using for each pair the rows where both
+    are present, computed with matrix products of the masked sums
+
+    Parameters
+    ----------
+    X: A 2-D array of floats with one column per input variable
+    Y: A 2-D array of floats with one column per indicator and the same rows as X
+
+    Returns
+    ----------
+    Tuple of arrays
+        The correlations and the numbers of rows used, with one row per column of X and one column per column of Y
+    """
+    vx, vy = ~np.isnan(X), ~np.isnan(Y)
+    with warnings.catch_warnings(): # Columns without values have a mean of NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        X = np.where(vx, X - np.nanmean(X, axis=0), 0.0) # Centering first keeps the sums of squares small
+        Y = np.where(vy, Y - np.nanmean(Y, axis=0), 0.0)
+    fx, fy = vx.astype(X.dtype), vy.astype(Y.dtype)
+    tol = max(1e-12, 100 * np.finfo(Y.dtype).eps) # Below this share of the sum of squares, a column is taken as constant
+    n = fx.T @ fy
+    sx, sy = X.T @ fy, fx.T @ Y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxy = X.T @ Y - sx * sy / n
+        sxx = (X * X).T @ fy - sx * sx / n
+        syy = fx.T @ (Y * Y) - sy * sy / n
+        r = sxy / np.sqrt(sxx * syy)
+        r = np.where((sxx <= tol * ((X * X).T @ fy)) | (syy <= tol * (fx.T @ (Y * Y))), np.nan, r) # No variation
+    return np.clip(r, -1, 1), n.round().astype('int64')
+
+
+def pearson_columns(X, Y):
+    """Returns the Pearson correlation of every column of X with the same column of Y, which are NaN in the same places, and the number of values of each"""
+    valid = ~np.isnan(Y)
+    n = valid.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dx = np.where(valid, X - np.nansum(X, axis=0) / n, 0.0)
+        dy = np.where(valid, Y - np.nansum(Y, axis=0) / n, 0.0)
+        sxx, syy = (dx * dx).sum(axis=0), (dy * dy).sum(axis=0)
+        r = (dx * dy).sum(axis=0) / np.sqrt(sxx * syy)
+        tol = max(1e-12, 100 * np.finfo(Y.dtype).eps)
+        r = np.where((sxx <= tol * np.nansum(X * X, axis=0)) | (syy <= tol * np.nansum(Y * Y, axis=0)), np.nan, r) # No variation
+    return np.clip(r, -1, 1), n
+
+
+def _ranks(A):
+    """Returns the average ranks of the values of every column of A, from 1, keeping NaN where they are"""
+    return pd.DataFrame(A).rank().to_numpy(dtype=A.dtype)
+
+
+def _winsorized(A):
+    """Returns every column of A with the values beyond its WINSOR and 1 - WINSOR quantiles set to those quantiles"""
+    if A.shape[0] == 0:
+        return A
+    with warnings.catch_warnings(): # Columns without values have quantiles of NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanquantile(A, [WINSOR, 1 - WINSOR], axis=0)
+    return np.clip(A, low.astype(A.dtype), high.astype(A.dtype))
+
+
+def _ties(keys, cols, size):
+    """Returns, for each column, the sum of t(t-1)/2 over the runs of t equal consecutive keys, for keys sorted within each column"""
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = (keys[1:] != keys[:-1]) | (cols[1:] != cols[:-1])
+    starts = np.flatnonzero(first)
+    t = np.diff(np.append(starts, len(keys))).astype('float64')
+    return np.bincount(cols[starts], weights=t * (t - 1) / 2, minlength=size)
+
+
+def kendall(X, Y):
+    """
+    Returns Kendall's tau-b of every column of X with the same column of Y, which are NaN in the same places, and the
+    number of values of each. Within every column the pairs are sorted by X and the discordant pairs are the inversions
+    of Y, counted by a merge sort that runs on every column at once, in log2(n) passes of array operations
+    """
+    size = Y.shape[1]
+    X, Y = np.ascontiguousarray(X.T, dtype='float64'), np.ascontiguousarray(Y.T, dtype='float64') # One column per row, for sorting
+    n = (~np.isnan(Y)).sum(axis=1)
+    inside = np.arange(Y.shape[1]) < n[:, None] # The values of every column come first once it is sorted, and NaN last
+    cols = np.repeat(np.arange(size), n)
+    by_y = np.argsort(Y, axis=1, kind='stable')
+    by_xy = np.take_along_axis(by_y, np.argsort(np.take_along_axis(X, by_y, axis=1), axis=1, kind='stable'), axis=1)
+    ys = np.take_along_axis(Y, by_y, axis=1)[inside]
+    xs, xys = np.take_along_axis(X, by_xy, axis=1)[inside], np.take_along_axis(Y, by_xy, axis=1)[inside]
+    ties_x, ties_y = _ties(xs, cols, size), _ties(ys, cols, size)
+    joint = np.ones(len(xs), dtype='int64') # Numbers the runs of equal pairs
+    joint[1:] = (xs[1:] != xs[:-1]) | (xys[1:] != xys[:-1])
+    ties_xy = _ties(np.cumsum(joint), cols, size)
+    step = np.ones(len(ys), dtype='int64')
+    step[1:] = ys[1:] != ys[:-1]
+    dense = np.zeros(Y.shape, dtype='int64') # The rank of Y among the distinct values of its column, increasing from column to column
+    dense[np.arange(size).repeat(n), by_y[inside]] = np.cumsum(step)
+    rank = dense[cols, by_xy[inside]]
+    position = np.arange(len(cols)) - np.append(0, np.cumsum(n))[cols] # The position of every value within its column
+    span, most = len(ys) + 2, int(n.max()) if size else 0
+    swaps = np.zeros(size)
+    width = 1
+    while width < most:
+        run = position // width
+        group = cols * (most // width + 2) + run // 2 # Pairs of neighbouring runs, each sorted by rank
+        merged = np.argsort(group * span + rank, kind='stable') # Ties keep the left run first
+        group, is_left = group[merged], (run % 2 == 0)[merged]
+        first = np.ones(len(group), dtype=bool)
+        first[1:] = group[1:] != group[:-1]
+        pair = np.cumsum(first) - 1
+        before = np.cumsum(is_left) - is_left # Left values before each value
+        seen = before - before[np.flatnonzero(first)][pair] # Left values of its pair before it
+        greater = np.bincount(pair, weights=is_left)[pair] - seen # Left values of its pair after it, which are greater
+        swaps += np.bincount(cols[~is_left], weights=greater[~is_left], minlength=size) # The order within a column is kept, so cols is too
+        rank = rank[merged]
+        width *= 2
+    total = n * (n - 1) / 2.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = (total - ties_x - ties_y + ties_xy - 2 * swaps) / np.sqrt((total - ties_x) * (total - ties_y))
+    return np.clip(tau, -1, 1), n
+
+
+def correlate(x, Y, method='pearson'):
+    """
+    Returns the correlation of x with every column of Y by method, using the rows where both are present
+
+    Parameters
+    ----------
+    x: A 1-D array of floats with one value per row, or a 2-D array with one column per input variable
+    Y: A 2-D array of floats with one column per indicator and one row per value of x
+    method: 'pearson', 'spearman' (Pearson of the average ranks of the rows both have), 'kendall' (tau-b) or 'winsorized'
+        (Pearson once the values of the rows both have beyond their WINSOR and 1 - WINSOR quantiles are clipped to them)
+
+    Returns
+    ----------
+    Tuple of arrays
+        The correlations and the numbers of rows used, as pearson returns them, or as pearson_matrix if x is 2-D
+    """
+    if method == 'pearson':
+        return pearson(x, Y) if x.ndim == 1 else pearson_matrix(x, Y)
+    if x.ndim == 2:
+        found = [correlate(x[:, i], Y, method) for i in range(x.shape[1])]
+        return np.array([r for r, n in found]).reshape(x.shape[1], Y.shape[1]), np.array([n for r, n in found], dtype='int64').reshape(x.shape[1], Y.shape[1])
+    valid = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+    X = np.where(valid, x[:, None], np.nan).astype(Y.dtype, copy=False)
+    Y = np.where(valid, Y, np.nan)
+    if method == 'kendall':
+        return kendall(X, Y)
+    if method == 'spearman':
+        return pearson_columns(_ranks(X), _ranks(Y))
+    return pearson_columns(_winsorized(X), _winsorized(Y))
+
+
+def t_stat(r, n):
+    """Returns the t scores r*sqrt((n-2)/(1-r^2)) of correlations r over n observations, NaN where r is 1 or -1"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = r * np.sqrt((n - 2) / (1 - r * r))
+    return np.where(np.abs(r) == 1, np.nan, t)
+
+
+def _lookup(codes, uniques, labels):
+    """Returns the position in labels of the label of each code, -1 where it is missing or the code is -1"""
+    found = np.append(pd.Index(labels).get_indexer(uniques), -1) # A code of -1 picks the last element
+    return found[codes]
+
+
+class Keys:
+    """
+    The (Country, Year) keys of the rows of the input data, coded as integers once: the distinct countries and years are
+    numbered, and every row holds the numbers of its country and year. Finding the rows in the grid of an indicator
+    only looks up the distinct countries and years, after which the flat position of every row in the grid is an array
+    gather. Grids whose countries and years are the same objects (see World_Bank_Correlations.store.layout) share their
+    positions, which are computed once.
+
+    Parameters
+    ----------
+    countries: The country of each row, as strings
+    years: The year of each row, as strings
+    low_memory: When True, the codes are those of a Categorical, which takes the smallest integer type (int16 for the
+        years and at most int16 for the countries), and every gather writes into the same float32 matrix, so the
+        matrix returned by gather is only valid until the next gather
+    """
+
+    def __init__(self, countries, years, low_memory=False):
+        self.low_memory = low_memory
+        if low_memory:
+            countries, years = pd.Categorical(countries), pd.Categorical(years)
+            self.country_codes, self.countries = countries.codes, countries.categories
+            self.year_codes, self.years = years.codes.astype('int16'), years.categories
+        else:
+            self.country_codes, self.countries = pd.factorize(pd.Index(countries))
+            self.year_codes, self.years = pd.factorize(pd.Index(years))
+        self._positions = {}
+        self._shifted = {}
+        self._buffer = None
+
+    def __len__(self):
+        return len(self.country_codes)
+
+    def _years(self, lag):
+        """Returns the distinct years moved back by lag years. Years that are not numbers are not found in any grid once moved"""
+        if lag == 0:
+            return self.years
+        if lag not in self._shifted:
+            self._shifted[lag] = pd.Index([str(int(y) - lag) if str(y).isdigit() else '' for y in self.years])
+        return self._shifted[lag]
+
+    def positions(self, countries, years, lag=0):
+        """
+        Returns the flat position in a grid of each key found in it, and a mask of the keys found. With a lag, the year
+        of every key is moved back by lag years first, so the positions are those of the value lag years earlier
+        """
+        cached = self._positions.get((id(countries), id(years), lag))
+        if cached is None or cached[0] is not countries or cached[1] is not years: # The objects are kept, so their ids are not reused
+            if len(self._positions) > 64:
+                self._positions.clear()
+            ci = _lookup(self.country_codes, self.countries, countries)
+            yi = _lookup(self.year_codes, self._years(lag), years)
+            found = (ci >= 0) & (yi >= 0)
+            cached = (countries, years, ci[found] * len(years) + yi[found], found)
+            self._positions[(id(countries), id(years), lag)] = cached
+        return cached[2], cached[3]
+
+    def gather(self, grids, lags=(0,)):
+        """
+        Returns a matrix with one column per (countries, years, values) grid, holding the value at each key. With several
+        lags, the columns of every grid at the first lag come first, then those at the second, and so on
+        """
+        width = len(grids) * len(lags)
+        if not self.low_memory:
+            Y = np.full((len(self), width), np.nan)
+        else:
+            if self._buffer is None or self._buffer.shape[1] < width:
+                self._buffer = np.empty((len(self), width), dtype='float32', order='F') # Column-major, so the first columns are contiguous
+            Y = self._buffer[:, :width]
+            Y.fill(np.nan)
+        for i, lag in enumerate(lags):
+            for j, (countries, years, values) in enumerate(grids):
+                flat, found = self.positions(countries, years, lag)
+                Y[found, i * len(grids) + j] = np.take(values, flat)
+        return Y
+
+
+class Prepared:
+    """
+    The input variable, prepared once for every indicator it is correlated with
+
+    Parameters
+    ----------
+    data: A pandas dataframe that contains a column of countries called "Country," a column of years called "Year," and a column of data for a variable
+    col: The integer index of the column in which the data of your variable exists in your dataframe, or a list of such indices
+    change: A Boolean value. When set to True, the annual percent changes of the variable are prepared as well
+    low_memory: A Boolean value. When set to True, the keys are coded compactly, the values and the correlations are float32 and
+        every chunk is gathered into the same matrix (see Keys). The statistics then differ from those in float64 in about the
+        sixth significant digit
+    lags: A list of integer lags, or None. The input variable in each year is correlated with every indicator that many years
+        before (after, for negative lags), and the statistics are those of the lag with the largest absolute t score, given
+        in Lag (and Lag_change). Only the lags with more than nlim observations are candidates, and a perfect correlation
+        beats any t score only over more than two observations, the largest n first
+    method: The correlation, one of METHODS (see correlate)
+    nlim: The minimum n of a lag, exclusive. Does not apply without lags
+    """
+
+    def __init__(self, data, col, change=False, low_memory=False, lags=None, method='pearson', nlim=1):
+        self.change = change
+        self.low_memory = low_memory
+        self.lags = list(lags) if lags is not None else None
+        self.method = method
+        self.nlim = nlim
+        self.variables = [data.columns[c] for c in col] if type(col) == list else None
+        dtype = 'float32' if low_memory else 'float64'
+        with instrument.timer('prepare'):
+            self.keys = Keys(data['Country'].astype(str), data['Year'].astype(str), low_memory)
+            self.x = data.iloc[:, col].to_numpy(dtype=dtype)
+        if change:
+            with instrument.timer('change'):
+                mumbos = [pct_chg_dat(data, c) for c in (col if type(col) == list else [col])] # The rows are the same for every column
+                self.keys_change = Keys(mumbos[0]['Country'].astype(str), mumbos[0]['Year'].astype(str), low_memory)
+                self.x_change = np.column_stack([mumbo['pct_chg_dat'].to_numpy(dtype=dtype) for mumbo in mumbos])
+                if self.variables is None:
+                    self.x_change = self.x_change[:, 0]
+
+    def overlap(self, coverages):
+        """
+        Returns the n that stats would give for stored grids, n_change if change is True, from their presence bitmaps alone
+
+        Parameters
+        ----------
+        coverages: A list of World_Bank_Correlations.store.Coverage
+
+        Returns
+        ----------
+        Array of integers
+            One value per coverage, or one row per variable and one column per coverage if col is a list
+        """
+        keys, x = (self.keys_change, self.x_change) if self.change else (self.keys, self.x)
+        present = ~np.isnan(x)
+        n = np.zeros((len(coverages),) + present.shape[1:], dtype='int64')
+        for j, (countries, years, bits) in enumerate(coverages):
+            size = len(countries) * len(years)
+            grid = np.unpackbits(bits, count=2 * size)[size:] if self.change else np.unpackbits(bits, count=size) # The bits of the changes follow those of the values
+            for lag in self.lags or [0]: # The most of any lag, which is at least that of the lag stats picks
+                flat, found = keys.positions(countries, years, lag)
+                both = present[found][grid[flat].astype(bool)]
+                n[j] = np.maximum(n[j], np.count_nonzero(both, axis=0))
+        return n.T
+
+    def _correlate(self, x, Y):
+        return correlate(x, Y, self.method)
+
+    def _statistics(self, r, n, suffix):
+        """Returns the statistics of correlations r over n observations, keeping for every entry those of its best lag if there are lags"""
+        t = t_stat(r, n)
+        if self.lags is None:
+            return {'Correlation' + suffix: r, 'n' + suffix: n, 't' + suffix: t}
+        shape = r.shape[:-1] + (len(self.lags), -1) # The columns of every lag follow each other (see Keys.gather)
+        r, n, t = r.reshape(shape), n.reshape(shape), t.reshape(shape)
+        strength = np.where((np.abs(r) == 1) & (n > 2), np.inf, np.abs(t)) # A perfect correlation has no t score. Over two observations, every correlation is
+        strength = np.where(np.isnan(strength) | (n <= max(self.nlim, 2)), -1, strength) # Thin lags only win when no lag passes nlim
+        top = strength == strength.max(axis=-2, keepdims=True)
+        best = np.expand_dims(np.where(top, n, -1).argmax(axis=-2), -2) # Of the lags as strong as the strongest, the one with the most observations
+        out = {name + suffix: np.take_along_axis(a, best, axis=-2)[..., 0, :] for name, a in (('Correlation', r), ('n', n), ('t', t))}
+        out['Lag' + suffix] = np.asarray(self.lags, dtype='int64')[best[..., 0, :]]
+        return out
+
+    def stats(self, entries):
+        """
+        Returns the statistics of a list of entries (see World_Bank_Correlations.store.Entry) as a dict of arrays with
+        the keys Correlation, n and t, and Correlation_change, n_change and t_change if change is True, with Lag (and
+        Lag_change) after them if there are lags. The arrays have one value per entry, or one row per variable and one
+        column per entry if col is a list
+        """
+        lags = self.lags or [0]
+        step = max(CHUNK // len(lags), 1) # Every lag is a column, so fewer entries go in one matrix
+        if len(entries) > step:
+            parts = [self.stats(entries[i:i + step]) for i in range(0, len(entries), step)]
+            return {column: np.concatenate([part[column] for part in parts], axis=-1) for column in parts[0]}
+        out = {}
+        with instrument.timer('merge'):
+            Y = self.keys.gather([(e.countries, e.years, e.values) for e in entries], lags)
+        with instrument.timer('correlation'):
+            out.update(self._statistics(*self._correlate(self.x, Y), ''))
+        if self.change:
+            with instrument.timer('change'):
+                grids = [(e.countries, e.years, pct_grid(e.values) if e.changes is None else e.changes) for e in entries] # Stores hold them already
+            with instrument.timer('merge'):
+                Y = self.keys_change.gather(grids, lags)
+            with instrument.timer('correlation'):
+                out.update(self._statistics(*self._correlate(self.x_change, Y), '_change'))
+        return out
+
+    def rolling(self, entries, window):
+        """
+        Returns the correlations of the input variable with every entry over each window of window consecutive years, from
+        running sums by year of the aligned matrix, so every window of every entry is computed at once. Lags are not applied,
+        and the correlations are Pearson's whatever the method
+
+        Parameters
+        ----------
+        entries: A list of World_Bank_Correlations.store.Entry
+        window: The number of years in a window
+
+        Returns
+        ----------
+        Dict of arrays
+            Year, the last year of every window, and Correlation, n and t with one row per window and one column per entry,
+            and Correlation_change, n_change and t_change if change is True. Windows run from the first year of the input
+            data to the last, and the annual percent changes use the same windows
+        """
+        assert self.variables is None, "rolling correlations take a single column"
+        years = [int(y) for y in self.keys.years if str(y).isdigit()]
+        first, last = min(years), max(years)
+        out = {'Year': np.arange(first + window - 1, last + 1)}
+        with instrument.timer('merge'):
+            Y = self.keys.gather([(e.countries, e.years, e.values) for e in entries])
+        with instrument.timer('correlation'):
+            r, n = _rolling(self.x, Y, _year_positions(self.keys, first), last - first + 1, window)
+            out['Correlation'], out['n'], out['t'] = r, n, t_stat(r, n)
+        if self.change:
+            grids = [(e.countries, e.years, pct_grid(e.values) if e.changes is None else e.changes) for e in entries]
+            with instrument.timer('merge'):
+                Y = self.keys_change.gather(grids)
+            with instrument.timer('correlation'):
+                r, n = _rolling(self.x_change, Y, _year_positions(self.keys_change, first), last - first + 1, window)
+                out['Correlation_change'], out['n_change'], out['t_change'] = r, n, t_stat(r, n)
+        return out
+
+
+def _year_positions(keys, first):
+    """Returns the number of years from first to the year of every key, -1 where the year is not a number"""
+    found = np.array([int(y) - first if str(y).isdigit() else -1 for y in keys.years] + [-1]) # A code of -1 picks the last element
+    return found[keys.year_codes]
+
+
+def _rolling(x, Y, year, size, window):
+    """
+    Returns the Pearson correlations of x with every column of Y over every window of consecutive years, and their n,
+    with one row per window. year is the position of the year of every row among the size years. The sums of every year
+    are matrix products with a one-hot matrix of the years, and those of every window differences of their running totals
+    """
+    valid = ~np.isnan(Y) & ~np.isnan(x)[:, None] & (year >= 0)[:, None]
+    with warnings.catch_warnings(): # Columns without values have a mean of NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        X = np.where(valid, (x - np.nanmean(x))[:, None], 0.0) # Centering first keeps the sums of squares small
+        Y = np.where(valid, Y - np.nanmean(Y, axis=0), 0.0)
+    onehot = np.zeros((size, len(x)), dtype=Y.dtype)
+    onehot[year[year >= 0], np.arange(len(x))[year >= 0]] = 1
+    sums = [np.concatenate([np.zeros((1, Y.shape[1]), dtype=Y.dtype), np.cumsum(onehot @ a, axis=0)])
+            for a in (valid.astype(Y.dtype), X, Y, X * X, Y * Y, X * Y)]
+    n, sx, sy, sxx, syy, sxy = [s[window:] - s[:-window] for s in sums]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vxx, vyy = sxx - sx * sx / n, syy - sy * sy / n
+        r = (sxy - sx * sy / n) / np.sqrt(vxx * vyy)
+        tol = max(1e-12, 100 * np.finfo(Y.dtype).eps) # Below this share of the sum of squares, a window is taken as constant
+        r = np.where((vxx <= tol * sxx) | (vyy <= tol * syy) | (n < 2), np.nan, r)
+    return np.clip(r, -1, 1), n.round().astype('int64')
+
+
+def screen(prepared, coverages, nlim):
+    """
+    Returns whether each indicator can pass nlim, going by its coverage (see Prepared.overlap), as a list of Booleans. An
+    indicator whose coverage is None, as it is not stored yet, passes. With several variables, an indicator passes if it
+    can pass for one of them
+    """
+    stored = [coverage for coverage in coverages if coverage is not None]
+    passing = iter((np.atleast_2d(prepared.overlap(stored)) > nlim).any(axis=0).tolist())
+    out = [coverage is None or next(passing) for coverage in coverages]
+    stats = instrument.current()
+    if stats is not None:
+        stats.count('screened_out', out.count(False))
+    return out
+
+
+class Sampler:
+    """
+    Approximate first stage of a scan. The correlations of the input variable with a chunk of entries are computed over a
+    coarser grid of years, one year of the input data in step, and only the entries whose correlation is among the keep
+    strongest so far go on to the statistics of Prepared.stats. The correlations of the annual percent changes are not
+    approximated, so with change=True an entry goes on by the correlation of its values
+
+    Parameters
+    ----------
+    data: A pandas dataframe that contains a column of countries called "Country," a column of years called "Year," and a column of data for a variable
+    col: The integer index of the column in which the data of your variable exists in your dataframe, or a list of such indices
+    keep: The number of the strongest entries so far that go on
+    step: The years of the input data are sorted and one in step is kept
+    lags: The lags of the scan (see Prepared), which the correlations on the years kept are taken at as well
+    method: The correlation of the scan (see correlate), which is approximated with the same method
+    """
+
+    def __init__(self, data, col, keep, step=SAMPLE_STEP, lags=None, method='pearson'):
+        years = pd.Index(data['Year'].astype(str))
+        kept = pd.Index(sorted(years.unique()))[::step]
+        self.prepared = Prepared(data[years.isin(kept)], col, low_memory=True, lags=lags, method=method) # Float32 is enough for a first stage
+        self.keep = keep
+        self._heap = []
+
+    def filter(self, entries, chunk=CHUNK):
+        """Yields the entries that go on, in their order, judging them a chunk at a time"""
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) == chunk:
+                yield from self._survivors(batch)
+                batch = []
+        if batch:
+            yield from self._survivors(batch)
+
+    def _survivors(self, batch):
+        with instrument.timer('prescreen'):
+            r = np.abs(self.prepared.stats(batch)['Correlation'])
+            if r.ndim == 2: # The strongest of the variables
+                r = np.fmax.reduce(r, axis=0)
+        out = []
+        for entry, strength in zip(batch, r.tolist()):
+            if len(self._heap) < self.keep:
+                heapq.heappush(self._heap, -1.0 if strength != strength else strength) # NaN when the years kept have under two observations
+            elif strength == strength and strength >= self._heap[0]:
+                heapq.heapreplace(self._heap, strength)
+            else:
+                continue
+            out.append(entry)
+        stats = instrument.current()
+        if stats is not None:
+            stats.count('sampled_out', len(batch) - len(out))
+        return out
+
+
+def _chunks(prepared, entries, chunk):
+    """Yields (batch, stats) for consecutive batches of up to chunk entries, with the stats of Prepared.stats"""
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == chunk:
+            yield batch, prepared.stats(batch)
+            batch = []
+    if batch:
+        yield batch, prepared.stats(batch)
+
+
+def corr_table(data, col, entries, change=False, chunk=CHUNK, lags=None, method='pearson', nlim=1):
+    """
+    Correlates the input variable with every entry
+
+    Parameters
+    ----------
+    data: A pandas dataframe that contains a column of countries called "Country," a column of years called "Year," and a column of data for a variable
+    col: The integer index of the column in which the data of your variable exists in your dataframe, or a list of such indices
+    entries: An iterable of World_Bank_Correlations.store.Entry, such as World_Bank_Correlations.fetch.iter_entries
+    change: A Boolean value. When set to True, the correlations of the annual percent changes are computed as well
+    chunk: The number of entries gathered into one matrix
+    lags: A list of integer lags, or None (see Prepared)
+    method: The correlation, one of METHODS (see correlate)
+    nlim: The minimum n of the lags that are candidates (see Prepared)
+
+    Returns
+    ----------
+    Pandas DataFrame
+        One row per entry, in the order of entries, with the columns id, Indicator (the name of the entry), Correlation,
+        n and t, followed by Correlation_change, n_change and t_change if change is True, with Lag (and Lag_change) if there are lags. If col is a list, one row per
+        variable and entry, the entries of each variable together, with the name of the variable in a first column Variable
+    """
+    prepared = Prepared(data, col, change, lags=lags, method=method, nlim=nlim)
+    ids, names, parts = [], [], []
+    for batch, stats in _chunks(prepared, entries, chunk):
+        parts.append(stats)
+        ids += [e.indicator for e in batch]
+        names += [e.name for e in batch]
+    if not parts:
+        parts.append(prepared.stats([]))
+    if prepared.variables is None:
+        table = pd.DataFrame({'id': ids, 'Indicator': names})
+        for column in parts[0]:
+            table[column] = np.concatenate([part[column] for part in parts])
+        return table
+    table = pd.DataFrame({'Variable': np.repeat(np.array(prepared.variables, dtype=object), len(ids)),
+                          'id': ids * len(prepared.variables), 'Indicator': names * len(prepared.variables)})
+    for column in parts[0]:
+        table[column] = np.concatenate([part[column] for part in parts], axis=1).ravel()
+    return table
+
+
+def iter_stats(data, col, entries, change=False, chunk=CHUNK, low_memory=False, lags=None, method='pearson', nlim=1):
+    """
+    Like corr_table, but yields the statistics of each entry as a dict with the keys of the columns of corr_table, as soon
+    as the chunk holding the entry is computed. With low_memory, the input variable is prepared in low-memory mode (see Prepared)
+    """
+    return iter_rows(Prepared(data, col, change, low_memory, lags, method, nlim), entries, chunk)
+
+
+def iter_rows(prepared, entries, chunk=CHUNK):
+    """Like iter_stats, for an input variable that is already prepared"""
+    for batch, stats in _chunks(prepared, entries, chunk):
+        for j, entry in enumerate(batch):
+            if prepared.variables is None:
+                row = {'id': entry.indicator, 'Indicator': entry.name}
+                for column in stats:
+                    row[column] = stats[column][j].item()
+                yield row
+                continue
+            for i, variable in enumerate(prepared.variables):
+                row = {'Variable': variable, 'id': entry.indicator, 'Indicator': entry.name}
+                for column in stats:
+                    row[column] = stats[column][i, j].item()
+                yield row
+
+
+class TopK:
+    """
+    The k strongest relationships among the rows pushed to it that pass the limits of wb_every, kept in a heap so that
+    only k rows are held however many are pushed
+
+    Parameters
+    ----------
+    k: The number of rows to keep
+    change: A Boolean value. When set to True, the limits and the ordering apply to the correlation of the annual percent changes
+    nlim: The minimum n, exclusive
+    cor_lim: The minimum absolute value of the correlation, exclusive
+    t_lim: The minimum absolute value of the t score, exclusive. Not applied if 0
+    variables: The names of the input variables when there are several (see Prepared). The k strongest relationships of
+        each variable are kept, going by the Variable of each row
+    lags: The lags of the scan (see Prepared), or None. With lags, the table has the Lag of every relationship
+    """
+
+    def __init__(self, k, change=False, nlim=1, cor_lim=0, t_lim=0, variables=None, lags=None):
+        self.k = k
+        self.lags = lags
+        self.change = change
+        self.nlim = nlim
+        self.cor_lim = cor_lim
+        self.t_lim = t_lim
+        self.variables = variables
+        self.seen = 0
+        self._heaps = {variable: [] for variable in variables} if variables is not None else {None: []}
+
+    def passes(self, row):
+        """Returns whether a row of statistics passes nlim, cor_lim and t_lim"""
+        suffix = '_change' if self.change else ''
+        cor = row['Correlation' + suffix]
+        keep = row['n' + suffix] > self.nlim and (cor > self.cor_lim or cor < -self.cor_lim)
+        if self.t_lim != 0:
+            t = row['t' + suffix]
+            keep = keep and (t > self.t_lim or t < -self.t_lim)
+        return keep
+
+    def push(self, row):
+        """Offers a row of statistics, as yielded by iter_stats. Returns whether it is among the k strongest so far"""
+        self.seen += 1
+        if self.k <= 0 or not self.passes(row):
+            return False
+        heap = self._heaps[row.get('Variable')]
+        key = (abs(row['Correlation' + ('_change' if self.change else '')]), -self.seen, row)
+        if len(heap) < self.k:
+            heapq.heappush(heap, key)
+            return True
+        if key[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, key)
+            return True
+        return False
+
+    def rows(self):
+        """Returns the rows kept so far, in the order they were pushed"""
+        return [key[2] for heap in self._heaps.values() for key in sorted(heap, key=lambda key: -key[1])]
+
+    def table(self):
+        """
+        Returns the rows kept so far as a DataFrame ordered from the strongest relationship, with the columns of the
+        output of wb_every. With several variables, the rows of each variable follow each other under a MultiIndex of
+        Variable and Indicator
+        """
+        lag = ['Lag'] if self.lags is not None else []
+        columns = ['Indicator', 'Correlation', 'n'] + (['t'] if self.t_lim != 0 else []) + lag
+        if self.change:
+            columns += ['Correlation_change', 'n_change'] + (['t_change'] if self.t_lim != 0 else []) + [column + '_change' for column in lag]
+        with instrument.timer('sort'):
+            return self._table(columns)
+
+    def _table(self, columns):
+        tables = {}
+        for variable, heap in self._heaps.items():
+            rows = [key[2] for key in sorted(heap, reverse=True)]
+            table = pd.DataFrame(rows, columns=columns)
+            if not rows: # Keep the dtypes of a table with rows
+                table = table.astype({column: 'int64' if column.startswith(('n', 'Lag')) else 'float64' for column in columns[1:]})
+            tables[variable] = table.set_index('Indicator')
+        if self.variables is None:
+            return tables[None]
+        return pd.concat(tables, names=['Variable', 'Indicator'])
@@ -0,0 +1,126 @@
+"""
+Scanning indicators with several processes.
+
+The input data is written once to a directory of .npy files, which every worker process memory-maps when it starts and
+prepares once (see World_Bank_Correlations.kernel.Prepared). The indicator list is split into shards, and each task
+only carries the IDs of its shard. A worker returns the k strongest rows of its shard, and the shards are merged in
+the order of the listing, so the result is the same as scanning in one process.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .kernel import CHUNK, STREAM_CHUNK, Prepared, TopK, iter_rows
+from .fetch import iter_entries
+from . import instrument
+
+_worker = {}
+
+
+def share_data(data, col, path):
+    """
+    Writes the Country and Year columns of data and its column col (or list of columns) as .npy files in the directory
+    path, and returns the names of the columns
+    """
+    cols = col if type(col) == list else [col]
+    np.save(os.path.join(path, 'country.npy'), data['Country'].astype(str).to_numpy(dtype=str))
+    np.save(os.path.join(path, 'year.npy'), data['Year'].astype(str).to_numpy(dtype=str))
+    np.save(os.path.join(path, 'values.npy'), data.iloc[:, cols].to_numpy(dtype='float64'))
+    return [data.columns[c] for c in cols]
+
+
+def load_data(path, names):
+    """Returns the data written by share_data as a DataFrame with the columns Country, Year and then names"""
+    values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+    frame = pd.DataFrame({'Country': np.load(os.path.join(path, 'country.npy'), mmap_mode='r'),
+                          'Year': np.load(os.path.join(path, 'year.npy'), mmap_mode='r')})
+    for j, name in enumerate(names):
+        frame[name] = values[:, j]
+    return frame
+
+
+def _init_worker(path, names, several, change, store, max_workers, scope, low_memory, lags, method, nlim):
+    data = load_data(path, names)
+    col = list(range(2, 2 + len(names))) if several else 2
+    _worker['prepared'] = Prepared(data, col, change, low_memory, lags, method, nlim)
+    _worker['chunk'] = STREAM_CHUNK if low_memory else CHUNK
+    _worker['store'] = store
+    _worker['max_workers'] = max_workers
+    _worker['scope'] = scope
+
+
+def _scan_shard(ids, k, nlim, cor_lim, t_lim, keep_all, stats=False):
+    if stats: # The Stats of the parent are not shared with the workers, so they are collected here and sent back
+        with instrument.collect() as collected:
+            seen, rows, _ = _scan_shard(ids, k, nlim, cor_lim, t_lim, keep_all)
+        del collected.stages['total']
+        return seen, rows, collected
+    prepared = _worker['prepared']
+    top = TopK(k, prepared.change, nlim, cor_lim, t_lim, prepared.variables, prepared.lags)
+    rows = []
+    for row in iter_rows(prepared, iter_entries(_worker['store'], ids, mrv=50, max_workers=_worker['max_workers'], scope=_worker['scope']), _worker['chunk']):
+        top.push(row)
+        if keep_all:
+            rows.append(row)
+    return top.seen, rows if keep_all else top.rows(), None
+
+
+def scan_processes(data, col, store, ids, top, max_workers=None, processes=None, checkpoint=None, scope=None, low_memory=False, method='pearson'):
+    """
+    Correlates the input variable with the indicators ids in several processes, pushing the results into top
+
+    Parameters
+    ----------
+    data: A pandas dataframe that contains a column of countries called "Country," a column of years called "Year," and a column of data for a variable
+    col: The integer index of the column in which the data of your variable exists in your dataframe, or a list of such indices
+    store: The series store to read the indicators through. It is sent to every process, so it must be picklable, as the stores of
+        World_Bank_Correlations are
+    ids: The indicator IDs
+    top: The World_Bank_Correlations.kernel.TopK to merge the results into. The processes correlate at its lags
+    max_workers: The number of indicators each process downloads at the same time. Defaults to World_Bank_Correlations.fetch.MAX_WORKERS
+    processes: The number of processes. Defaults to the number of CPUs
+    checkpoint: A World_Bank_Correlations.checkpoint.Checkpoint. The indicators recorded in it are skipped, and every other row is
+        recorded in it, which means that the processes return every row instead of only the k strongest of their shard
+    scope: A World_Bank_Correlations.store.Scope that the processes read the indicators with
+    low_memory: When True, the processes scan in low-memory mode (see World_Bank_Correlations.kernel.Prepared), with smaller chunks
+    method: The correlation the processes compute (see World_Bank_Correlations.kernel.correlate)
+
+    Returns
+    ----------
+    World_Bank_Correlations.kernel.TopK
+        top
+    """
+    processes = processes or os.cpu_count() or 1
+    if checkpoint is not None:
+        for row in checkpoint.rows:
+            top.push(row)
+        ids = [indicator for indicator in ids if indicator not in checkpoint]
+    ids = list(ids)
+    size = max(CHUNK, -(-len(ids) // (4 * processes))) # A few shards per process, so that slow shards balance out
+    shards = [ids[i:i + size] for i in range(0, len(ids), size)]
+    path = tempfile.mkdtemp(prefix='wbc-')
+    try:
+        names = share_data(data, col, path)
+        initargs = (path, names, type(col) == list, top.change, store, max_workers, scope, low_memory, top.lags, method, top.nlim)
+        with ProcessPoolExecutor(max_workers=min(processes, max(len(shards), 1)), initializer=_init_worker, initargs=initargs) as pool:
+            stats = instrument.current()
+            futures = [pool.submit(_scan_shard, shard, top.k, top.nlim, top.cor_lim, top.t_lim, checkpoint is not None, stats is not None)
+                       for shard in shards]
+            for future in futures: # In the order of the listing, so that ties are broken as in one process
+                seen, rows, shard_stats = future.result()
+                if shard_stats is not None:
+                    stats.merge(shard_stats)
+                for row in rows:
+                    top.push(row)
+                    if checkpoint is not None:
+                        checkpoint.add(row)
+                top.seen += seen - len(rows)
+    finally:
+        if checkpoint is not None:
+            checkpoint.write()
+        shutil.rmtree(path, ignore_errors=True)
+    return top
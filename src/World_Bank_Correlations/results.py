@@ -0,0 +1,100 @@
+"""
+Cache of the statistics of complete scans.
+
+wb_topic_corrs and wb_corrs_search correlate the input variable with every indicator of a topic or a search and only
+then keep the k strongest relationships that pass nlim, cor_lim and t_lim. The statistics of every indicator are kept
+here, keyed by a fingerprint of the input (see World_Bank_Correlations.checkpoint.fingerprint), the indicators, change,
+the countries and years read and the store, so running a scan again with another k or other limits only filters them.
+wb_every only ever holds the k strongest relationships while it scans the whole catalogue, so only its table is kept,
+keyed by k and the limits as well. The statistics are computed again once any of their indicators has been downloaded
+again by the store (see World_Bank_Correlations.store.SeriesStore.saved_since), which the store finds without listing
+its entries.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from . import instrument
+
+MAX_SCANS = 16 # The number of scans kept by default. The statistics of a scan of every topic take a few megabytes
+
+
+class ResultCache:
+    """
+    The statistics of the last scans, in memory
+
+    Parameters
+    ----------
+    max_scans: The number of scans to keep. The least recently used ones are dropped first, and 0 keeps none
+    """
+
+    def __init__(self, max_scans=MAX_SCANS):
+        self.max_scans = max_scans
+        self._scans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, store, ids):
+        """
+        Returns the statistics kept for a scan, or None if there are none or some of their indicators were downloaded again since
+
+        Parameters
+        ----------
+        key: A tuple describing the scan (see World_Bank_Correlations.World_Bank_Correlations), without the store
+        store: The series store the scan reads through
+        ids: The indicator IDs of the scan
+        """
+        if self.max_scans <= 0:
+            return None
+        with self._lock:
+            found = self._scans.get((id(store), key))
+            if found is not None:
+                self._scans.move_to_end((id(store), key))
+        stats = instrument.current()
+        if found is None or found[0] is not store:
+            found = None
+        else:
+            changed = store.saved_since(found[1])
+            if changed and not changed.isdisjoint(ids):
+                found = None
+        if stats is not None:
+            stats.count('result_hits' if found is not None else 'result_misses')
+        return found[2] if found is not None else None
+
+    def put(self, key, store, ids, value):
+        """Keeps value, the statistics of a scan, for get. Stores that cannot tell what they downloaded (see SeriesStore.saved_since) are not cached"""
+        if self.max_scans <= 0:
+            return
+        since = time.time()
+        try:
+            store.saved_since(since)
+        except NotImplementedError:
+            return
+        with self._lock:
+            self._scans[(id(store), key)] = (store, since, value) # The store is kept, so its id is not reused
+            self._scans.move_to_end((id(store), key))
+            while len(self._scans) > self.max_scans:
+                self._scans.popitem(last=False)
+
+    def clear(self):
+        """Forgets every scan"""
+        with self._lock:
+            self._scans.clear()
+
+
+_default_cache = None
+
+
+def get_cache(cache=None):
+    """Returns cache if it is given, otherwise the default ResultCache, which is created on first use"""
+    global _default_cache
+    if cache is not None:
+        return cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
+
+
+def set_cache(cache):
+    """Sets the ResultCache used by the functions in World_Bank_Correlations. None goes back to the default one, and ResultCache(0) caches nothing"""
+    global _default_cache
+    _default_cache = cache
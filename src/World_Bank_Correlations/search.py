@@ -0,0 +1,160 @@
+"""
+Full-text search of the indicator catalogue.
+
+The ID, name, unit, source, source note, source organization and topics of every indicator in the catalogue are split
+into lowercase words, and an inverted index maps every word to the positions of the indicators it appears in. The index
+is kept in a JSON file next to the catalogue and built again when the catalogue is refreshed, so a search is a few set
+operations on the index instead of a download and a scan of the whole listing.
+
+A query means what it means to wb.search_indicators: a regular expression, matched ignoring case against the name,
+unit, source, source note, source organization and topics of every indicator, so a query without the characters of a
+regular expression (such as . | ( ) * [ or $), like income share, is a phrase that must appear as it is. The words of
+such a query only narrow the indicators down through the index, before they are matched.
+
+A query starting with + is a list of terms, which must all match anywhere in the ID or the text of an indicator:
+- a word matches indicators with that word, and a word ending in * matches any word starting with it
+- words in double quotes, or joined by punctuation (such as CO2-equivalent), must appear one after the other
+- a + before any term is optional, so +income +share and +income share are the same query
+"""
+import os
+import re
+import json
+import bisect
+
+from .catalog import TOPICS
+
+_WORD = re.compile(r'[^\W_]+')
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+_REGEX = set('.^$[]()|\\+*?{}')
+FIELDS = ['name', 'unit', 'sourceName', 'sourceNote', 'sourceOrganization'] # The text of an indicator, besides its ID and topics
+FORMAT = 2 # Of the index file. Files in another format are built again
+
+
+def words(text):
+    """Returns the lowercase words of text"""
+    return _WORD.findall(text.lower())
+
+
+def _fields(record):
+    """The texts wb.search_indicators matches a query against"""
+    return [record.get(field) or '' for field in FIELDS] + [','.join(TOPICS.get(topic, '') for topic in record.get('topics') or [])]
+
+
+def _texts(indicator, record):
+    return [indicator] + _fields(record)
+
+
+def _pattern(query):
+    """The regular expression wb.search_indicators matches every text with"""
+    return re.compile(query if query.startswith('.*') else '.*(' + query + ')', re.IGNORECASE)
+
+
+class SearchIndex:
+    """
+    Inverted index of the words of the indicators of a catalogue, persisted to a JSON file
+
+    Parameters
+    ----------
+    path: The path of the JSON file. None keeps the index in memory only
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._index = None
+
+    def _load(self, indicators, fetched):
+        if self._index is not None and self._index['fetched'] == fetched and self._index['size'] == len(indicators):
+            return self._index
+        index = None
+        if self.path is not None and fetched is not None and os.path.exists(self.path):
+            with open(self.path) as f:
+                index = json.load(f)
+            if index.get('fetched') != fetched or index.get('size') != len(indicators) or index.get('format') != FORMAT:
+                index = None
+        if index is None:
+            index = self._build(indicators, fetched)
+        index['vocabulary'] = sorted(index['postings']) # For prefixes
+        self._index = index
+        return index
+
+    def _build(self, indicators, fetched):
+        postings = {}
+        for i, (indicator, record) in enumerate(indicators.items()):
+            for word in set(word for text in _texts(indicator, record) for word in words(text)):
+                postings.setdefault(word, []).append(i)
+        index = {'fetched': fetched, 'size': len(indicators), 'format': FORMAT, 'postings': postings}
+        if self.path is not None and fetched is not None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(index, f)
+            os.replace(self.path + '.tmp', self.path)
+        return index
+
+    def _matching(self, index, word, prefix):
+        if not prefix:
+            return set(index['postings'].get(word, []))
+        vocabulary, found = index['vocabulary'], set()
+        for token in vocabulary[bisect.bisect_left(vocabulary, word):]:
+            if not token.startswith(word):
+                break
+            found.update(index['postings'][token])
+        return found
+
+    def _containing(self, index, tokens):
+        """
+        Returns the positions of the indicators that can contain the words tokens as they are in a phrase: the first
+        at the end of a word, the last at the start of one and the others whole, or a single one anywhere in a word
+        """
+        found = None
+        for n, token in enumerate(tokens):
+            if len(tokens) == 1:
+                matching = set(i for word in index['vocabulary'] if token in word for i in index['postings'][word])
+            elif n == 0:
+                matching = set(i for word in index['vocabulary'] if word.endswith(token) for i in index['postings'][word])
+            elif n == len(tokens) - 1:
+                matching = self._matching(index, token, True)
+            else:
+                matching = self._matching(index, token, False)
+            found = matching if found is None else found & matching
+        return found
+
+    def _words(self, query, indicators, fetched):
+        ids = list(indicators)
+        index = self._load(indicators, fetched)
+        found, phrases = None, []
+        for quoted, word in _TERM.findall(query):
+            prefix = not quoted and word.endswith('*')
+            tokens = words(quoted or word)
+            if not tokens:
+                continue
+            for n, token in enumerate(tokens):
+                matching = self._matching(index, token, prefix and n == len(tokens) - 1)
+                found = matching if found is None else found & matching
+            if len(tokens) > 1:
+                phrases.append(re.compile(r'\b' + r'[\W_]+'.join(map(re.escape, tokens)) + (r'' if prefix else r'\b')))
+        if not found:
+            return []
+        found = [ids[i] for i in sorted(found)]
+        for phrase in phrases: # The words of a phrase are all there, so only their order is checked
+            found = [i for i in found if any(phrase.search(text.lower()) for text in _texts(i, indicators[i]))]
+        return found
+
+    def search(self, query, indicators, fetched=None):
+        """
+        Returns the IDs of the indicators that match query, in the order of indicators
+
+        Parameters
+        ----------
+        query: The query (see World_Bank_Correlations.search)
+        indicators: The dict of every indicator ID to its record, as World_Bank_Correlations.catalog.Catalog.indicators
+        fetched: The time the catalogue was downloaded. The index is built again when it changes
+        """
+        if query.lstrip().startswith('+'): # Not a valid regular expression, so it meant nothing to wb.search_indicators
+            return self._words(re.sub(r'(^|\s)\++', r'\1', query), indicators, fetched)
+        ids = list(indicators)
+        pattern = _pattern(query)
+        tokens = words(query)
+        if tokens and not set(query) & _REGEX: # A phrase, so only the indicators with its words can match
+            ids = [ids[i] for i in sorted(self._containing(self._load(indicators, fetched), tokens))]
+        return [i for i in ids if any(pattern.match(text) for text in _fields(indicators[i]))]
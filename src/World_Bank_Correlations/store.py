@@ -0,0 +1,561 @@
+"""
+Local storage for World Bank indicator series.
+
+The functions in World_Bank_Correlations read indicator data through a series store instead of calling wb.get_series
+directly, so an indicator that has already been downloaded is read back from disk and costs no network call.
+
+numpy and pandas are imported when they are first needed, so that importing this module is cheap.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+from . import instrument
+from .fetch import get_fetcher
+
+COUNTRY_LIMIT = 60 # The most country codes put in the path of a request. A Scope with more countries requests all of them
+CACHE_DIR = os.environ.get('WBC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'World_Bank_Correlations'))
+
+# One stored indicator: its display name, a Country x Year grid of values in the order returned by the API and the grid of
+# their annual percent changes (see World_Bank_Correlations.changes.pct_grid), or None where they have not been computed
+Entry = namedtuple('Entry', ['indicator', 'name', 'countries', 'years', 'values', 'changes'], defaults=(None,))
+
+# Where a stored indicator has data: the countries and years of its grid and the bits of coverage_bits
+Coverage = namedtuple('Coverage', ['countries', 'years', 'bits'])
+
+_layouts = {}
+
+
+def layout(labels):
+    """
+    Returns the countries or the years of a grid as a tuple, which is the same object for all grids with the same labels,
+    so that grids laid out alike can be recognised by identity (see World_Bank_Correlations.kernel.Keys)
+
+    Parameters
+    ----------
+    labels: A list of labels, or their JSON as stored by SQLiteSeriesStore
+
+    Returns
+    ----------
+    Tuple of strings
+    """
+    found = _layouts.get(labels) if type(labels) == str else None # JSON text is looked up as it is, before it is parsed
+    if found is None:
+        key = tuple(json.loads(labels)) if type(labels) == str else tuple(labels)
+        if len(_layouts) > 4096:
+            _layouts.clear()
+        found = _layouts.setdefault(key, key)
+        if type(labels) == str:
+            _layouts[labels] = found
+    return found
+
+
+def entry_from_series(series, indicator=None):
+    """
+    Converts a Series as returned by wb.get_series (indexed by Country, Series and Year) into an Entry
+
+    Parameters
+    ----------
+    series: A pandas Series as returned by wb.get_series
+    indicator: The indicator ID. Defaults to the name of the Series
+
+    Returns
+    ----------
+    Entry
+    """
+    import numpy as np
+    import pandas as pd
+    indicator = indicator if indicator is not None else series.name
+    countries = series.index.get_level_values('Country')
+    years = series.index.get_level_values('Year')
+    name = series.index.get_level_values('Series')[0] if len(series) else indicator
+    c = pd.unique(countries)
+    y = pd.unique(years)
+    if len(series) == len(c) * len(y) and (countries == np.repeat(c, len(y))).all() and (years == np.tile(y, len(c))).all():
+        values = series.to_numpy(dtype='float64').reshape(len(c), len(y))
+    else: # Not laid out as a full Country x Year product, so place each value explicitly
+        flat = pd.Series(series.to_numpy(dtype='float64'), index=pd.MultiIndex.from_arrays([countries, years]))
+        flat = flat[~flat.index.duplicated()]
+        values = flat.reindex(pd.MultiIndex.from_product([c, y])).to_numpy().reshape(len(c), len(y))
+    return Entry(indicator, name, layout([str(x) for x in c]), layout([str(x) for x in y]), values)
+
+
+def coverage_bits(entry):
+    """
+    Returns the Country x Year presence bitmaps of an entry with its changes (see with_changes): a bit for every value that
+    is not NaN, followed by a bit for every change that is not NaN, packed eight to a byte as numpy.packbits does
+    """
+    import numpy as np
+    return np.packbits(np.concatenate([~np.isnan(entry.values).ravel(), ~np.isnan(entry.changes).ravel()]))
+
+
+def with_changes(entry):
+    """Returns entry with the annual percent changes of its values, computing them if it does not hold them yet"""
+    if entry.changes is not None:
+        return entry
+    from .changes import pct_grid
+    return entry._replace(changes=pct_grid(entry.values))
+
+
+class Scope:
+    """
+    The countries and years of indicator data that a scan can use. They are pushed down into the requests to the World
+    Bank API, as the country codes in the path and a date= range, and into the reads of the series stores, which return
+    grids cut down to them
+
+    Parameters
+    ----------
+    countries: The country names, as in the Country column of the input data, or None for every country
+    years: The years, as in the Year column of the input data, or None for every year. The year before the first one is
+        kept as well, for the annual percent change of the first one
+    codes: The API codes of the countries (see World_Bank_Correlations.catalog.Catalog.countries), or None to request every
+        country. Ignored if there are more than COUNTRY_LIMIT
+    """
+
+    def __init__(self, countries=None, years=None, codes=None):
+        self.countries = frozenset(str(c) for c in countries) if countries is not None else None
+        years = [str(y) for y in years] if years is not None else []
+        self.start = self.end = None
+        if years and all(y.isdigit() for y in years):
+            self.start, self.end = min(map(int, years)) - 1, max(map(int, years))
+        self.codes = sorted(codes) if codes and len(codes) <= COUNTRY_LIMIT else None
+        self.key = None # The key of the downloads of the scope in the stores, None if the requests are not restricted
+        if self.codes is not None or self.start is not None:
+            self.key = 'country=' + (';'.join(self.codes) if self.codes else 'all') + '&date=' + ('%d:%d' % (self.start, self.end) if self.start is not None else '')
+        self._cuts = {}
+
+    @classmethod
+    def from_key(cls, key):
+        """Returns a Scope that downloads what key was downloaded for, without the country names to cut it down to"""
+        country, date = [part.split('=', 1)[1] for part in key.split('&')]
+        scope = cls()
+        scope.codes = None if country == 'all' else country.split(';')
+        if date:
+            scope.start, scope.end = map(int, date.split(':'))
+        scope.key = key
+        return scope
+
+    def __getstate__(self): # The cuts are cached by the ids of the layouts of this process
+        state = dict(self.__dict__)
+        state['_cuts'] = {}
+        return state
+
+    def params(self):
+        """Returns the query parameters of a download for the scope: country (a list of codes, or 'all') and date"""
+        params = {'country': self.codes or 'all'}
+        if self.start is not None:
+            params['date'] = '%d:%d' % (self.start, self.end)
+        return params
+
+    def covers(self, entry, mrv):
+        """Returns whether an entry downloaded for the mrv most recent years holds every year of the scope that the World Bank has"""
+        years = [int(y) for y in entry.years if y.isdigit()]
+        return self.start is None or len(entry.years) < mrv or not years or min(years) <= self.start
+
+    def subset(self, entry):
+        """Returns entry cut down to the countries and years of the scope"""
+        cut = self._cuts.get((id(entry.countries), id(entry.years)))
+        if cut is None or cut[0] is not entry.countries or cut[1] is not entry.years: # The layouts are kept, so their ids are not reused
+            import numpy as np
+            rows = [i for i, c in enumerate(entry.countries) if self.countries is None or c in self.countries]
+            cols = [j for j, y in enumerate(entry.years) if self.start is None or not y.isdigit() or self.start <= int(y) <= self.end]
+            if len(rows) == len(entry.countries) and len(cols) == len(entry.years):
+                cut = (entry.countries, entry.years, None)
+            else:
+                cut = (entry.countries, entry.years, (np.ix_(rows, cols), layout([entry.countries[i] for i in rows]), layout([entry.years[j] for j in cols])))
+            if len(self._cuts) > 64:
+                self._cuts.clear()
+            self._cuts[(id(entry.countries), id(entry.years))] = cut
+        if cut[2] is None:
+            return entry
+        index, countries, years = cut[2]
+        return entry._replace(countries=countries, years=years, values=entry.values[index],
+                              changes=entry.changes[index] if entry.changes is not None else None)
+
+
+def entry_to_series(entry):
+    """
+    Converts an Entry back into a Series shaped like the output of wb.get_series
+
+    Parameters
+    ----------
+    entry: An Entry
+
+    Returns
+    ----------
+    Pandas Series
+    """
+    import pandas as pd
+    index = pd.MultiIndex.from_product([entry.countries, [entry.name], entry.years], names=['Country', 'Series', 'Year'])
+    return pd.Series(entry.values.ravel(), index=index, name=entry.indicator)
+
+
+class SeriesStore:
+    """
+    Base class of the series stores. Subclasses decide where entries live by implementing load, save and evict, while
+    entry, get_series and name read through to the World Bank API whenever an indicator is missing or expired.
+
+    Parameters
+    ----------
+    fetch: A function called as fetch(indicator, mrv=mrv) that downloads an indicator, and as fetch(indicator, mrv=None,
+        country=codes, date='start:end') for a Scope, as wb.get_series can be. Defaults to the shared
+        World_Bank_Correlations.fetch.Fetcher, which retries and rate limits its requests
+    """
+
+    def __init__(self, fetch=None):
+        self.fetch = fetch if fetch is not None else get_fetcher()
+
+    def load(self, indicator, mrv):
+        """Returns the stored Entry for indicator and mrv, or None if it is not stored or has expired"""
+        raise NotImplementedError
+
+    def save(self, entry, mrv):
+        """Stores entry under its indicator and mrv"""
+        raise NotImplementedError
+
+    def evict(self):
+        """Removes expired entries and, if the store is over its size cap, the least recently used ones"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Removes every entry"""
+        raise NotImplementedError
+
+    def stored(self):
+        """Returns a dict of the (indicator, mrv) of every stored entry to the time it was downloaded, in seconds since the epoch"""
+        raise NotImplementedError
+
+    def saved_since(self, since):
+        """
+        Returns the set of the indicators of the entries downloaded after since, in seconds since the epoch. Stores override it
+        to find them without listing every entry
+
+        Parameters
+        ----------
+        since: A time, as time.time() gives it
+        """
+        return set(indicator for (indicator, mrv), fetched in self.stored().items() if fetched > since)
+
+    def _coverage(self, indicator, mrv):
+        """Returns the Coverage of the stored entry for indicator and mrv, or None. Stores that keep the bits override it to skip the values"""
+        found = self.load(indicator, mrv)
+        return None if found is None else Coverage(found.countries, found.years, coverage_bits(with_changes(found)))
+
+    def _download(self, indicator, mrv):
+        if type(mrv) == str: # The key of a Scope
+            series = self.fetch(indicator, mrv=None, **Scope.from_key(mrv).params())
+        else:
+            series = self.fetch(indicator, mrv=mrv)
+        found = with_changes(entry_from_series(series, indicator))
+        self.save(found, mrv)
+        return found
+
+    def entry(self, indicator, mrv=50, scope=None):
+        """
+        Returns the Entry for indicator, downloading and storing it if it is not stored yet. Its annual percent changes are
+        computed when it is downloaded and stored with it, so that scans with change=True do not compute them again
+
+        Parameters
+        ----------
+        indicator: The indicator ID
+        mrv: The number of most recent years
+        scope: A Scope. The entry is cut down to its countries and years. An entry stored for mrv is used if it holds every
+            year of the scope, and otherwise only the countries and years of the scope are downloaded and stored
+        """
+        pushdown = scope is not None and scope.key is not None
+        found = self.load(indicator, mrv)
+        if found is not None and pushdown and not scope.covers(found, mrv):
+            found = None
+        if found is None and pushdown:
+            found = self.load(indicator, scope.key)
+        stats = instrument.current()
+        if found is None:
+            start = time.perf_counter()
+            found = self._download(indicator, scope.key if pushdown else mrv)
+            if stats is not None:
+                stats.count('cache_misses')
+                stats.latency(time.perf_counter() - start)
+        elif stats is not None:
+            stats.count('cache_hits')
+        return scope.subset(found) if scope is not None else found
+
+    def coverage(self, indicator, mrv=50, scope=None):
+        """
+        Returns the Coverage of the entry that entry would read for indicator, or None if it is not stored. Nothing is
+        downloaded. The grid is the stored one, before it is cut down to the scope, so the observations it gives for the
+        rows of some data are at least those of the entry
+
+        Parameters
+        ----------
+        indicator: The indicator ID
+        mrv: The number of most recent years
+        scope: A Scope, as for entry
+        """
+        pushdown = scope is not None and scope.key is not None
+        found = self._coverage(indicator, mrv)
+        if found is not None and pushdown and not scope.covers(found, mrv):
+            found = None
+        if found is None and pushdown:
+            found = self._coverage(indicator, scope.key)
+        return found
+
+    def stale(self, catalog=None):
+        """
+        Returns the (indicator, mrv or Scope key) of the stored entries whose source the World Bank has updated since they were downloaded,
+        going by the dates of the listing of sources, which is downloaded again (see World_Bank_Correlations.catalog.Catalog.sources).
+        The listing only gives the day of an update, so entries downloaded on that day count as up to date
+
+        Parameters
+        ----------
+        catalog: The World_Bank_Correlations.catalog.Catalog to read the sources of the indicators from. Defaults to the default one
+        """
+        from .catalog import get_catalog
+        catalog = get_catalog(catalog)
+        catalog.sources(refresh=True)
+        out = []
+        for (indicator, mrv), fetched in self.stored().items():
+            updated = catalog.updated(indicator)
+            if updated is not None and fetched < updated:
+                out.append((indicator, mrv))
+        return out
+
+    def refresh(self, catalog=None, max_workers=None):
+        """
+        Downloads the stale entries (see stale) again, several at a time, leaving the others as they are
+
+        Parameters
+        ----------
+        catalog: The World_Bank_Correlations.catalog.Catalog to read the sources of the indicators from. Defaults to the default one
+        max_workers: The number of indicators to download at the same time. Defaults to World_Bank_Correlations.fetch.MAX_WORKERS
+
+        Returns
+        ----------
+        List of strings
+            The IDs of the indicators downloaded again, once each. An indicator that can no longer be downloaded keeps its stored entry
+        """
+        from .fetch import iter_fetched
+        refreshed = iter_fetched(lambda key: self._download(*key), self.stale(catalog), max_workers)
+        indicators = [indicator for (indicator, mrv), entry, error in refreshed if error is None]
+        return sorted(set(indicators), key=indicators.index) # An indicator can be stored for several mrv or Scopes
+
+    def get_series(self, indicator, mrv=50):
+        """Drop-in replacement for wb.get_series(indicator, mrv=mrv) that reads through the store"""
+        return entry_to_series(self.entry(indicator, mrv))
+
+    def name(self, indicator, mrv=50):
+        """Returns the display name of indicator"""
+        return self.entry(indicator, mrv).name
+
+
+class MemorySeriesStore(SeriesStore):
+    """
+    Series store that keeps entries in memory for the life of the process
+
+    Parameters
+    ----------
+    fetch: A function called as fetch(indicator, mrv=mrv) that downloads an indicator. Defaults to the shared
+        World_Bank_Correlations.fetch.Fetcher, which retries and rate limits its requests
+    ttl: Number of seconds an entry stays valid. None keeps entries until they are evicted for space
+    max_entries: The maximum number of entries to keep. The least recently used entries are dropped first
+    """
+
+    def __init__(self, fetch=None, ttl=None, max_entries=None):
+        SeriesStore.__init__(self, fetch)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._saved = OrderedDict() # The download time of every entry, the most recent last
+        self._lock = threading.Lock()
+
+    def __reduce__(self): # A copy sent to another process starts empty
+        return (MemorySeriesStore, (self.fetch, self.ttl, self.max_entries))
+
+    def load(self, indicator, mrv):
+        with self._lock:
+            found = self._entries.get((indicator, mrv))
+            if found is None:
+                return None
+            if self.ttl is not None and time.time() - found[0] > self.ttl:
+                del self._entries[(indicator, mrv)]
+                del self._saved[(indicator, mrv)]
+                return None
+            self._entries.move_to_end((indicator, mrv))
+            return found[1]
+
+    def save(self, entry, mrv):
+        entry = with_changes(entry)
+        with self._lock:
+            self._entries[(entry.indicator, mrv)] = (time.time(), entry)
+            self._entries.move_to_end((entry.indicator, mrv))
+            self._saved[(entry.indicator, mrv)] = self._entries[(entry.indicator, mrv)][0]
+            self._saved.move_to_end((entry.indicator, mrv))
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            if self.ttl is not None:
+                now = time.time()
+                for key in [key for key, (fetched, _) in self._entries.items() if now - fetched > self.ttl]:
+                    del self._entries[key]
+                    del self._saved[key]
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                del self._saved[self._entries.popitem(last=False)[0]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._saved.clear()
+
+    def stored(self):
+        with self._lock:
+            return {key: fetched for key, (fetched, entry) in self._entries.items()}
+
+    def saved_since(self, since):
+        found = set()
+        with self._lock:
+            for (indicator, mrv), fetched in reversed(self._saved.items()):
+                if fetched <= since:
+                    break
+                found.add(indicator)
+        return found
+
+
+class SQLiteSeriesStore(SeriesStore):
+    """
+    Series store that keeps entries in a SQLite file, so they persist between sessions. Entries are keyed by indicator
+    ID and mrv, and hold the indicator name together with its values, their annual percent changes and the bitmaps of
+    where both are present (see coverage_bits), so that a scan can screen stored indicators without reading their values.
+
+    Parameters
+    ----------
+    path: Path of the SQLite file. Defaults to series.sqlite in CACHE_DIR (set the WBC_CACHE_DIR environment variable to move it)
+    fetch: A function called as fetch(indicator, mrv=mrv) that downloads an indicator. Defaults to the shared
+        World_Bank_Correlations.fetch.Fetcher, which retries and rate limits its requests
+    ttl: Number of seconds an entry stays valid. None keeps entries until they are evicted for space
+    max_bytes: The maximum total size of stored values in bytes. The least recently used entries are dropped first
+    """
+
+    def __init__(self, path=None, fetch=None, ttl=None, max_bytes=None):
+        SeriesStore.__init__(self, fetch)
+        self.path = path if path is not None else os.path.join(CACHE_DIR, 'series.sqlite')
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, timeout=60, check_same_thread=False) # Other processes may be writing to the file
+        with self._lock, self._con:
+            self._con.execute('CREATE TABLE IF NOT EXISTS series (indicator TEXT, mrv INTEGER, name TEXT, countries TEXT, '
+                              'years TEXT, vals BLOB, nbytes INTEGER, fetched REAL, accessed REAL, changes BLOB, PRIMARY KEY (indicator, mrv))')
+            if 'changes' not in [column[1] for column in self._con.execute('PRAGMA table_info(series)')]: # A file from an earlier version
+                self._con.execute('ALTER TABLE series ADD COLUMN changes BLOB')
+            if 'coverage' not in [column[1] for column in self._con.execute('PRAGMA table_info(series)')]:
+                self._con.execute('ALTER TABLE series ADD COLUMN coverage BLOB')
+            self._con.execute('CREATE INDEX IF NOT EXISTS series_fetched ON series (fetched)') # For saved_since
+
+    def __reduce__(self): # A copy sent to another process opens the same file
+        return (SQLiteSeriesStore, (self.path, self.fetch, self.ttl, self.max_bytes))
+
+    def load(self, indicator, mrv):
+        with self._lock, self._con:
+            row = self._con.execute('SELECT name, countries, years, vals, fetched, changes FROM series WHERE indicator=? AND mrv=?',
+                                    (indicator, mrv)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and time.time() - row[4] > self.ttl:
+                self._con.execute('DELETE FROM series WHERE indicator=? AND mrv=?', (indicator, mrv))
+                return None
+            self._con.execute('UPDATE series SET accessed=? WHERE indicator=? AND mrv=?', (time.time(), indicator, mrv))
+        import numpy as np
+        countries = layout(row[1])
+        years = layout(row[2])
+        values = np.frombuffer(row[3], dtype='<f8').reshape(len(countries), len(years))
+        if row[5] is None: # Stored by an earlier version, so the changes are computed once and stored
+            entry = with_changes(Entry(indicator, row[0], countries, years, values))
+            changes = entry.changes.astype('<f8').tobytes()
+            with self._lock, self._con:
+                self._con.execute('UPDATE series SET changes=?, nbytes=nbytes+? WHERE indicator=? AND mrv=?', (changes, len(changes), indicator, mrv))
+            return entry
+        return Entry(indicator, row[0], countries, years, values, np.frombuffer(row[5], dtype='<f8').reshape(values.shape))
+
+    def _coverage(self, indicator, mrv):
+        with self._lock, self._con:
+            row = self._con.execute('SELECT countries, years, coverage, fetched FROM series WHERE indicator=? AND mrv=?', (indicator, mrv)).fetchone()
+        if row is None or (self.ttl is not None and time.time() - row[3] > self.ttl):
+            return None
+        if row[2] is None: # Stored by an earlier version, so the bits are computed once from the values and stored
+            found = SeriesStore._coverage(self, indicator, mrv)
+            if found is not None:
+                with self._lock, self._con:
+                    self._con.execute('UPDATE series SET coverage=?, nbytes=nbytes+? WHERE indicator=? AND mrv=?',
+                                      (found.bits.tobytes(), len(found.bits), indicator, mrv))
+            return found
+        import numpy as np
+        return Coverage(layout(row[0]), layout(row[1]), np.frombuffer(row[2], dtype='uint8'))
+
+    def save(self, entry, mrv):
+        import numpy as np
+        entry = with_changes(entry)
+        countries = json.dumps(list(entry.countries))
+        years = json.dumps(list(entry.years))
+        vals = np.ascontiguousarray(entry.values, dtype='<f8').tobytes()
+        changes = np.ascontiguousarray(entry.changes, dtype='<f8').tobytes()
+        coverage = coverage_bits(entry).tobytes()
+        now = time.time()
+        with self._lock, self._con:
+            self._con.execute('INSERT OR REPLACE INTO series (indicator, mrv, name, countries, years, vals, nbytes, fetched, accessed, changes, coverage) '
+                              'VALUES (?,?,?,?,?,?,?,?,?,?,?)', (entry.indicator, mrv, entry.name, countries, years, vals,
+                                                                len(vals) + len(changes) + len(coverage) + len(countries) + len(years), now, now, changes, coverage))
+        self.evict()
+
+    def evict(self):
+        with self._lock, self._con:
+            if self.ttl is not None:
+                self._con.execute('DELETE FROM series WHERE fetched<?', (time.time() - self.ttl,))
+            if self.max_bytes is not None:
+                total = self._con.execute('SELECT COALESCE(SUM(nbytes),0) FROM series').fetchone()[0]
+                for indicator, mrv, nbytes in self._con.execute('SELECT indicator, mrv, nbytes FROM series ORDER BY accessed').fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._con.execute('DELETE FROM series WHERE indicator=? AND mrv=?', (indicator, mrv))
+                    total -= nbytes
+
+    def clear(self):
+        with self._lock, self._con:
+            self._con.execute('DELETE FROM series')
+
+    def stored(self):
+        with self._lock, self._con:
+            return {(indicator, mrv): fetched for indicator, mrv, fetched in self._con.execute('SELECT indicator, mrv, fetched FROM series')}
+
+    def saved_since(self, since):
+        with self._lock, self._con:
+            return set(indicator for indicator, in self._con.execute('SELECT indicator FROM series WHERE fetched>?', (since,)))
+
+
+_default_store = None
+
+
+def get_store(store=None):
+    """
+    Returns store if it is given, otherwise the default store. The default store is a SQLiteSeriesStore in CACHE_DIR
+    that is created on first use, unless another one has been chosen with set_store.
+    """
+    global _default_store
+    if store is not None:
+        return store
+    if _default_store is None:
+        _default_store = SQLiteSeriesStore()
+    return _default_store
+
+
+def set_store(store):
+    """
+    Sets the store used by the functions in World_Bank_Correlations when they are not given one.
+    Pass a MemorySeriesStore to avoid writing to disk, or None to go back to the default SQLite store.
+    """
+    global _default_store
+    _default_store = store
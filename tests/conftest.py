@@ -0,0 +1,145 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+COUNTRIES = ['Albania', 'Brazil', 'Chile', 'Denmark', 'Egypt, Arab Rep.', 'France', 'Ghana', 'India']
+YEARS = [str(y) for y in range(2020, 1990, -1)] # The API lists the most recent year first
+TOPIC_INDICATORS = {1: ['AG.1', 'AG.2', 'AG.3'], 2: ['AID.1', 'AID.2'], 3: ['EC.1', 'EC.2', 'EC.3', 'EC.4']}
+INDICATORS = [indicator for ids in TOPIC_INDICATORS.values() for indicator in ids]
+
+
+def fake_series(indicator, countries=COUNTRIES, years=YEARS):
+    """Builds a Series shaped like the output of wb.get_series, with reproducible values for each indicator"""
+    rng = np.random.default_rng(sum(map(ord, indicator)))
+    values = rng.normal(100, 20, size=len(countries) * len(years))
+    values[rng.random(len(values)) < 0.2] = np.nan
+    index = pd.MultiIndex.from_product([countries, ['Name of ' + indicator], years], names=['Country', 'Series', 'Year'])
+    return pd.Series(values, index=index, name=indicator)
+
+
+@pytest.fixture
+def fake_fetch():
+    """A stand-in for wb.get_series that records the indicators it is asked for"""
+    def fetch(indicator, mrv=50, **params):
+        fetch.calls.append(indicator)
+        return fake_series(indicator, years=YEARS[:mrv])
+    fetch.calls = []
+    return fetch
+
+
+@pytest.fixture
+def sample_data():
+    """User data in the layout the package expects: Country, Series, Year and a value column at index 3"""
+    return fake_series('USER.DATA').reset_index()
+
+
+def jsonstat(series):
+    """Encodes a Series shaped like the output of wb.get_series the way the API answers format=jsonstat"""
+    dimension = {'id': ['country', 'series', 'time']}
+    for dim, level in zip(dimension['id'], series.index.levels):
+        labels = list(series.index.get_level_values(level.name).unique())
+        codes = [dim + str(i) for i in range(len(labels))]
+        dimension[dim] = {'label': level.name, 'category': {'index': {c: i for i, c in enumerate(codes)}, 'label': dict(zip(codes, labels))}}
+    values = [None if np.isnan(v) else v for v in series.to_numpy()]
+    return {'WDI': {'class': 'dataset', 'dimension': dimension, 'value': values}}
+
+
+def listing(records, params):
+    """Pages a list of indicator records the way the API answers format=json"""
+    per_page, page = int(params.get('per_page', 50)), int(params.get('page', 1))
+    meta = {'page': page, 'pages': max(1, -(-len(records) // per_page)), 'per_page': per_page, 'total': len(records)}
+    return [meta, records[(page - 1) * per_page:page * per_page]]
+
+
+def country_code(country):
+    """The code of a fake country in the country listing of the API"""
+    return country[:3].upper()
+
+
+def indicator_record(indicator):
+    """The record of a fake indicator in the indicator listings of the API"""
+    topics = [{'id': str(n), 'value': 'Topic ' + str(n)} for n, ids in TOPIC_INDICATORS.items() if indicator in ids]
+    return {'id': indicator, 'name': 'Name of ' + indicator, 'source': {'id': '2', 'value': 'World Development Indicators'},
+            'sourceNote': 'Notes on ' + indicator, 'sourceOrganization': 'Fake', 'topics': topics}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers like api.worldbank.org/v2 from the fake indicators, failing as told by server.failures"""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        parts = url.path.strip('/').split('/')
+        self.server.requests.append(self.path)
+        indicator = parts[-1]
+        if self.server.failures.get(indicator):
+            self.server.failures[indicator] -= 1
+            return self.answer(503, {'message': 'Service unavailable'})
+        if indicator in self.server.missing:
+            return self.answer(200, [{'message': [{'id': '120', 'key': 'Invalid value', 'value': 'The provided parameter value is not valid'}]}])
+        if parts == ['v2', 'indicator']:
+            return self.answer(200, listing([indicator_record(i) for i in INDICATORS], params))
+        if len(parts) == 4 and parts[:2] == ['v2', 'topic'] and parts[3] == 'indicator':
+            return self.answer(200, listing([indicator_record(i) for i in TOPIC_INDICATORS.get(int(parts[2]), [])], params))
+        if parts == ['v2', 'sources']:
+            return self.answer(200, listing([{'id': '2', 'name': 'World Development Indicators', 'lastupdated': self.server.lastupdated}], params))
+        if parts == ['v2', 'country']:
+            return self.answer(200, listing([{'id': country_code(c), 'name': c} for c in COUNTRIES], params))
+        if len(parts) == 5 and parts[:2] == ['v2', 'country'] and parts[3] == 'indicator':
+            series = fake_series(indicator, years=YEARS[:int(params.get('mrv', 50))])
+            if parts[2] != 'all' or 'date' in params: # The rows of the whole series for those countries and years
+                countries = [c for c in COUNTRIES if parts[2] == 'all' or country_code(c) in parts[2].split(';')]
+                start, end = map(int, params.get('date', '0:9999').split(':'))
+                keep = series.index.get_level_values('Country').isin(countries) & series.index.get_level_values('Year').astype(int).isin(range(start, end + 1))
+                series = series[keep]
+                series.index = series.index.remove_unused_levels()
+            return self.answer(200, jsonstat(series))
+        self.answer(404, {'message': 'Not found'})
+
+    def answer(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def wb_stub():
+    """A local server imitating the World Bank API. Its url attribute is the equivalent of https://api.worldbank.org/v2"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.failures = {}
+    server.missing = set()
+    server.lastupdated = '2020-07-01' # The date of the last update of the source of every fake indicator
+    server.url = 'http://127.0.0.1:%d/v2' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def offline(tmp_path, wb_stub):
+    """
+    Points the package at wb_stub: the default Catalog is kept in tmp_path and the default store keeps the series it
+    downloads in memory. The defaults, and the default ResultCache, are restored afterwards
+    """
+    from World_Bank_Correlations import catalog, results, store
+    from World_Bank_Correlations.fetch import Fetcher
+    catalog.set_catalog(catalog.Catalog(str(tmp_path / 'catalog.json'), fetcher=Fetcher(wb_stub.url)))
+    store.set_store(store.MemorySeriesStore(fetch=Fetcher(wb_stub.url)))
+    yield wb_stub
+    catalog.set_catalog(None)
+    store.set_store(None)
+    results.set_cache(None)
@@ -1,5 +1,6 @@
 from World_Bank_Correlations import World_Bank_Correlations as wbc
 
+import pytest
 import requests
 import pandas as pd
 import world_bank_data as wb
@@ -12,8 +13,8 @@ def test_wb_corr():
     merged2=pd.merge(thing1,thing3,how='inner',on=['Country','Year'])
     corr1=merged1.loc[:,'1.0.HCount.1.90usd'].corr(merged1.loc[:,'3.0.IncShr.q1'])
     corr2=merged2.loc[:,'1.0.HCount.1.90usd'].corr(merged2.loc[:,'3.0.Gini'])
-    assert wbc.wb_corr(thing1,3,'3.0.IncShr.q1').loc['Income Share of First Quintile','Correlation']==corr1 #test with only one indicator
-    assert wbc.wb_corr(thing1,3,['3.0.Gini','3.0.IncShr.q1']).loc['Gini Coefficient','Correlation']==corr2 #test with multiple indicators
+    assert wbc.wb_corr(thing1,3,'3.0.IncShr.q1').loc['Income Share of First Quintile','Correlation']==pytest.approx(corr1) #test with only one indicator
+    assert wbc.wb_corr(thing1,3,['3.0.Gini','3.0.IncShr.q1']).loc['Gini Coefficient','Correlation']==pytest.approx(corr2) #test with multiple indicators
     mumbo=pd.DataFrame()
     jumbo=pd.DataFrame()
     tumbo=pd.DataFrame()
@@ -36,8 +37,8 @@ def test_wb_corr():
     merged_pct2=pd.merge(mumbo,tumbo,how="inner",on=['Country','Year'])
     corr_chg1=merged_pct1['pct_chg1'].corr(merged_pct1['pct_chg2'])
     corr_chg2=merged_pct2['pct_chg1'].corr(merged_pct2['pct_chg3'])
-    assert corr_chg1==wbc.wb_corr(thing1,3,'3.0.IncShr.q1',True).loc['Income Share of First Quintile','Correlation_change']
-    assert corr_chg2==wbc.wb_corr(thing1,3,['3.0.IncShr.q1','3.0.Gini'],True).loc['Gini Coefficient','Correlation_change']    
+    assert pytest.approx(corr_chg1)==wbc.wb_corr(thing1,3,'3.0.IncShr.q1',True).loc['Income Share of First Quintile','Correlation_change']
+    assert pytest.approx(corr_chg2)==wbc.wb_corr(thing1,3,['3.0.IncShr.q1','3.0.Gini'],True).loc['Gini Coefficient','Correlation_change']    
 
 def test_wb_corr2():
     thing1=wbc.wb_corr(wb.get_series('1.0.HCount.1.90usd', mrv=50).reset_index(),3,'3.0.IncShr.q1')
@@ -62,7 +63,7 @@ def test_wb_topic_corrs():
         cors.append(merged.iloc[:,3].corr(merged.iloc[:,(merged.shape[1]-1)]))
         indicators.append(topic_df['{http://www.worldbank.org}name'][i])
     result=pd.DataFrame(list(zip(indicators,cors)),columns=['Indicator','Correlation']).sort_values(by='Correlation',key=abs,ascending=False).set_index('Indicator').head(5)
-    assert wbc.wb_topic_corrs(sample_data,3,1,k=5).iloc[0,0]==result.iloc[0,0]
+    assert wbc.wb_topic_corrs(sample_data,3,1,k=5).iloc[0,0]==pytest.approx(result.iloc[0,0])
     highest_corr_check=wb.get_series('SL.AGR.EMPL.MA.ZS', mrv=50).reset_index()
     merged_check=pd.merge(sample_data,highest_corr_check,how='inner',on=['Country','Year'])
     result_corr=merged_check.loc[:,'1.0.HCount.1.90usd'].corr(merged_check.loc[:,'SL.AGR.EMPL.MA.ZS'])
@@ -82,7 +83,7 @@ def test_wb_topic_corrs():
         jumbo=pd.concat([jumbo,j])
     next_check=pd.merge(mumbo,jumbo,how='inner',on=['Country','Year'])
     chg_check_result=next_check.loc[:,'pct_chg1'].corr(next_check.loc[:,'pct_chg2'])
-    assert wbc.wb_topic_corrs(sample_data,3,1,3,True).iloc[1,2]==chg_check_result
+    assert wbc.wb_topic_corrs(sample_data,3,1,3,True).iloc[1,2]==pytest.approx(chg_check_result)
 
 def test_wb_corrs_topic2():
     assertion_matrix = wbc.wb_topic_corrs(wb.get_series('3.0.Gini',mrv=50).reset_index(),3,'Energy & Mining')==wbc.wb_topic_corrs(wb.get_series('3.0.Gini',mrv=50).reset_index(),3,5)
@@ -100,7 +101,7 @@ def test_wb_corrs_search():
     inc_share_top=wb.get_series('3.0.IncShr.q5',mrv=50).reset_index()
     merged_test=pd.merge(sample_data,inc_share_top,how='inner',on=['Country','Year'])
     corr_result=merged_test.loc[:,'3.0.Gini'].corr(merged_test.loc[:,'3.0.IncShr.q5'])
-    assert wbc.wb_corrs_search(sample_data,3,'income share',3).loc['Income Share of Fifth Quintile',"Correlation"]==corr_result
+    assert wbc.wb_corrs_search(sample_data,3,'income share',3).loc['Income Share of Fifth Quintile',"Correlation"]==pytest.approx(corr_result)
     quint2=wb.get_series('3.0.IncShr.q2',mrv=50).reset_index()
     mumbo=pd.DataFrame()
     jumbo=pd.DataFrame()
@@ -116,5 +117,5 @@ def test_wb_corrs_search():
         jumbo=pd.concat([jumbo,j])
     merged_pct_test=pd.merge(mumbo,jumbo,how='inner',on=['Country','Year'])
     change_cor_result=merged_pct_test.loc[:,'pct_chg_dat'].corr(merged_pct_test.loc[:,'pct_chg_ind'])
-    assert wbc.wb_corrs_search(sample_data,3,'income share',3,True).loc['Income Share of Second Quintile','Correlation_change']==change_cor_result
+    assert wbc.wb_corrs_search(sample_data,3,'income share',3,True).loc['Income Share of Second Quintile','Correlation_change']==pytest.approx(change_cor_result)
 
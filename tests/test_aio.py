@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pandas as pd
+
+from World_Bank_Correlations import aio, store as st
+from World_Bank_Correlations import World_Bank_Correlations as wbc
+from World_Bank_Correlations.fetch import Fetcher
+from conftest import INDICATORS
+
+
+def test_coroutines_match_functions(offline, wb_stub, sample_data):
+    async def main():
+        ticks = []
+
+        async def ticker(): # Runs while the scans wait, since they do not block the event loop
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.001)
+        task = asyncio.create_task(ticker())
+        store = st.MemorySeriesStore(fetch=Fetcher(wb_stub.url))
+        outputs = await asyncio.gather(aio.wb_corr(sample_data, 3, ['AG.1', 'EC.2'], True, store=store),
+                                       aio.wb_topic_corrs(sample_data, 3, 3, k=3, store=store),
+                                       aio.wb_every(sample_data, 3, k=3, change=True, store=store))
+        task.cancel()
+        return outputs, ticks
+    (corr, topic, every), ticks = asyncio.run(main())
+    assert ticks
+    store = st.MemorySeriesStore(fetch=Fetcher(wb_stub.url))
+    pd.testing.assert_frame_equal(corr, wbc.wb_corr(sample_data, 3, ['AG.1', 'EC.2'], True, store=store))
+    pd.testing.assert_frame_equal(topic, wbc.wb_topic_corrs(sample_data, 3, 3, k=3, store=store))
+    pd.testing.assert_frame_equal(every, wbc.wb_every(sample_data, 3, k=3, change=True, store=store))
+
+
+def test_aiter_wb_every_streams_and_closes(tmp_path, offline, wb_stub, sample_data):
+    store = st.MemorySeriesStore(fetch=Fetcher(wb_stub.url))
+    path = str(tmp_path / 'scan.json')
+
+    async def first(n):
+        rows = []
+        async for row, top in aio.aiter_wb_every(sample_data, 3, k=2, store=store, max_workers=1, resume=path):
+            rows.append(row)
+            if len(rows) == n:
+                break
+        return rows
+    rows = asyncio.run(first(3))
+    assert [row['id'] for row in rows] == INDICATORS[:3]
+    with open(path) as f:
+        assert [row['id'] for row in json.load(f)['rows']] == INDICATORS[:3] # Written when the loop was left
+    every = asyncio.run(first(len(INDICATORS)))
+    assert [row['id'] for row in every] == INDICATORS
+    assert every == list(row for row, top in wbc.iter_wb_every(sample_data, 3, k=2, store=store))
+
+
+def test_concurrent_stats_stay_apart(offline, wb_stub, sample_data):
+    import threading
+    from World_Bank_Correlations import instrument
+    both = threading.Barrier(2)
+
+    def store():
+        fetcher, first = Fetcher(wb_stub.url), [True]
+
+        def fetch(indicator, **params):
+            if first[0]: # Both scans are collecting before either downloads anything
+                first[0] = False
+                both.wait(timeout=10)
+            return fetcher(indicator, **params)
+        return st.MemorySeriesStore(fetch=fetch)
+    async def main():
+        return await asyncio.gather(aio.wb_topic_corrs(sample_data, 3, 1, k=3, store=store(), max_workers=1, stats=True),
+                                    aio.wb_topic_corrs(sample_data, 3, 3, k=3, store=store(), max_workers=1, stats=True))
+    first, second = asyncio.run(main())
+    assert first.attrs['stats'] is not second.attrs['stats']
+    assert first.attrs['stats'].counters['cache_misses'] == 3 and sum(first.attrs['stats'].latencies.values()) == 3
+    assert second.attrs['stats'].counters['cache_misses'] == 4 and sum(second.attrs['stats'].latencies.values()) == 4
+    assert instrument.current() is None
+
+    async def collected(topic):
+        with instrument.collect() as stats: # In the context of the task, which the thread of the scan runs in a copy of
+            await aio.wb_topic_corrs(sample_data, 3, topic, k=3, store=st.MemorySeriesStore(fetch=Fetcher(wb_stub.url)))
+        return stats
+
+    async def tasks():
+        return await asyncio.gather(collected(1), collected(2))
+    first, second = asyncio.run(tasks())
+    assert first.counters['cache_misses'] == 3 and second.counters['cache_misses'] == 2
@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench # noqa: E402
+
+
+def test_benchmarks_run(tmp_path):
+    out = str(tmp_path / 'results.json')
+    results = bench.run(['small'], ['wb_corr', 'wb_every'], [True], out=out, quiet=True)
+    with open(out) as f:
+        assert json.load(f) == results
+    for case in results['cases']:
+        assert case['indicators'] == 10 and case['countries'] == 50
+        assert case['wall'] > 0 and case['peak_rss_mb'] > 0
+        assert {'catalog', 'prepare', 'fetch', 'http', 'merge', 'change', 'correlation', 'sort', 'total'} <= set(case['stages'])
+        assert sum(case['latencies'].values()) == case['indicators']
+        assert case['requests'] >= 10 # Every indicator came from the stub
+    assert results['import']['heavy'] == []
+
+
+def test_import_time():
+    seconds, heavy = bench.import_time(repeat=1)
+    assert seconds > 0
+    assert heavy == [] # Importing the package does not load pandas, numpy, requests, world_bank_data or lxml
+
+
+def test_low_memory_under_ceiling(monkeypatch):
+    # The same countries at both scales, so only the number of indicators grows. Holding the 400 more would take about 16 MB
+    monkeypatch.setitem(bench.SCALES, 'fewer', (100, 50))
+    monkeypatch.setitem(bench.SCALES, 'more', (500, 50))
+    results = bench.run(['fewer', 'more'], ['wb_every'], [True], quiet=True, low_memory=True)
+    fewer, more = results['cases']
+    for case in results['cases']:
+        assert case['low_memory'] and case['requests'] >= case['indicators']
+        assert case['peak_rss_mb'] < bench.MEMORY_CEILING_MB
+    assert more['indicators'] == 5 * fewer['indicators']
+    assert more['peak_rss_mb'] - fewer['peak_rss_mb'] < 5
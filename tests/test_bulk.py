@@ -0,0 +1,74 @@
+import os
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from World_Bank_Correlations import World_Bank_Correlations as wbc, bulk, changes
+from conftest import fake_series
+
+IDS = ['AG.LND.TOTL', 'EN.POP.DNST', 'NY.GDP.PCAP', 'SP.DYN.LE00', 'SP.POP.TOTL']
+
+
+def write_bulk(directory):
+    """Writes the fake indicators in the layout of WDICSV.csv, zipped"""
+    rows = []
+    for indicator in IDS:
+        frame = fake_series(indicator).reset_index()
+        wide = frame.pivot(index='Country', columns='Year', values=indicator).reset_index()
+        wide.insert(1, 'Country Code', wide['Country'].str[:3].str.upper())
+        wide.insert(2, 'Indicator Name', 'Name of ' + indicator)
+        wide.insert(3, 'Indicator Code', indicator)
+        rows.append(wide.rename(columns={'Country': 'Country Name'}))
+    table = pd.concat(rows).sort_values(['Country Name', 'Indicator Code'])
+    table[''] = None # The bulk file ends every line with a comma
+    table.to_csv(directory / 'WDICSV.csv', index=False)
+    with zipfile.ZipFile(directory / 'WDI_CSV.zip', 'w') as archive:
+        archive.write(directory / 'WDICSV.csv', 'WDICSV.csv')
+    return str(directory / 'WDI_CSV.zip')
+
+
+def test_panel_store_matches_api_series(tmp_path):
+    store = bulk.PanelStore(write_bulk(tmp_path))
+    assert store.indicators == sorted(IDS)
+    for indicator in IDS:
+        pd.testing.assert_series_equal(store.get_series(indicator), fake_series(indicator))
+    assert list(store.get_series('SP.POP.TOTL', mrv=5).index.get_level_values('Year').unique()) == ['2020', '2019', '2018', '2017', '2016']
+    entry = store.entry('SP.POP.TOTL', mrv=5)
+    np.testing.assert_array_equal(entry.changes, changes.pct_grid(entry.values)) # As if downloaded with mrv=5
+
+
+def test_wb_every_bulk(tmp_path, offline, sample_data):
+    result = wbc.wb_every(sample_data, 3, k=3, change=True, t_lim=0.1, bulk=write_bulk(tmp_path))
+    assert len(result) == 3
+    for name, row in result.iterrows():
+        indicator = name.replace('Name of ', '')
+        merged = pd.merge(sample_data, fake_series(indicator).reset_index(), on=['Country', 'Year'])
+        assert abs(row['Correlation'] - merged.iloc[:, 3].corr(merged.iloc[:, -1])) < 1e-12
+
+
+def test_bulk_scans_stay_offline(tmp_path, offline, sample_data, monkeypatch):
+    from World_Bank_Correlations.fetch import Fetcher
+    path = write_bulk(tmp_path)
+    expected = wbc.wb_every(sample_data, 3, k=3, bulk=path, countries='all', years='all')
+    monkeypatch.setattr(Fetcher, 'get', lambda *args, **params: pytest.fail('The bulk file was not enough'))
+    pd.testing.assert_frame_equal(wbc.wb_every(sample_data, 3, k=3, bulk=path), expected) # The countries of the data need no codes
+    pd.testing.assert_frame_equal(wbc.wb_every(sample_data, 3, k=3, bulk=path, executor='process'), expected)
+    assert not offline.requests # Not even from the workers
+
+
+def test_checkpoints_belong_to_their_panel(tmp_path, offline, sample_data):
+    paths = []
+    for name in ['first', 'second']:
+        (tmp_path / name).mkdir()
+        paths.append(write_bulk(tmp_path / name))
+    resume = str(tmp_path / 'scan.json')
+    first = wbc.wb_every(sample_data, 3, k=3, bulk=paths[0], resume=resume)
+    pd.testing.assert_frame_equal(wbc.wb_every(sample_data, 3, k=3, bulk=paths[0], resume=resume), first)
+    with pytest.raises(AssertionError):
+        wbc.wb_every(sample_data, 3, k=3, bulk=paths[1], resume=resume) # The same indicators, from another file
+    os.utime(paths[0], (time.time() + 10, time.time() + 10)) # A newer download, so the panel is built again
+    with pytest.raises(AssertionError):
+        wbc.wb_every(sample_data, 3, k=3, bulk=paths[0], resume=resume)
@@ -0,0 +1,86 @@
+import time
+
+import pandas as pd
+import pytest
+
+from World_Bank_Correlations import catalog as ct, search
+from World_Bank_Correlations import store as st
+from World_Bank_Correlations import World_Bank_Correlations as wbc
+from World_Bank_Correlations.fetch import Fetcher
+from conftest import INDICATORS, TOPIC_INDICATORS
+
+
+def test_catalog_pages_and_persists(tmp_path, wb_stub, monkeypatch):
+    monkeypatch.setattr(ct, 'PER_PAGE', 4)
+    catalog = ct.Catalog(str(tmp_path / 'catalog.json'), fetcher=Fetcher(wb_stub.url))
+    assert catalog.ids() == INDICATORS # Three pages of four
+    assert 'EC.4' in catalog and 'NOT.AN.ID' not in catalog
+    assert catalog.indicators['AID.2']['topics'] == [2]
+    assert catalog.topic('Aid Effectiveness') == [('AID.1', 'Name of AID.1'), ('AID.2', 'Name of AID.2')]
+    assert catalog.topic(2) == catalog.topic('Aid Effectiveness')
+    assert len(wb_stub.requests) == 4
+    reopened = ct.Catalog(str(tmp_path / 'catalog.json'), fetcher=Fetcher(wb_stub.url))
+    assert reopened.name('AG.1') == 'Name of AG.1'
+    assert reopened.topic(2) == catalog.topic(2)
+    assert len(wb_stub.requests) == 4 # Served from the file
+    with pytest.raises(AssertionError):
+        catalog.topic('Not a topic')
+
+
+def test_catalog_refresh(tmp_path, wb_stub):
+    path = str(tmp_path / 'catalog.json')
+    ct.Catalog(path, fetcher=Fetcher(wb_stub.url)).ids()
+    catalog = ct.Catalog(path, max_age=0.05, fetcher=Fetcher(wb_stub.url))
+    time.sleep(0.1)
+    assert catalog.ids() == INDICATORS
+    assert len(wb_stub.requests) == 2 # Out of date, so downloaded again
+    stale = ct.Catalog(path, max_age=0.05, fetcher=Fetcher('http://127.0.0.1:9/v2', retries=0, timeout=1))
+    time.sleep(0.1)
+    assert stale.ids() == INDICATORS # The refresh failed, so the older copy is used
+
+
+def test_functions_use_catalog(offline, wb_stub, sample_data):
+    table = wbc.wb_corr(sample_data, 3, ['AG.1', 'AG.2', 'EC.1'])
+    assert len(table) == 3
+    assert len([r for r in wb_stub.requests if r.startswith('/v2/indicator')]) == 1 # One listing for the three checks
+    with pytest.raises(AssertionError):
+        wbc.wb_corr(sample_data, 3, 'NOT.AN.ID')
+    top = wbc.wb_topic_corrs(sample_data, 3, 'Economy & Growth', k=10)
+    assert sorted(top.index) == ['Name of ' + i for i in TOPIC_INDICATORS[3]]
+    assert len(wbc.wb_every(sample_data, 3, k=20)) == len(INDICATORS)
+
+
+def test_search_is_local(tmp_path, offline, wb_stub, sample_data, monkeypatch):
+    path = str(tmp_path / 'catalog.json')
+    catalog = ct.Catalog(path, fetcher=Fetcher(wb_stub.url))
+    assert [i for i, name in catalog.search('notes')] == INDICATORS
+    assert [i for i, name in catalog.search('ame of ec')] == TOPIC_INDICATORS[3] # A phrase, anywhere in a text, as wb.search_indicators
+    assert [i for i, name in catalog.search('AGRICULTURE & rural')] == TOPIC_INDICATORS[1] # In the topics
+    assert [i for i, name in catalog.search('development indicators')] == INDICATORS # In the name of the source
+    assert [i for i, name in catalog.search('AID 1')] == [] # Not a phrase of any text
+    assert [i for i, name in catalog.search('EC\\.[12]$')] == ['EC.1', 'EC.2'] # A regular expression
+    assert catalog.search('nothing') == []
+    assert catalog.search('+ec*') == [(i, 'Name of ' + i) for i in TOPIC_INDICATORS[3]] # Words, with prefixes, with the names
+    assert [i for i, name in catalog.search('+"of ec 2"')] == ['EC.2'] # Phrases, across punctuation
+    assert [i for i, name in catalog.search('+"2 ec"')] == []
+    assert [i for i, name in catalog.search('+AID 1')] == [i for i, name in catalog.search('+aid +1')] == ['AID.1'] # Anywhere, in any order
+
+    monkeypatch.setattr(search.SearchIndex, '_build', lambda *args: pytest.fail('The index is read from its file'))
+    del wb_stub.requests[:]
+    table = wbc.wb_corrs_search(sample_data, 3, '+ag*', k=5)
+    assert sorted(table.index) == ['Name of ' + i for i in TOPIC_INDICATORS[1]]
+    assert all('/indicator/AG.' in r for r in wb_stub.requests if '/indicator' in r) # Only the data of the matches
+
+
+def test_topic_corrs_over_several_topics(offline, wb_stub, sample_data, monkeypatch):
+    monkeypatch.setitem(TOPIC_INDICATORS, 4, ['AG.1', 'EC.1']) # Education shares an indicator with each of two other topics
+    store = st.MemorySeriesStore(fetch=Fetcher(wb_stub.url))
+    out = wbc.wb_topic_corrs(sample_data, 3, [3, 'Education', 'Economy & Growth'], k=10, change=True, store=store)
+    assert out.index.names == ['Topic', 'Indicator']
+    assert list(out.index.get_level_values('Topic').unique()) == ['All topics', 'Economy & Growth', 'Education']
+    assert sorted(out.loc['All topics'].index) == sorted('Name of ' + i for i in ['AG.1', 'EC.1', 'EC.2', 'EC.3', 'EC.4'])
+    for indicator in ['AG.1', 'EC.1', 'EC.2']:
+        assert len([r for r in wb_stub.requests if '/indicator/' + indicator + '?' in r]) == 1 # Downloaded once
+    pd.testing.assert_frame_equal(out.loc['Education'], wbc.wb_topic_corrs(sample_data, 3, 'Education', k=10, change=True, store=store))
+    everything = wbc.wb_topic_corrs(sample_data, 3, 'all', k=2, store=store)
+    assert len(everything.loc['All topics']) == 2 and len(everything.loc['Aid Effectiveness']) == 2
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from World_Bank_Correlations import changes
+from conftest import fake_series
+
+
+def loop_pct_change(frame, col):
+    out = pd.DataFrame()
+    for country in frame['Country'].unique():
+        s = frame[frame['Country'] == country].copy()
+        s.loc[:, 'lag'] = s.iloc[:, col].shift(-1)
+        s.loc[:, 'pct'] = (((s.iloc[:, col] - s['lag']) / s['lag']) * 100)
+        out = pd.concat([out, s])
+    return out
+
+
+def test_pct_chg_dat_matches_country_loop(sample_data):
+    shuffled = sample_data.sample(frac=1, random_state=0) # Countries interleaved, as user data often is
+    expected = loop_pct_change(shuffled, 3)
+    result = changes.pct_chg_dat(shuffled, 3)
+    assert list(result.index) == list(expected.index)
+    pd.testing.assert_series_equal(result['pct_chg_dat'], expected['pct'], check_names=False)
+
+
+def test_pct_chg_ind_accepts_series():
+    series = fake_series('SP.POP.TOTL')
+    expected = loop_pct_change(series.reset_index(), 3)
+    for thing in [series, pd.DataFrame(series), series.reset_index()]:
+        result = changes.pct_chg_ind(thing)
+        pd.testing.assert_series_equal(result['pct_chg_ind'], expected['pct'], check_names=False)
+        pd.testing.assert_series_equal(result['lag_ind'], expected['lag'], check_names=False)
@@ -0,0 +1,149 @@
+import json
+
+import pandas as pd
+import pytest
+
+from World_Bank_Correlations import store as st
+from World_Bank_Correlations import World_Bank_Correlations as wbc
+from World_Bank_Correlations.fetch import Fetcher
+from conftest import INDICATORS, TOPIC_INDICATORS, fake_series
+
+
+def test_iter_wb_every_streams(offline, wb_stub, sample_data):
+    scan = wbc.iter_wb_every(sample_data, 3, k=3, change=True)
+    row, top = next(scan)
+    assert row['id'] == INDICATORS[0] and top.seen == 1
+    assert len(top.table()) == 1 # A partial answer before the scan is over
+    ids = [row['id'] for row, top in scan]
+    assert ids == INDICATORS[1:]
+    pd.testing.assert_frame_equal(top.table(), wbc.wb_every(sample_data, 3, k=3, change=True))
+
+
+def test_resume(tmp_path, offline, wb_stub, sample_data):
+    path = str(tmp_path / 'scan.json')
+    scan = wbc.iter_wb_every(sample_data, 3, k=3, change=True, resume=path)
+    for i, (row, top) in enumerate(scan):
+        if i == 4:
+            break
+    scan.close() # Stopped early: the finished indicators are in the checkpoint
+    st.set_store(st.MemorySeriesStore(fetch=Fetcher(wb_stub.url)))
+    del wb_stub.requests[:]
+    resumed = wbc.wb_every(sample_data, 3, k=3, change=True, resume=path)
+    assert sorted(r.split('/')[-1].split('?')[0] for r in wb_stub.requests) == sorted(INDICATORS[5:])
+    pd.testing.assert_frame_equal(resumed, wbc.wb_every(sample_data, 3, k=3, change=True))
+    with pytest.raises(AssertionError):
+        wbc.wb_every(sample_data, 3, change=False, resume=path)
+
+    data = sample_data.assign(other=fake_series('OTHER').to_numpy())
+    path = str(tmp_path / 'columns.json')
+    st.set_store(st.MemorySeriesStore(fetch=Fetcher(wb_stub.url)))
+    scan = wbc.iter_wb_every(data, None, k=3, cols=[3, 4], resume=path)
+    for i, (row, top) in enumerate(scan):
+        if i == 4: # The first of the two rows of the third indicator
+            break
+    scan.close()
+    with open(path) as f:
+        assert [row['id'] for row in json.load(f)['rows']] == [INDICATORS[0]] * 2 + [INDICATORS[1]] * 2 # Only finished indicators
+    st.set_store(st.MemorySeriesStore(fetch=Fetcher(wb_stub.url)))
+    del wb_stub.requests[:]
+    resumed = wbc.wb_every(data, None, k=3, cols=[3, 4], resume=path)
+    assert sorted(r.split('/')[-1].split('?')[0] for r in wb_stub.requests) == sorted(INDICATORS[2:])
+    pd.testing.assert_frame_equal(resumed, wbc.wb_every(data, None, k=3, cols=[3, 4]))
+
+    path = str(tmp_path / 'topic.json')
+    wb_stub.missing.add('EC.2')
+    st.set_store(st.MemorySeriesStore(fetch=Fetcher(wb_stub.url)))
+    first = wbc.wb_topic_corrs(sample_data, 3, 3, k=10, change=True, resume=path)
+    assert len(first) == 3
+    wb_stub.missing.clear()
+    st.set_store(st.MemorySeriesStore(fetch=Fetcher(wb_stub.url)))
+    del wb_stub.requests[:]
+    second = wbc.wb_topic_corrs(sample_data, 3, 3, k=10, change=True, resume=path)
+    assert [r.split('/')[-1].split('?')[0] for r in wb_stub.requests] == ['EC.2'] # Only the indicator that failed
+    pd.testing.assert_frame_equal(second, wbc.wb_topic_corrs(sample_data, 3, 3, k=10, change=True))
+
+
+def test_several_columns(offline, wb_stub, sample_data):
+    data = sample_data.assign(other=fake_series('OTHER').to_numpy())
+    both = wbc.wb_topic_corrs(data, None, 3, k=2, change=True, cols='numeric')
+    assert both.index.names == ['Variable', 'Indicator']
+    assert len([r for r in wb_stub.requests if '/country/' in r]) == len(TOPIC_INDICATORS[3]) # Each indicator downloaded once
+    for col in [3, 4]:
+        single = wbc.wb_topic_corrs(data, col, 3, k=2, change=True)
+        pd.testing.assert_frame_equal(both.loc[data.columns[col]], single, check_exact=False, atol=1e-10)
+    every = wbc.wb_every(data, None, k=2, cols=[3, 4])
+    pd.testing.assert_frame_equal(every.loc['other'], wbc.wb_every(data, 4, k=2), check_exact=False, atol=1e-10)
+    table = wbc.wb_corr(data, None, ['AG.1', 'EC.1'], cols=[3, 4])
+    assert len(table) == 4
+
+
+def test_process_executor(tmp_path, offline, sample_data, monkeypatch):
+    from World_Bank_Correlations import parallel
+    from test_bulk import write_bulk
+    monkeypatch.setattr(parallel, 'CHUNK', 2) # Several shards for the five indicators of the bulk file
+    data = sample_data.assign(other=fake_series('OTHER').to_numpy())
+    path = write_bulk(tmp_path)
+    for kwargs in [dict(col=3, change=True, t_lim=0.1), dict(col=None, cols=[3, 4], k=2)]:
+        expected = wbc.wb_every(data, bulk=path, **kwargs)
+        pd.testing.assert_frame_equal(wbc.wb_every(data, bulk=path, executor='process', **kwargs), expected)
+    resume = str(tmp_path / 'scan.json')
+    first = wbc.wb_every(data, 3, k=3, change=True, bulk=path, executor='process', resume=resume)
+    pd.testing.assert_frame_equal(first, wbc.wb_every(data, 3, k=3, change=True, bulk=path))
+    pd.testing.assert_frame_equal(wbc.wb_every(data, 3, k=3, change=True, bulk=path, resume=resume), first)
+    pd.testing.assert_frame_equal(wbc.wb_every(data, 3, k=3, change=True, nlim=100, bulk=path, executor='process', prescreen='coverage'),
+                                  wbc.wb_every(data, 3, k=3, change=True, nlim=100, bulk=path))
+    pd.testing.assert_frame_equal(wbc.wb_every(data, 3, k=3, bulk=path, executor='process', method='kendall'),
+                                  wbc.wb_every(data, 3, k=3, bulk=path, method='kendall'))
+
+
+def test_prescreen(tmp_path, offline, wb_stub, sample_data):
+    st.set_store(st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=Fetcher(wb_stub.url)))
+    exact = [row for row, top in wbc.iter_wb_every(sample_data, 3, k=3, change=True)] # Stores every indicator
+    nlim = sorted(row['n_change'] for row in exact)[len(exact) // 2]
+    expected = wbc.wb_every(sample_data, 3, k=3, change=True, nlim=nlim)
+    del wb_stub.requests[:]
+    screened = wbc.wb_every(sample_data, 3, k=3, change=True, nlim=nlim, prescreen='coverage', stats=True)
+    assert screened.attrs['stats'].counters['screened_out'] == sum(row['n_change'] <= nlim for row in exact)
+    assert screened.attrs['stats'].counters['cache_hits'] == sum(row['n_change'] > nlim for row in exact) # The others are not read
+    assert not wb_stub.requests
+    screened.attrs.clear()
+    pd.testing.assert_frame_equal(screened, expected)
+    ids = [row['id'] for row, top in wbc.iter_wb_every(sample_data, 3, k=3, change=True, nlim=nlim, prescreen='coverage')]
+    assert ids == [row['id'] for row in exact if row['n_change'] > nlim]
+
+    sampled = wbc.wb_every(sample_data, 3, k=3, nlim=nlim, prescreen='sample', stats=True)
+    assert len(sampled) <= 3 and sampled.attrs['stats'].counters['sampled_out'] == 0 # 20*k survivors are more than there are indicators
+    sampled.attrs.clear()
+    pd.testing.assert_frame_equal(sampled, wbc.wb_every(sample_data, 3, k=3, nlim=nlim))
+    with pytest.raises(AssertionError):
+        wbc.wb_every(sample_data, 3, prescreen='approximate')
+
+
+def test_lags_and_rolling_windows(offline, wb_stub, sample_data):
+    data = sample_data[sample_data['Year'] > '2000']
+    top = wbc.wb_every(data, 3, k=3, change=True, t_lim=0.1, lags=2)
+    assert list(top.columns) == ['Correlation', 'n', 't', 'Lag', 'Correlation_change', 'n_change', 't_change', 'Lag_change']
+    assert top['Lag'].between(-2, 2).all()
+    scope = wbc._scope(data, None, None, [-2, -1, 0, 1, 2])
+    assert (scope.start, scope.end) == (1998, 2022) # The years the lags read, and the one before for the changes
+    pd.testing.assert_frame_equal(wbc.wb_topic_corrs(data, 3, 'all', k=3, change=True, t_lim=0.1, lags=2).loc['All topics'], top)
+    pd.testing.assert_frame_equal(top, wbc.wb_every(data, 3, k=3, change=True, t_lim=0.1, lags=[-2, -1, 0, 1, 2], prescreen='coverage'))
+    with pytest.raises(AssertionError):
+        wbc.wb_every(data, 3, lags=[0.5])
+
+    rolling = wbc.wb_rolling_corrs(data, 3, TOPIC_INDICATORS[1], window=10, change=True)
+    assert list(rolling.index.get_level_values('Indicator').unique()) == ['Name of ' + indicator for indicator in TOPIC_INDICATORS[1]]
+    assert list(rolling.loc['Name of AG.1'].index) == [str(year) for year in range(2010, 2021)]
+    assert list(rolling.columns) == ['Correlation', 'n', 'Correlation_change', 'n_change']
+
+
+def test_methods(offline, wb_stub, sample_data):
+    pearson = wbc.wb_every(sample_data, 3, k=100, change=True, t_lim=0.1)
+    for method in ['spearman', 'kendall', 'winsorized']:
+        top = wbc.wb_every(sample_data, 3, k=5, change=True, t_lim=0.1, method=method)
+        assert list(top.columns) == list(pearson.columns) and top['Correlation_change'].abs().is_monotonic_decreasing
+        assert (top['t_change'].abs() > 0.1).all() and not top['Correlation'].equals(pearson['Correlation'].reindex(top.index))
+        pd.testing.assert_frame_equal(wbc.wb_topic_corrs(sample_data, 3, 'all', k=5, change=True, t_lim=0.1, method=method).loc['All topics'], top)
+        pd.testing.assert_frame_equal(top, wbc.wb_every(sample_data, 3, k=5, change=True, t_lim=0.1, method=method, prescreen='sample'))
+    with pytest.raises(AssertionError):
+        wbc.wb_every(sample_data, 3, method='biweight')
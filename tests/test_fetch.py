@@ -0,0 +1,51 @@
+import time
+
+import pandas as pd
+import pytest
+import world_bank_data as wb
+
+from World_Bank_Correlations import fetch, store as st
+from conftest import fake_series
+
+
+def test_fetcher_matches_world_bank_data(wb_stub, monkeypatch):
+    fetcher = fetch.Fetcher(wb_stub.url, rate=None)
+    series = fetcher.get_series('SP.POP.TOTL', mrv=20)
+    pd.testing.assert_series_equal(series, fake_series('SP.POP.TOTL', years=series.index.levels[2][::-1].tolist()))
+    monkeypatch.setattr('world_bank_data.request.WORLD_BANK_URL', wb_stub.url)
+    pd.testing.assert_series_equal(series, wb.get_series('SP.POP.TOTL', mrv=20).astype('float64'))
+
+
+def test_fetcher_retries_with_backoff(wb_stub):
+    wb_stub.failures['SP.POP.TOTL'] = 2
+    fetcher = fetch.Fetcher(wb_stub.url, rate=None, retries=2, backoff=0.01)
+    assert len(fetcher.get_series('SP.POP.TOTL')) == 240
+    assert len(wb_stub.requests) == 3
+    wb_stub.failures['NY.GDP.MKTP.CD'] = 3
+    with pytest.raises(Exception):
+        fetcher.get_series('NY.GDP.MKTP.CD')
+    wb_stub.missing.add('GONE')
+    with pytest.raises(ValueError):
+        fetcher.get_series('GONE')
+
+
+def test_rate_limiter():
+    limiter = fetch.RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(11):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.19
+
+
+def test_iter_series_keeps_order_and_skips_missing(wb_stub, tmp_path):
+    wb_stub.missing.add('GONE')
+    wb_stub.failures['B'] = 1
+    store = st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=fetch.Fetcher(wb_stub.url, rate=None, backoff=0.01))
+    ids = ['A', 'GONE', 'B', 'C', 'D', 'E', 'F']
+    read = list(fetch.iter_series(store, ids, max_workers=4))
+    assert [indicator for indicator, _ in read] == ['A', 'B', 'C', 'D', 'E', 'F']
+    for indicator, series in read:
+        pd.testing.assert_series_equal(series, fake_series(indicator))
+    requests = len(wb_stub.requests)
+    assert [indicator for indicator, _ in fetch.iter_series(store, ids, max_workers=4)] == ['A', 'B', 'C', 'D', 'E', 'F']
+    assert len(wb_stub.requests) == requests + 1 # Only the missing indicator is asked for again
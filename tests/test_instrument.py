@@ -0,0 +1,61 @@
+import pandas as pd
+
+from World_Bank_Correlations import instrument, results
+from World_Bank_Correlations import World_Bank_Correlations as wbc
+from conftest import INDICATORS, TOPIC_INDICATORS
+
+
+def test_collect(offline, wb_stub, sample_data):
+    results.set_cache(results.ResultCache(0)) # So that the warm call reads every indicator from the store
+    seen = []
+    wb_stub.failures['EC.1'] = 1
+    with instrument.collect(callback=lambda name, value: seen.append(name)) as stats:
+        cold = wbc.wb_topic_corrs(sample_data, 3, 3, k=3, change=True)
+    assert stats.counters['cache_misses'] == 4 and stats.counters['cache_hits'] == 0
+    assert stats.counters['requests'] == len(wb_stub.requests) and stats.counters['retries'] == 1 # EC.1 is asked for twice
+    assert stats.counters['bytes'] > 0
+    assert sum(stats.latencies.values()) == 4
+    assert {'catalog', 'prepare', 'fetch', 'http', 'merge', 'change', 'correlation', 'sort', 'total'} <= set(stats.stages)
+    assert {'requests', 'cache_misses', 'latency', 'fetch'} <= set(seen)
+
+    warm = wbc.wb_topic_corrs(sample_data, 3, 3, k=3, change=True, stats=True)
+    pd.testing.assert_frame_equal(warm, cold)
+    assert warm.attrs['stats'].hit_rate == 1
+    assert warm.attrs['stats'].counters['requests'] == 0
+    assert instrument.current() is None
+
+
+def test_process_stats(offline, wb_stub, sample_data):
+    stats = wbc.wb_every(sample_data, 3, k=3, executor='process', stats=True).attrs['stats']
+    assert stats.counters['cache_misses'] == len(INDICATORS) # Counted in the workers
+    assert stats.stages['correlation'][1] > 0
+
+
+def test_overlapping_threads():
+    import threading
+    entered, first_done = threading.Barrier(2), threading.Event()
+    found = {}
+
+    def scan(name, first):
+        with instrument.collect() as stats:
+            entered.wait()
+            instrument.current().count(name)
+            with instrument.timer(name):
+                pass
+            if not first:
+                first_done.wait() # So the first to enter leaves first
+        if first:
+            first_done.set()
+        found[name] = (stats, instrument.current())
+
+    threads = [threading.Thread(target=scan, args=(name, name == 'a')) for name in 'ab']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for name, other in [('a', 'b'), ('b', 'a')]:
+        stats, after = found[name]
+        assert stats.counters[name] == 1 and other not in stats.counters
+        assert set(stats.stages) == {name, 'total'}
+        assert after is None
+    assert instrument.current() is None
@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from World_Bank_Correlations import kernel, changes, store as st
+from conftest import fake_series, YEARS
+
+
+def test_pearson_matches_pandas():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=200)
+    x[rng.random(200) < 0.1] = np.nan
+    Y = rng.normal(size=(200, 6)) + x[:, None] * np.arange(6)
+    Y[rng.random(Y.shape) < 0.3] = np.nan
+    Y[:, 4] = 3.0 # No variation
+    Y[1:, 5] = np.nan # A single observation
+    r, n = kernel.pearson(x, Y)
+    for j in range(6):
+        expected = pd.Series(x).corr(pd.Series(Y[:, j]))
+        assert n[j] == (~np.isnan(x) & ~np.isnan(Y[:, j])).sum()
+        assert (np.isnan(r[j]) and np.isnan(expected)) or r[j] == pytest.approx(expected, abs=1e-12)
+    assert np.isnan(kernel.t_stat(np.array([1.0]), np.array([10])))[0]
+
+
+def test_keys_gather_matches_merge():
+    keys = kernel.Keys(['Chile', 'Peru', None, 'Chile', 'Ghana'], ['2001', '2000', '2000', '1999', '2000'])
+    countries, years = st.layout(['Chile', 'India', 'Ghana']), st.layout(['2001', '2000'])
+    values = np.arange(6, dtype='float64').reshape(3, 2)
+    assert st.layout('["Chile", "India", "Ghana"]') is countries # Equal layouts are the same object
+    Y = keys.gather([(countries, years, values), (countries, years, values[:, ::-1])])
+    np.testing.assert_array_equal(Y[:, 0], [0, np.nan, np.nan, np.nan, 5])
+    np.testing.assert_array_equal(Y[:, 1], [1, np.nan, np.nan, np.nan, 4])
+
+
+def test_corr_table_matches_merges(sample_data):
+    data = sample_data.sample(frac=1, random_state=1)
+    series = [fake_series('A'), fake_series('B', years=YEARS[:12]), fake_series('C', countries=['Chile', 'Peru', 'India'])]
+    table = kernel.corr_table(data, 3, [st.entry_from_series(s) for s in series], change=True, chunk=2)
+    assert list(table['id']) == ['A', 'B', 'C']
+    mumbo = changes.pct_chg_dat(data, 3)
+    for i, thing in enumerate(series):
+        merged = pd.merge(data, thing.reset_index(), how='inner', on=['Country', 'Year'])
+        merged_pct = pd.merge(mumbo, changes.pct_chg_ind(thing), how='left', on=['Country', 'Year'])
+        assert table.loc[i, 'Correlation'] == pytest.approx(merged.iloc[:, 3].corr(merged.iloc[:, -1]), abs=1e-12)
+        assert table.loc[i, 'n'] == merged.iloc[:, [3, -1]].notnull().all(axis=1).sum()
+        assert table.loc[i, 'Correlation_change'] == pytest.approx(merged_pct['pct_chg_dat'].corr(merged_pct['pct_chg_ind']), abs=1e-12)
+        assert table.loc[i, 'n_change'] == merged_pct[['pct_chg_dat', 'pct_chg_ind']].notnull().all(axis=1).sum()
+
+
+@pytest.mark.parametrize('change,nlim,cor_lim,t_lim', [(False, 1, 0, 0), (True, 150, 0.05, 0.5), (False, 1, 0.99, 0)])
+def test_top_k_matches_full_sort(sample_data, change, nlim, cor_lim, t_lim):
+    from World_Bank_Correlations.World_Bank_Correlations import _top
+    entries = [st.entry_from_series(fake_series('IND.%d' % i)) for i in range(40)]
+    top = kernel.TopK(4, change, nlim, cor_lim, t_lim)
+    for row in kernel.iter_stats(sample_data, 3, entries, change, chunk=7):
+        top.push(row)
+    assert top.seen == 40
+    expected = _top(kernel.corr_table(sample_data, 3, entries, change), 4, change, nlim, cor_lim, t_lim)
+    pd.testing.assert_frame_equal(top.table(), expected, check_index_type=False)
+
+
+def test_pearson_matrix_matches_pearson():
+    rng = np.random.default_rng(1)
+    X = rng.normal(1000, 5, size=(300, 3))
+    X[rng.random(X.shape) < 0.2] = np.nan
+    Y = rng.normal(size=(300, 5)) + X[:, [0]] * np.arange(5)
+    Y[rng.random(Y.shape) < 0.3] = np.nan
+    Y[:, 4] = 7.0 # No variation
+    r, n = kernel.pearson_matrix(X, Y)
+    for i in range(3):
+        expected_r, expected_n = kernel.pearson(X[:, i], Y)
+        np.testing.assert_allclose(r[i], expected_r, atol=1e-10)
+        np.testing.assert_array_equal(n[i], expected_n)
+
+
+def test_corr_table_several_columns(sample_data):
+    data = sample_data.assign(other=fake_series('OTHER').to_numpy(), third=fake_series('THIRD').to_numpy())
+    entries = [st.entry_from_series(fake_series(i)) for i in ['A', 'B', 'C']]
+    table = kernel.corr_table(data, [3, 4, 5], entries, change=True, chunk=2)
+    assert list(table['Variable'].unique()) == ['USER.DATA', 'other', 'third']
+    for col in [3, 4, 5]:
+        single = kernel.corr_table(data, col, entries, change=True)
+        rows = table[table['Variable'] == data.columns[col]].drop(columns='Variable').reset_index(drop=True)
+        pd.testing.assert_frame_equal(rows, single, check_exact=False, atol=1e-10)
+
+
+@pytest.mark.parametrize('col', [3, [3, 4]])
+def test_low_memory_matches_default(sample_data, col):
+    data = sample_data.assign(Other=sample_data['USER.DATA'] ** 2)
+    entries = [st.entry_from_series(fake_series(indicator)) for indicator in ['A', 'B', 'C', 'D', 'E']]
+    default = list(kernel.iter_stats(data, col, entries, change=True, chunk=2))
+    low = list(kernel.iter_stats(data, col, entries, change=True, chunk=2, low_memory=True))
+    assert len(low) == len(default)
+    for row, expected in zip(low, default):
+        assert row['n'] == expected['n'] and row['n_change'] == expected['n_change']
+        assert row['Correlation'] == pytest.approx(expected['Correlation'], abs=1e-5)
+        assert row['Correlation_change'] == pytest.approx(expected['Correlation_change'], abs=1e-5)
+
+    keys = kernel.Keys(data['Country'], data['Year'], low_memory=True)
+    assert keys.year_codes.dtype == np.int16 and keys.country_codes.itemsize <= 2
+    grids = [(e.countries, e.years, e.values) for e in entries]
+    first = keys.gather(grids[:2])
+    assert first.dtype == np.float32 and np.shares_memory(first, keys.gather(grids[2:4])) # The same matrix for every chunk
+
+
+@pytest.mark.parametrize('col', [3, [3, 4]])
+def test_overlap_matches_stats(sample_data, col):
+    data = sample_data.assign(Other=sample_data['USER.DATA'].where(sample_data['Year'] > '2000'))
+    entries = [st.with_changes(st.entry_from_series(fake_series(indicator, years=YEARS[:mrv]))) for indicator, mrv in [('A', 30), ('B', 12), ('C', 30)]]
+    coverages = [st.Coverage(e.countries, e.years, st.coverage_bits(e)) for e in entries]
+    for change in (False, True):
+        prepared = kernel.Prepared(data, col, change)
+        stats = prepared.stats(entries)
+        np.testing.assert_array_equal(prepared.overlap(coverages), stats['n_change' if change else 'n'])
+        nlim = int(np.median(stats['n_change' if change else 'n']))
+        assert kernel.screen(prepared, coverages + [None], nlim) == (np.atleast_2d(stats['n_change' if change else 'n']) > nlim).any(axis=0).tolist() + [True]
+
+
+def test_sampler_keeps_the_strongest_so_far(sample_data):
+    entries = [st.entry_from_series(fake_series(indicator)) for indicator in 'ABCDEFGH']
+    sampler = kernel.Sampler(sample_data, 3, keep=2)
+    assert sorted(sampler.prepared.keys.years) == sorted(YEARS)[::kernel.SAMPLE_STEP]
+    r = np.abs(kernel.Prepared(sample_data[sample_data['Year'].isin(sorted(YEARS)[::kernel.SAMPLE_STEP])], 3).stats(entries)['Correlation'])
+    expected = [e.indicator for j, e in enumerate(entries) if j < 2 or r[j] >= sorted(r[:j])[-2]]
+    assert [e.indicator for e in sampler.filter(entries, chunk=3)] == expected
+    assert len(expected) < len(entries)
+
+
+def test_lags_match_shifted_merges(sample_data):
+    entries = [st.entry_from_series(fake_series(indicator)) for indicator in ['A', 'B', 'C']]
+    stats = kernel.Prepared(sample_data, 3, change=True, lags=[-2, 0, 1]).stats(entries)
+    for j, entry in enumerate(entries):
+        best = {}
+        for lag in (-2, 0, 1):
+            shifted = fake_series(entry.indicator).reset_index()
+            shifted['Year'] = (shifted['Year'].astype(int) + lag).astype(str) # The indicator lag years before the year of the row
+            both = sample_data.merge(shifted, on=['Country', 'Year']).dropna(subset=['USER.DATA', entry.indicator])
+            r = both['USER.DATA'].corr(both[entry.indicator])
+            best[lag] = (abs(kernel.t_stat(np.array(r), np.array(len(both)))), r, len(both))
+        lag = max(best, key=lambda lag: best[lag][0])
+        assert stats['Lag'][j] == lag and stats['n'][j] == best[lag][2]
+        assert stats['Correlation'][j] == pytest.approx(best[lag][1])
+    assert set(stats['Lag_change']) <= {-2, 0, 1}
+    same = kernel.Prepared(sample_data, 3, change=True, lags=[0]).stats(entries)
+    plain = kernel.Prepared(sample_data, 3, change=True).stats(entries)
+    for column in plain:
+        np.testing.assert_array_equal(same[column], plain[column])
+
+
+def test_thin_lags_do_not_win(sample_data):
+    rng = np.random.default_rng(5)
+    x = sample_data['USER.DATA'].to_numpy()
+    strong = sample_data[['Country', 'Series', 'Year']].assign(value=x + rng.normal(0, 10, len(x))) # r of about 0.9 at lag 0
+    user = sample_data.dropna(subset=['USER.DATA']).iloc[:4]
+    for stray, nlim, lag in [(2, 1, 0), (4, 1, -40), (4, 10, 0)]:
+        late = user.iloc[:stray].assign(Year=(user['Year'].iloc[:stray].astype(int) + 40).astype(str), value=2 * user['USER.DATA'].iloc[:stray])
+        series = pd.concat([strong, late[strong.columns]]).set_index(['Country', 'Series', 'Year'])['value'].rename('S') # Only lag -40 reaches the late years
+        stats = kernel.Prepared(sample_data, 3, lags=[-40, 0], nlim=nlim).stats([st.entry_from_series(series)])
+        assert stats['Lag'][0] == lag
+        assert stats['n'][0] == (stray if lag else (~np.isnan(x)).sum())
+
+
+def test_rolling_matches_windows(sample_data):
+    entries = [st.entry_from_series(fake_series(indicator)) for indicator in ['A', 'B']]
+    rolling = kernel.Prepared(sample_data, 3, change=True).rolling(entries, 5)
+    assert list(rolling['Year']) == list(range(1995, 2021))
+    for i in (0, 10, 25):
+        end = rolling['Year'][i]
+        window = sample_data[sample_data['Year'].astype(int).between(end - 4, end)]
+        stats = kernel.Prepared(window, 3).stats(entries)
+        np.testing.assert_allclose(rolling['Correlation'][i], stats['Correlation'])
+        np.testing.assert_array_equal(rolling['n'][i], stats['n'])
+    changes = kernel.Prepared(sample_data, 3, change=True)
+    rows = changes.keys_change.years[changes.keys_change.year_codes].astype(int)
+    last = rows >= 2016
+    full = changes.x_change
+    changes.x_change = np.where(last, full, np.nan) # Only the changes of the last window
+    np.testing.assert_allclose(rolling['Correlation_change'][-1], changes.stats(entries)['Correlation_change'])
+
+
+def _tau_b(a, b):
+    """Kendall's tau-b from every pair of observations"""
+    i, j = np.triu_indices(len(a), 1)
+    da, db = np.sign(a[i] - a[j]), np.sign(b[i] - b[j])
+    return (da * db).sum() / np.sqrt((da != 0).sum() * (db != 0).sum())
+
+
+def test_methods_match_pairwise_definitions():
+    rng = np.random.default_rng(3)
+    x = rng.normal(size=120)
+    x[rng.random(120) < 0.1] = np.nan
+    Y = np.round(rng.normal(size=(120, 5)) + x[:, None] * np.arange(5), 1) # Rounded, for ties
+    Y[rng.random(Y.shape) < 0.3] = np.nan
+    Y[:, 3] = np.exp(3 * Y[:, 3]) # Skewed
+    Y[2:, 4] = np.nan # Two observations
+    for method in kernel.METHODS:
+        r, n = kernel.correlate(x, Y, method)
+        for j in range(5):
+            both = ~np.isnan(x) & ~np.isnan(Y[:, j])
+            a, b = pd.Series(x[both]), pd.Series(Y[both, j])
+            if method == 'winsorized':
+                a = a.clip(*np.quantile(a, [kernel.WINSOR, 1 - kernel.WINSOR]))
+                b = b.clip(*np.quantile(b, [kernel.WINSOR, 1 - kernel.WINSOR]))
+            if method == 'spearman':
+                a, b = a.rank(), b.rank()
+            expected = a.corr(b) if method != 'kendall' else _tau_b(a.values, b.values)
+            assert n[j] == both.sum()
+            assert r[j] == pytest.approx(expected, nan_ok=True)
+    r, n = kernel.correlate(np.column_stack([x, -x]), Y, 'spearman')
+    np.testing.assert_allclose(r[1], -kernel.correlate(x, Y, 'spearman')[0])
@@ -0,0 +1,53 @@
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+
+from World_Bank_Correlations import results, store as st
+from World_Bank_Correlations import World_Bank_Correlations as wbc
+from World_Bank_Correlations.fetch import Fetcher
+from conftest import fake_series
+
+
+def test_scans_with_other_limits_reuse_the_statistics(tmp_path, offline, wb_stub, sample_data):
+    results.set_cache(results.ResultCache())
+    store = st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=Fetcher(wb_stub.url))
+    first = wbc.wb_topic_corrs(sample_data, 3, 3, k=2, change=True, store=store, stats=True)
+    assert first.attrs['stats'].counters['result_misses'] == 1
+    again = wbc.wb_topic_corrs(sample_data, 3, 3, k=4, change=True, nlim=100, t_lim=0.1, store=store, stats=True)
+    assert again.attrs['stats'].counters['result_hits'] == 1 and 'correlation' not in again.attrs['stats'].stages
+    results.set_cache(results.ResultCache(0))
+    pd.testing.assert_frame_equal(again, wbc.wb_topic_corrs(sample_data, 3, 3, k=4, change=True, nlim=100, t_lim=0.1, store=store))
+    results.set_cache(results.ResultCache())
+
+    every = wbc.wb_every(sample_data, 3, k=3, store=store)
+    assert wbc.wb_every(sample_data, 3, k=3, store=store, stats=True).attrs['stats'].counters['result_hits'] == 1
+    assert wbc.wb_every(sample_data, 3, k=1, store=store, stats=True).attrs['stats'].counters['result_misses'] == 1 # Only the table is kept
+    pd.testing.assert_frame_equal(wbc.wb_every(sample_data, 3, k=1, store=store), every.head(1))
+    kept = [value for (store_id, key), (scan_store, since, value) in results.get_cache()._scans.items() if key[0] == 'wb_every']
+    assert [len(table) for table in kept] == [3, 1]
+
+    with sqlite3.connect(store.path) as con: # Downloaded two days ago, and updated since
+        con.execute('UPDATE series SET fetched=fetched-2*24*3600')
+    wb_stub.lastupdated = time.strftime('%Y-%m-%d', time.gmtime(time.time() - 24 * 3600))
+    assert store.refresh()
+    refreshed = wbc.wb_topic_corrs(sample_data, 3, 3, k=4, change=True, nlim=100, t_lim=0.1, store=store, stats=True)
+    assert refreshed.attrs['stats'].counters['result_misses'] == 1 # The indicators were downloaded again
+    pd.testing.assert_frame_equal(refreshed, again)
+
+
+def test_versions_do_not_list_the_store(tmp_path, offline, wb_stub, sample_data, monkeypatch):
+    results.set_cache(results.ResultCache())
+    for store in [st.MemorySeriesStore(fetch=Fetcher(wb_stub.url)), st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=Fetcher(wb_stub.url))]:
+        monkeypatch.setattr(store, 'stored', lambda: pytest.fail('The store is listed'))
+        start = time.time()
+        first = wbc.wb_topic_corrs(sample_data, 3, 3, k=2, store=store)
+        assert store.saved_since(start) == set(['EC.1', 'EC.2', 'EC.3', 'EC.4']) and store.saved_since(time.time()) == set()
+        assert wbc.wb_topic_corrs(sample_data, 3, 3, k=2, store=store, stats=True).attrs['stats'].counters['result_hits'] == 1
+        store.save(st.entry_from_series(fake_series('AG.1')), 50) # Of another topic
+        assert wbc.wb_topic_corrs(sample_data, 3, 3, k=2, store=store, stats=True).attrs['stats'].counters['result_hits'] == 1
+        store.save(st.entry_from_series(fake_series('EC.2')), 50) # Downloaded again
+        again = wbc.wb_topic_corrs(sample_data, 3, 3, k=2, store=store, stats=True)
+        assert again.attrs['stats'].counters['result_misses'] == 1
+        pd.testing.assert_frame_equal(again, first)
@@ -0,0 +1,108 @@
+import time
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from World_Bank_Correlations import changes, checkpoint, store as st
+from World_Bank_Correlations import World_Bank_Correlations as wbc
+from World_Bank_Correlations.fetch import Fetcher
+from conftest import fake_series
+
+
+def test_entry_round_trip():
+    series = fake_series('SP.POP.TOTL')
+    entry = st.entry_from_series(series)
+    assert entry.name == 'Name of SP.POP.TOTL'
+    assert entry.values.shape == (8, 30)
+    pd.testing.assert_series_equal(st.entry_to_series(entry), series)
+
+
+def test_sqlite_store_reads_through(tmp_path, fake_fetch):
+    store = st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=fake_fetch)
+    first = store.get_series('SP.POP.TOTL', mrv=50)
+    assert store.name('SP.POP.TOTL') == 'Name of SP.POP.TOTL'
+    reopened = st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=fake_fetch)
+    pd.testing.assert_series_equal(reopened.get_series('SP.POP.TOTL', mrv=50), first)
+    assert fake_fetch.calls == ['SP.POP.TOTL'] # The name lookup and the second session were both served from disk
+    reopened.get_series('SP.POP.TOTL', mrv=10)
+    assert fake_fetch.calls == ['SP.POP.TOTL', 'SP.POP.TOTL'] # A different mrv is a different entry
+
+
+def test_sqlite_store_ttl(tmp_path, fake_fetch):
+    store = st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=fake_fetch, ttl=0.05)
+    store.entry('SP.POP.TOTL')
+    time.sleep(0.1)
+    store.entry('SP.POP.TOTL')
+    assert fake_fetch.calls == ['SP.POP.TOTL', 'SP.POP.TOTL']
+
+
+def test_stores_evict_least_recently_used(tmp_path, fake_fetch):
+    size = 2 * len(np.zeros((8, 30)).tobytes()) # The values and their percent changes
+    disk = st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=fake_fetch, max_bytes=int(2.5 * size))
+    memory = st.MemorySeriesStore(fetch=fake_fetch, max_entries=2)
+    for store in [disk, memory]:
+        for indicator in ['A', 'B', 'A', 'C']:
+            store.entry(indicator)
+        assert store.load('A', 50) is not None
+        assert store.load('B', 50) is None
+        assert store.load('C', 50) is not None
+
+
+def test_stores_hold_percent_changes(tmp_path, fake_fetch):
+    path = str(tmp_path / 'series.sqlite')
+    expected = changes.pct_chg_ind(fake_series('A')).set_index(['Country', 'Year'])['pct_chg_ind']
+    for store in [st.SQLiteSeriesStore(path, fetch=fake_fetch), st.SQLiteSeriesStore(path, fetch=fake_fetch), st.MemorySeriesStore(fetch=fake_fetch)]:
+        entry = store.entry('A')
+        grid = pd.Series(entry.changes.ravel(), index=pd.MultiIndex.from_product([entry.countries, entry.years]))
+        np.testing.assert_allclose(grid.reindex(expected.index).to_numpy(), expected.to_numpy(), rtol=0, atol=0)
+    assert fake_fetch.calls == ['A', 'A'] # The second SQLite store read the first one's file
+
+    with sqlite3.connect(path) as con: # A file written before the changes were stored
+        con.execute('UPDATE series SET changes=NULL')
+    entry = st.SQLiteSeriesStore(path, fetch=fake_fetch).entry('A')
+    assert entry.changes is not None and len(fake_fetch.calls) == 2
+    with sqlite3.connect(path) as con:
+        assert con.execute('SELECT changes FROM series').fetchone()[0] is not None
+
+
+def test_refresh_downloads_stale_entries(tmp_path, offline, wb_stub, sample_data):
+    store = st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=Fetcher(wb_stub.url))
+    for indicator in ['AG.1', 'AG.2', 'EC.1']:
+        store.entry(indicator)
+    del wb_stub.requests[:]
+    assert store.refresh() == [] # Downloaded after the last update of their source
+    assert not [r for r in wb_stub.requests if '/country/' in r]
+
+    path = str(tmp_path / 'scan.json')
+    first = wbc.wb_topic_corrs(sample_data, 3, 1, k=3, store=store, resume=path)
+    with sqlite3.connect(store.path) as con: # Downloaded two days ago, and updated since
+        con.execute('UPDATE series SET fetched=fetched-2*24*3600')
+    wb_stub.lastupdated = time.strftime('%Y-%m-%d', time.gmtime(time.time() - 24 * 3600))
+    del wb_stub.requests[:]
+    refreshed = store.refresh()
+    assert sorted(refreshed) == ['AG.1', 'AG.2', 'AG.3', 'EC.1'] # Every stored indicator was downloaded before the update
+    assert sorted(r.split('/')[-1].split('?')[0] for r in wb_stub.requests if '/country/' in r) == sorted(refreshed)
+    assert store.refresh() == [] # Up to date again
+    assert checkpoint.invalidate(path, refreshed) == 3 # The indicators of the topic
+    del wb_stub.requests[:]
+    pd.testing.assert_frame_equal(wbc.wb_topic_corrs(sample_data, 3, 1, k=3, store=store, resume=path), first)
+    assert not [r for r in wb_stub.requests if '/country/' in r] # Recomputed from the refreshed store
+
+
+def test_scope_pushes_countries_and_years_down(tmp_path, offline, wb_stub, sample_data):
+    data = sample_data[sample_data['Country'].isin(['Albania', 'Brazil']) & sample_data['Year'].astype(int).between(2000, 2009)]
+    store = st.SQLiteSeriesStore(str(tmp_path / 'series.sqlite'), fetch=Fetcher(wb_stub.url))
+    scoped = wbc.wb_corr(data, 3, ['AG.1', 'AG.2'], True, store=store)
+    downloads = [r for r in wb_stub.requests if '/indicator/AG' in r]
+    assert len(downloads) == 2 and all('/country/ALB;BRA/' in r and 'date=1999' in r and 'mrv' not in r for r in downloads)
+    full = wbc.wb_corr(data, 3, ['AG.1', 'AG.2'], True, store=st.MemorySeriesStore(fetch=Fetcher(wb_stub.url)), countries='all', years='all')
+    pd.testing.assert_frame_equal(scoped, full)
+
+    entry = store.entry('AG.1', scope=st.Scope(['Brazil'], [2005, 2006], ['BRA']))
+    assert entry.countries == ('Brazil',) and entry.years == ('2006', '2005', '2004')
+    assert entry.values.shape == entry.changes.shape == (1, 3)
+    del wb_stub.requests[:]
+    store.entry('AG.1') # The 50 most recent years hold every year of the data, so scans of them need no other download
+    wbc.wb_corr(sample_data, 3, 'AG.1', store=store)
+    assert len([r for r in wb_stub.requests if '/indicator/' in r]) == 1